@@ -9,5 +9,18 @@ class CustomersConfig(AppConfig):
     def ready(self):
         """
         Called when Django starts.
+        Hooks incremental customer stats to Sales events.
         """
-        pass
+        from django.db.models.signals import post_migrate, post_save, post_delete
+        from .models import Customer
+        from .signals import (
+            connect_sales_signals, customer_changed, customer_saved_typeahead,
+            customer_deleted_typeahead, ensure_search_indexes,
+        )
+
+        connect_sales_signals()
+        post_save.connect(customer_changed, sender=Customer, dispatch_uid='customers_customer_saved')
+        post_delete.connect(customer_changed, sender=Customer, dispatch_uid='customers_customer_deleted')
+        post_save.connect(customer_saved_typeahead, sender=Customer, dispatch_uid='customers_typeahead_saved')
+        post_delete.connect(customer_deleted_typeahead, sender=Customer, dispatch_uid='customers_typeahead_deleted')
+        post_migrate.connect(ensure_search_indexes, sender=self)
@@ -0,0 +1,142 @@
+"""
+Async variants of the read-heavy customer views, for hubs served over
+ASGI (enabled with ``CUSTOMERS_ASYNC_VIEWS = True``).
+
+They return the same responses as their counterparts in ``views`` but
+wait on the cache and the database with Django's async APIs instead of
+holding a worker thread for the whole request. Templates are rendered
+in a worker thread, since they may still read related objects lazily.
+"""
+
+import asyncio
+import datetime
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_http_methods
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.utils.translation import gettext as _
+
+from apps.core.htmx import htmx_view
+from .cache import aversioned_key, alast_modified
+from .instrumentation import serializing
+from .models import Customer, CustomerMetrics
+from .pagination import apaginate, InvalidCursor, DEFAULT_ORDER
+from .search import get_search_backend
+from .serializers import list_values, serialize_rows, dumps
+from .stats import aget_dashboard_stats, aget_recent_purchases
+from .views import (
+    FRAGMENT_CACHE_TIMEOUT, LIST_CACHE_TIMEOUT, _etag_for, _filter_metrics, _filter_status, _list_digest,
+    _list_params,
+)
+
+
+def _htmx_page(full_template, partial_template):
+    """
+    Async renderer of a view context through ``htmx_view``.
+    """
+    @htmx_view(full_template, partial_template)
+    def render_context(request, context):
+        return context
+
+    return sync_to_async(render_context)
+
+
+_render_list = _htmx_page('customers/pages/list.html', 'customers/partials/list_content.html')
+_render_detail = _htmx_page('customers/pages/detail.html', 'customers/partials/detail_content.html')
+
+
+@require_http_methods(["GET"])
+async def customer_list(request):
+    """
+    Vista principal de listado de clientes (async).
+    Soporta HTMX para navegación SPA.
+    """
+    return await _render_list(request, {
+        **await aget_dashboard_stats(),
+        'segment_choices': CustomerMetrics.SEGMENT_CHOICES,
+        'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT,
+        'page_title': _('Clientes'),
+    })
+
+
+def _timestamp(modified):
+    if modified is None:
+        return None
+    if not timezone.is_aware(modified):
+        modified = timezone.make_aware(modified, datetime.timezone.utc)
+    return int(modified.timestamp())
+
+
+@require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+async def customer_list_ajax(request):
+    """
+    API: Lista de clientes para AJAX (async).
+    Misma respuesta, caché, ETag / Last-Modified y paginación por cursor
+    que la versión síncrona. Las validaciones condicionales se hacen aquí
+    y no con @condition, cuyas funciones leerían la caché de forma síncrona.
+    """
+    cache_key = await aversioned_key('list', _list_digest(request))
+    etag = quote_etag(_etag_for(cache_key))
+    modified = _timestamp(await alast_modified())
+
+    response = get_conditional_response(request, etag=etag, last_modified=modified)
+    if response is None:
+        response = await _list_response(request, cache_key)
+    if modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(modified)
+    response.headers.setdefault('ETag', etag)
+    return response
+
+
+async def _list_response(request, cache_key):
+    content = await cache.aget(cache_key)
+    if content is not None:
+        return HttpResponse(content, content_type='application/json')
+
+    search, status_filter, segment, churn_risk, cursor, limit = _list_params(request)
+
+    customers = _filter_status(Customer.objects.all(), status_filter)
+    customers = _filter_metrics(customers, segment, churn_risk)
+
+    # Search (backends may probe the database once)
+    order = DEFAULT_ORDER
+    if search:
+        customers, order = await sync_to_async(get_search_backend().search)(customers, search)
+
+    # Order and paginate
+    customers = list_values(customers, extra=[key.lstrip('-') for key in order])
+    try:
+        page, next_cursor = await apaginate(customers, cursor, limit, order)
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': _('Cursor no válido')}, status=400)
+
+    with serializing():
+        content = dumps({'success': True, 'customers': serialize_rows(page), 'next_cursor': next_cursor})
+    await cache.aset(cache_key, content, LIST_CACHE_TIMEOUT)
+    return HttpResponse(content, content_type='application/json')
+
+
+@require_http_methods(["GET"])
+async def customer_detail(request, customer_id):
+    """
+    Vista de detalle de un cliente (async).
+    El cliente y sus compras recientes se piden a la vez.
+    """
+    customer, recent_purchases = await asyncio.gather(
+        aget_object_or_404(Customer.objects.select_related('metrics'), id=customer_id),
+        aget_recent_purchases(customer_id, limit=10),
+    )
+
+    return await _render_detail(request, {
+        'customer': customer,
+        'recent_purchases': recent_purchases,
+        'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT,
+        'page_title': f'{_("Cliente")}: {customer.name}',
+    })
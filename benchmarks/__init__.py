@@ -0,0 +1 @@
+# Customers module benchmarks
@@ -0,0 +1,163 @@
+"""
+Concurrent load on one ASGI worker: the sync views (run in threads by
+Django) vs their async variants, for the list page, list API and detail.
+
+    python -m customers.benchmarks.bench_async --sizes 10000 --concurrency 1 10 50
+    python -m customers.benchmarks.bench_async --db-latency-ms 2
+
+Requests are dispatched in-process the way the ASGI handler does it: on
+an event loop with no outer sync thread, each one in its own
+thread-sensitive context, at most ``--concurrency`` in flight. The list
+API cache is cleared before every request so each one hits the database. ``--db-latency-ms`` adds a sleep to every query to
+stand in for the network round trip of a remote database, where waiting
+on the database rather than CPU dominates.
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+
+from . import common
+
+# Requests per case and concurrency level
+DEFAULT_REQUESTS = 200
+
+
+class _Latency:
+    """
+    Execute wrapper sleeping before every query.
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+
+def add_db_latency(milliseconds):
+    """
+    Delay every query on every connection, including ones opened later.
+    """
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    latency = _Latency(milliseconds / 1000)
+
+    def install(sender, connection, **kwargs):
+        if latency not in connection.execute_wrappers:
+            connection.execute_wrappers.append(latency)
+
+    connection_created.connect(install, weak=False)
+    for connection in connections.all():
+        install(None, connection)
+
+
+def build_cases():
+    """
+    ``{name: (sync view, async view, request factory)}``.
+    """
+    from django.core.cache import cache
+    from django.test import AsyncRequestFactory
+
+    from customers import async_views, views
+    from customers.models import Customer
+
+    rf = AsyncRequestFactory()
+    customer_id = Customer.objects.order_by('pk').values_list('pk', flat=True).first()
+
+    def uncached(path):
+        def make():
+            cache.clear()
+            return rf.get(path), ()
+        return make
+
+    def detail():
+        return rf.get(f'/modules/customers/{customer_id}/'), (customer_id,)
+
+    return {
+        'list': (views.customer_list, async_views.customer_list, uncached('/modules/customers/')),
+        'list_ajax': (views.customer_list_ajax, async_views.customer_list_ajax, uncached('/modules/customers/api/list/')),
+        'detail': (views.customer_detail, async_views.customer_detail, detail),
+    }
+
+
+async def load(view, make_request, requests, concurrency):
+    """
+    Serve ``requests`` requests with at most ``concurrency`` in flight.
+    Returns ``(requests per second, p50 ms, p95 ms, peak threads)``.
+    """
+    from asgiref.sync import ThreadSensitiveContext, iscoroutinefunction, sync_to_async
+
+    if not iscoroutinefunction(view):
+        view = sync_to_async(view)
+    semaphore = asyncio.Semaphore(concurrency)
+    timings = []
+    peak_threads = threading.active_count()
+
+    async def one():
+        nonlocal peak_threads
+        async with semaphore:
+            request, args = make_request()
+            started = time.perf_counter()
+            async with ThreadSensitiveContext():
+                response = await view(request, *args)
+            timings.append((time.perf_counter() - started) * 1000)
+            peak_threads = max(peak_threads, threading.active_count())
+            assert response.status_code == 200, response.status_code
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    p50, p95, _ = common.summarize(timings)
+    return requests / elapsed, p50, p95, peak_threads
+
+
+def run(sizes, concurrency_levels, requests):
+    print(f'{"customers":>10} {"case":>10} {"conc":>5} {"sync req/s":>11} {"async req/s":>12} '
+          f'{"sync p95":>9} {"async p95":>10} {"sync thr":>9} {"async thr":>10}')
+
+    seeded = 0
+    for size in sorted(sizes):
+        common.seed_customers(seeded, size)
+        common.seed_sales(seeded, size)
+        seeded = size
+
+        for name, (sync_view, async_view, make_request) in build_cases().items():
+            for concurrency in concurrency_levels:
+                # Warm up both paths (connections, lazy imports, caches)
+                asyncio.run(load(sync_view, make_request, concurrency, concurrency))
+                asyncio.run(load(async_view, make_request, concurrency, concurrency))
+
+                sync_rate, _, sync_p95, sync_threads = asyncio.run(load(
+                    sync_view, make_request, requests, concurrency
+                ))
+                async_rate, _, async_p95, async_threads = asyncio.run(load(
+                    async_view, make_request, requests, concurrency
+                ))
+                print(f'{size:>10} {name:>10} {concurrency:>5} {sync_rate:>11.0f} {async_rate:>12.0f} '
+                      f'{sync_p95:>9.1f} {async_p95:>10.1f} {sync_threads:>9} {async_threads:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    common.parse_sizes(parser, [10_000])
+    parser.add_argument(
+        '--concurrency', type=int, nargs='+', default=[1, 10, 50],
+        help='Requests in flight (default: %(default)s)'
+    )
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='Requests per case')
+    parser.add_argument('--db-latency-ms', type=float, default=0.0, help='Simulated latency added to every query')
+    args = parser.parse_args()
+
+    common.setup()
+    with common.test_database():
+        if args.db_latency_ms:
+            add_db_latency(args.db_latency_ms)
+        run(args.sizes, args.concurrency, args.requests)
+
+
+if __name__ == '__main__':
+    main()
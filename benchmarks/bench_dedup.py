@@ -0,0 +1,91 @@
+"""
+Duplicate detection: blocking vs comparing every pair.
+
+Seeds synthetic customers plus a share of near-duplicates (reformatted
+phone, accent-less or misspelt name, different email case) and reports
+candidate pairs, detection time and recall of the planted duplicates.
+
+    python -m customers.benchmarks.bench_dedup --sizes 100000 1000000
+"""
+
+import argparse
+import random
+import time
+
+from . import common
+
+
+def plant_duplicates(share, seed=7):
+    """
+    Copy ``share`` of the customers with typical data-entry variations.
+
+    Returns the set of (original id, copy id) pairs.
+    """
+    from customers.models import Customer
+
+    rng = random.Random(seed)
+    originals = list(
+        Customer.objects.filter(is_active=True).order_by('?')
+        .values('id', 'name', 'email', 'phone', 'tax_id')[:int(Customer.objects.count() * share)]
+    )
+
+    copies = []
+    for row in originals:
+        name = row['name'].replace('z', 's') if rng.random() < 0.5 else row['name'].upper()
+        phone = row['phone'].replace('+34 ', '').replace(' ', '-')
+        copies.append(Customer(
+            name=name,
+            email=row['email'].upper() if rng.random() < 0.5 else '',
+            phone=phone,
+            tax_id=row['tax_id'],
+        ))
+    for customer in copies:
+        customer.normalize_fields()
+    Customer.objects.bulk_create(copies, batch_size=5000)
+
+    return {
+        (row['id'], copy.pk) for row, copy in zip(originals, copies)
+    }
+
+
+def run(sizes, share):
+    from customers import dedup
+    from customers.models import Customer
+
+    print(f'{"customers":>10} {"naive pairs":>14} {"candidates":>11} {"found":>7} {"recall":>7} {"seconds":>8}')
+
+    seeded = 0
+    planted = set()
+    for size in sorted(sizes):
+        common.seed_customers(seeded, size)
+        seeded = size
+        planted |= plant_duplicates(share, seed=size)
+        active = Customer.objects.filter(is_active=True)
+        total = active.count()
+
+        candidates = dedup.candidate_pairs(active)
+        started = time.perf_counter()
+        pairs = dedup.find_duplicates(active)
+        elapsed = time.perf_counter() - started
+
+        found = {(pair.first_id, pair.second_id) for pair in pairs}
+        recall = len(planted & found) / len(planted) if planted else 1.0
+        print(
+            f'{total:>10} {total * (total - 1) // 2:>14} {len(candidates):>11} '
+            f'{len(pairs):>7} {recall:>7.1%} {elapsed:>8.2f}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    common.parse_sizes(parser, [100_000])
+    parser.add_argument('--share', type=float, default=0.02, help='Share of customers duplicated')
+    args = parser.parse_args()
+
+    common.setup()
+    with common.test_database():
+        run(args.sizes, args.share)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+customer_list_ajax latency: uncached vs cached response vs 304 revalidation.
+
+    python -m customers.benchmarks.bench_list_api --sizes 10000 100000
+"""
+
+import argparse
+
+from . import common
+
+QUERIES = ['', 'search=garcia', 'search=600', 'status=all']
+
+
+def run(sizes, repeat):
+    from django.core.cache import cache
+    from django.test import Client
+    from django.urls import reverse
+
+    client = Client()
+    url = reverse('customers:list_ajax')
+    print(f'{"customers":>10} {"query":>14} {"mode":>9} {"p50 ms":>8} {"p95 ms":>8}')
+
+    seeded = 0
+    for size in sorted(sizes):
+        common.seed_customers(seeded, size)
+        seeded = size
+        for query in QUERIES:
+            path = f'{url}?{query}'
+            etag = client.get(path)['ETag']
+            modes = {
+                'uncached': lambda: (cache.clear(), client.get(path)),
+                'cached': lambda: client.get(path),
+                '304': lambda: client.get(path, HTTP_IF_NONE_MATCH=etag),
+            }
+            for mode, fn in modes.items():
+                p50, p95, _ = common.summarize(common.measure(fn, repeat))
+                print(f'{size:>10} {query or "-":>14} {mode:>9} {p50:>8.2f} {p95:>8.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    common.parse_sizes(parser, [10_000, 100_000])
+    args = parser.parse_args()
+
+    common.setup()
+    with common.test_database():
+        run(args.sizes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+"""
+Search latency: plain icontains vs the configured search backend.
+
+    python -m customers.benchmarks.bench_search --sizes 10000 100000 1000000
+"""
+
+import argparse
+
+from . import common
+
+TERMS = ['garcia', 'maria lopez', '600', 'example.com', 'zzz-no-match']
+
+
+def run(sizes, repeat):
+    from customers.models import Customer
+    from customers.pagination import paginate
+    from customers.search import SearchBackend, get_search_backend
+
+    backends = {'icontains': SearchBackend(), 'configured': get_search_backend()}
+    print(f'configured backend: {type(backends["configured"]).__name__}')
+    print(f'{"customers":>10} {"backend":>11} {"term":>14} {"p50 ms":>8} {"p95 ms":>8}')
+
+    seeded = 0
+    for size in sorted(sizes):
+        common.seed_customers(seeded, size)
+        seeded = size
+        for label, backend in backends.items():
+            for term in TERMS:
+                def first_page():
+                    queryset, order = backend.search(Customer.objects.filter(is_active=True), term)
+                    paginate(queryset, None, 100, order)
+
+                p50, p95, _ = common.summarize(common.measure(first_page, repeat))
+                print(f'{size:>10} {label:>11} {term:>14} {p50:>8.2f} {p95:>8.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    common.parse_sizes(parser, [10_000, 100_000])
+    args = parser.parse_args()
+
+    common.setup()
+    with common.test_database():
+        run(args.sizes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
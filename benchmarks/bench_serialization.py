@@ -0,0 +1,70 @@
+"""
+Per-row cost of serializing a customer_list_ajax page: model instances
+(the original implementation) vs the lean values() serializer.
+
+    python -m customers.benchmarks.bench_serialization --sizes 100
+"""
+
+import argparse
+import json
+
+from . import common
+
+
+def legacy_page(queryset, limit):
+    """
+    The original customer_list_ajax serialization, kept for comparison.
+    """
+    data = []
+    for customer in queryset.order_by('-created_at')[:limit]:
+        data.append({
+            'id': customer.id,
+            'name': customer.name,
+            'phone': customer.phone,
+            'email': customer.email,
+            'tax_id': customer.tax_id,
+            'total_spent': float(customer.total_spent),
+            'visit_count': customer.visit_count,
+            'average_purchase': float(customer.average_purchase),
+            'last_purchase': customer.last_purchase_at.strftime('%Y-%m-%d %H:%M') if customer.last_purchase_at else None,
+            'is_active': customer.is_active,
+            'created_at': customer.created_at.strftime('%Y-%m-%d'),
+        })
+    return json.dumps({'success': True, 'customers': data}).encode()
+
+
+def lean_page(queryset, limit):
+    from customers.pagination import paginate, DEFAULT_ORDER
+    from customers.serializers import list_values, serialize_rows, dumps
+
+    rows, _ = paginate(list_values(queryset, extra=['created_at', 'id']), None, limit, DEFAULT_ORDER)
+    return dumps({'success': True, 'customers': serialize_rows(rows)})
+
+
+def run(sizes, repeat):
+    from customers.models import Customer
+
+    # Page sizes; the table holds enough rows for the largest page
+    common.seed_customers(0, max(sizes))
+    Customer.objects.update(address='Calle Mayor 1\n28013 Madrid\n' * 10, notes='Notes ' * 200)
+    queryset = Customer.objects.all()
+
+    print(f'{"rows":>6} {"implementation":>15} {"p50 ms":>8} {"us/row":>8}')
+    for size in sorted(sizes):
+        for label, fn in (('model objects', legacy_page), ('values()', lean_page)):
+            p50, _, _ = common.summarize(common.measure(lambda: fn(queryset, size), repeat))
+            print(f'{size:>6} {label:>15} {p50:>8.2f} {p50 * 1000 / size:>8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    common.parse_sizes(parser, [10, 100])
+    args = parser.parse_args()
+
+    common.setup()
+    with common.test_database():
+        run(args.sizes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
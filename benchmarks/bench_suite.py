@@ -0,0 +1,200 @@
+"""
+End-to-end benchmark suite: list API, counters, detail page, stats
+refresh and export at realistic table sizes.
+
+    python -m customers.benchmarks.bench_suite --sizes 10000 100000 1000000
+    python -m customers.benchmarks.bench_suite --save baseline.json
+    python -m customers.benchmarks.bench_suite --baseline baseline.json --threshold 0.25
+
+Every case is also run once under a query counter and checked against
+its query budget, so an N+1 shows up even on a fast machine. With
+``--baseline``, a case whose p50 is slower than the baseline by more than
+``--threshold`` is reported as a regression. The exit status is 1 if any
+budget is exceeded or any case regressed.
+"""
+
+import argparse
+import json
+import sys
+
+from . import common
+
+# Fraction by which a p50 may exceed the baseline before it is a regression
+DEFAULT_THRESHOLD = 0.25
+
+# ...and by at least this much, so sub-millisecond jitter is not reported
+MIN_REGRESSION_MS = 1.0
+
+# Timed runs of the export case (each one streams the whole table)
+EXPORT_REPEAT = 3
+
+# Customers recomputed by the stats_rebuild case (one rebuild batch)
+REBUILD_SLICE = 1000
+
+
+def build_cases(size):
+    """
+    ``{name: (fn, query budget)}`` for a table of ``size`` customers.
+    """
+    from django.core.cache import cache
+    from django.db import connection
+    from django.db.models import Count, DateField
+    from django.db.models.functions import TruncMonth
+    from django.test import Client
+    from django.urls import reverse
+
+    from customers.exporters import export_rows, export_queryset
+    from customers.models import Customer, CustomerMonthlySpend, CustomerSale
+    from customers.stats import get_dashboard_stats, rebuild_stats
+
+    client = Client()
+    list_url = reverse('customers:list_ajax')
+    buyer = (
+        Customer.objects.annotate(sales_count=Count('sales'))
+        .filter(sales_count__gt=0).order_by('pk').first()
+    )
+    detail_url = reverse('customers:detail', kwargs={'customer_id': buyer.pk})
+
+    def get(url):
+        response = client.get(url)
+        assert response.status_code == 200, (url, response.status_code)
+
+    def uncached(fn):
+        # Every write bumps the cache version; clearing simulates a cold cache
+        def run():
+            cache.clear()
+            fn()
+        return run
+
+    def export():
+        for _line in export_rows(export_queryset()):
+            pass
+
+    rebuild_slice = Customer.objects.filter(pk__lte=REBUILD_SLICE)
+    # bulk_create splits the slice's month buckets by the backend's
+    # parameter limit (999 on SQLite), one INSERT per chunk
+    buckets = (
+        CustomerSale.objects.filter(customer__in=rebuild_slice, completed=True)
+        .annotate(bucket=TruncMonth('sold_at', output_field=DateField()))
+        .values('customer_id', 'bucket').distinct().count()
+    )
+    bucket_fields = [field for field in CustomerMonthlySpend._meta.concrete_fields if not field.primary_key]
+    bucket_inserts = -(-buckets // connection.ops.bulk_batch_size(bucket_fields, [None] * buckets)) if buckets else 0
+
+    return {
+        # Cache lookups are not SQL: one query for the page (+1 for FTS)
+        'list_page': (uncached(lambda: get(list_url)), 2),
+        'list_search': (uncached(lambda: get(f'{list_url}?search=garcia')), 3),
+        'list_cached': (lambda: get(f'{list_url}?search=garcia'), 0),
+        'counters': (uncached(get_dashboard_stats), 1),
+        # Customer + metrics, tags, purchase history
+        'detail': (lambda: get(detail_url), 4),
+        # Aggregate, UPDATE, month buckets (DELETE, aggregate, INSERT)
+        'stats_refresh': (buyer.update_stats, 5),
+        # One batch: SELECT, sales aggregate, bulk UPDATE, month buckets
+        # (DELETE, aggregate, INSERTs); plus the final SELECT
+        'stats_rebuild': (lambda: rebuild_stats(rebuild_slice), 5 + bucket_inserts + 1),
+        # Streamed in chunks: at most one query per chunk
+        'export': (export, 1 + -(-size // 1000)),
+    }
+
+
+# Transaction control statements are not counted against budgets
+TRANSACTION_SQL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def count_queries(fn):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+    return sum(1 for query in queries if not query['sql'].startswith(TRANSACTION_SQL))
+
+
+def run(sizes, repeat):
+    """
+    Seed each size in turn and time every case. Returns
+    ``({size: {case: {'p50', 'p95', 'queries', 'budget'}}}, failures)``.
+    """
+    from customers.exporters import export_queryset
+
+    results = {}
+    failures = []
+    print(f'{"customers":>10} {"case":>14} {"p50 ms":>9} {"p95 ms":>9} {"queries":>8} {"budget":>7}')
+
+    seeded = 0
+    for size in sorted(sizes):
+        common.seed_customers(seeded, size)
+        common.seed_sales(seeded, size)
+        seeded = size
+
+        results[size] = {}
+        for name, (fn, budget) in build_cases(size).items():
+            fn()  # warm caches the case relies on (e.g. list_cached)
+            queries = count_queries(fn)
+            runs = EXPORT_REPEAT if name == 'export' else repeat
+            p50, p95, _ = common.summarize(common.measure(fn, runs, warmup=1))
+
+            results[size][name] = {'p50': round(p50, 3), 'p95': round(p95, 3), 'queries': queries, 'budget': budget}
+            flag = '' if queries <= budget else '  OVER BUDGET'
+            print(f'{size:>10} {name:>14} {p50:>9.2f} {p95:>9.2f} {queries:>8} {budget:>7}{flag}')
+            if queries > budget:
+                failures.append(f'{size} {name}: {queries} queries, budget {budget}')
+
+        exported = export_queryset().count()
+        rate = exported / (results[size]['export']['p50'] / 1000)
+        print(f'{size:>10} {"export rate":>14} {rate:>9.0f} rows/s ({exported} rows)')
+
+    return results, failures
+
+
+def compare(results, baseline, threshold):
+    """
+    Regressions of ``results`` against ``baseline`` (same structure,
+    loaded from JSON so sizes are strings).
+    """
+    regressions = []
+    for size, cases in results.items():
+        for name, current in cases.items():
+            previous = baseline.get(str(size), {}).get(name)
+            if not previous:
+                continue
+            limit = max(previous['p50'] * (1 + threshold), previous['p50'] + MIN_REGRESSION_MS)
+            if current['p50'] > limit:
+                regressions.append(
+                    f'{size} {name}: p50 {current["p50"]:.2f} ms vs baseline {previous["p50"]:.2f} ms '
+                    f'(+{(current["p50"] / previous["p50"] - 1) * 100:.0f}%)'
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    common.parse_sizes(parser, [10_000, 100_000])
+    parser.add_argument('--save', help='Write the results to this JSON file (a new baseline)')
+    parser.add_argument('--baseline', help='Compare against results saved with --save')
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='Allowed p50 slowdown over the baseline (default: %(default)s)'
+    )
+    args = parser.parse_args()
+
+    common.setup()
+    with common.test_database():
+        results, failures = run(args.sizes, args.repeat)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures += compare(results, json.load(f), args.threshold)
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Typeahead latency: the list API search vs the in-memory prefix index,
+keystroke by keystroke, plus the index build time and memory and the
+cost of applying one saved customer to the index (time the lock is held).
+
+    python -m customers.benchmarks.bench_typeahead --sizes 10000 100000
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from . import common
+
+# What a cashier types, one keystroke at a time
+TYPED = ['garcia', '600123', 'maria.l']
+
+
+def run(sizes, repeat):
+    from django.core.cache import cache
+    from django.test import Client
+    from django.urls import reverse
+
+    from customers import typeahead
+    from customers.models import Customer
+
+    client = Client()
+    list_url = reverse('customers:list_ajax')
+    typeahead_url = reverse('customers:typeahead')
+
+    seeded = 0
+    for size in sorted(sizes):
+        common.seed_customers(seeded, size)
+        seeded = size
+
+        index = typeahead.PrefixIndex()
+        tracemalloc.start()
+        started = time.perf_counter()
+        built = index.build()
+        build_ms = (time.perf_counter() - started) * 1000
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        typeahead._index = index
+        print(f'{size} customers: index built={built} in {build_ms:.0f} ms, '
+              f'{memory / 1024 / 1024:.1f} MiB, {len(index.keys)} keys')
+
+        # Re-save enough distinct customers to trigger one compaction; the
+        # slowest save is the one that compacts
+        rows = list(
+            Customer.objects.filter(is_active=True, merged_into__isnull=True)
+            .order_by('?').values(*typeahead._FIELDS)[:typeahead.COMPACT_THRESHOLD + 1]
+        )
+        timings = []
+        for row in rows:
+            started = time.perf_counter()
+            index.apply(row)
+            timings.append((time.perf_counter() - started) * 1000)
+        save_p50, save_p95, save_max = common.summarize(timings)
+        print(f'{size} customers: one save applied in p50 {save_p50:.3f} ms, p95 {save_p95:.3f} ms, '
+              f'max {save_max:.1f} ms (compaction)')
+
+        print(f'{"customers":>10} {"term":>9} {"list p50":>9} {"list p95":>9} {"typeahead p50":>14} {"typeahead p95":>14}')
+        for word in TYPED:
+            for length in range(1, len(word) + 1):
+                term = word[:length]
+
+                def list_search():
+                    cache.clear()
+                    client.get(list_url, {'search': term})
+
+                list_p50, list_p95, _ = common.summarize(common.measure(list_search, repeat))
+                fast_p50, fast_p95, _ = common.summarize(
+                    common.measure(lambda: client.get(typeahead_url, {'q': term}), repeat)
+                )
+                print(f'{size:>10} {term:>9} {list_p50:>9.2f} {list_p95:>9.2f} {fast_p50:>14.2f} {fast_p95:>14.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    common.parse_sizes(parser, [10_000, 100_000])
+    args = parser.parse_args()
+
+    common.setup()
+    with common.test_database():
+        run(args.sizes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Shared helpers for the customers benchmarks.
+
+Benchmarks run against a throwaway test database created from the
+configured settings, so they never touch real data:
+
+    DJANGO_SETTINGS_MODULE=config.settings python -m customers.benchmarks.bench_search
+"""
+
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+import django
+
+FIRST_NAMES = [
+    'Maria', 'Jose', 'Antonio', 'Carmen', 'Juan', 'Ana', 'Manuel', 'Laura',
+    'Francisco', 'Lucia', 'David', 'Marta', 'Javier', 'Elena', 'Daniel', 'Sara',
+]
+LAST_NAMES = [
+    'Garcia', 'Rodriguez', 'Gonzalez', 'Fernandez', 'Lopez', 'Martinez',
+    'Sanchez', 'Perez', 'Gomez', 'Martin', 'Jimenez', 'Ruiz', 'Hernandez',
+    'Diaz', 'Moreno', 'Alvarez', 'Romero', 'Navarro', 'Torres', 'Dominguez',
+]
+TAX_LETTERS = 'TRWAGMYFPDXBNJZSQVHLCKE'
+
+
+def setup():
+    """
+    Configure Django from DJANGO_SETTINGS_MODULE.
+    """
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """
+    Create a fresh test database for the duration of the block.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def synthetic_customer(i, rng):
+    """
+    Build an unsaved Customer with realistic-looking contact data.
+    """
+    from customers.models import Customer
+
+    first = rng.choice(FIRST_NAMES)
+    last = f'{rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+    number = rng.randrange(10_000_000, 100_000_000)
+    phone = f'+34 6{rng.randrange(10, 100)} {rng.randrange(100, 1000)} {rng.randrange(100, 1000)}'
+    customer = Customer(
+        name=f'{first} {last}',
+        email=f'{first}.{last.split()[0]}{i}@example.com'.lower(),
+        phone=phone if rng.random() < 0.9 else '',
+        tax_id=f'{number}{TAX_LETTERS[number % 23]}' if rng.random() < 0.6 else '',
+        is_active=rng.random() < 0.9,
+    )
+    # bulk_create() skips save(), which fills the normalized search keys
+    customer.normalize_fields()
+    return customer
+
+
+def seed_customers(start, stop, batch_size=5000, seed=42):
+    """
+    Insert synthetic customers ``start``..``stop`` in batches.
+    """
+    from customers.models import Customer
+
+    rng = random.Random(seed + start)
+    for offset in range(start, stop, batch_size):
+        batch = [synthetic_customer(i, rng) for i in range(offset, min(offset + batch_size, stop))]
+        Customer.objects.bulk_create(batch, batch_size=batch_size)
+
+
+def seed_sales(start, stop, batch_size=5000, seed=42):
+    """
+    Link synthetic completed sales to about a third of the customers with
+    ids ``start``..``stop`` (1-4 sales each, over the last two years).
+    """
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from customers.models import Customer, CustomerSale
+
+    rng = random.Random(seed + start)
+    now = timezone.now()
+    sale_id = CustomerSale.objects.order_by('-sale_id').values_list('sale_id', flat=True).first() or 0
+    ids = Customer.objects.filter(pk__gt=start, pk__lte=stop).order_by('pk').values_list('pk', flat=True)
+
+    batch = []
+    for customer_id in ids.iterator(chunk_size=batch_size):
+        if rng.random() >= 0.33:
+            continue
+        for _ in range(rng.randint(1, 4)):
+            sale_id += 1
+            batch.append(CustomerSale(
+                customer_id=customer_id,
+                sale_id=sale_id,
+                total=rng.randrange(500, 30000) / 100,
+                sold_at=now - timedelta(minutes=rng.randrange(0, 2 * 365 * 24 * 60)),
+                completed=rng.random() < 0.95,
+            ))
+        if len(batch) >= batch_size:
+            CustomerSale.objects.bulk_create(batch)
+            batch = []
+    CustomerSale.objects.bulk_create(batch)
+
+
+def measure(fn, repeat=20, warmup=2):
+    """
+    Run ``fn`` and return its timings in milliseconds.
+    """
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summarize(timings):
+    """
+    Return (p50, p95, max) of a list of timings.
+    """
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return statistics.median(ordered), p95, ordered[-1]
+
+
+def parse_sizes(parser, default):
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=default,
+        help='Customer table sizes to benchmark (default: %(default)s)'
+    )
+    parser.add_argument('--repeat', type=int, default=20, help='Timed runs per case')
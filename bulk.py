@@ -0,0 +1,112 @@
+"""
+Bulk actions over many customers at once.
+
+Selections are walked in primary-key order in chunks of ``BULK_CHUNK_SIZE``
+ids; each chunk is written with one UPDATE (or one INSERT / DELETE of tag
+links) in its own transaction, so huge selections never hold locks for
+long nor load whole rows. Only rows that actually change are written and
+counted, and their ``version`` is bumped so edit forms opened before the
+action are rejected instead of reverting it.
+"""
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .cache import bump_version
+from .models import Customer, CustomerTag
+
+# Customer ids written per statement / transaction
+BULK_CHUNK_SIZE = 1000
+
+ACTION_DEACTIVATE = 'deactivate'
+ACTION_REACTIVATE = 'reactivate'
+ACTION_TAG = 'tag'
+ACTION_UNTAG = 'untag'
+ACTIONS = (ACTION_DEACTIVATE, ACTION_REACTIVATE, ACTION_TAG, ACTION_UNTAG)
+
+
+def _id_chunks(queryset, chunk_size):
+    last_id = None
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    while True:
+        chunk = list((ids.filter(pk__gt=last_id) if last_id is not None else ids)[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1]
+
+
+def _set_active(ids, active, now):
+    return Customer.objects.filter(pk__in=ids, is_active=not active).update(
+        is_active=active, updated_at=now, version=F('version') + 1
+    )
+
+
+def _tag(ids, tag, now):
+    Link = Customer.tags.through
+    tagged = set(Link.objects.filter(customertag=tag, customer_id__in=ids).values_list('customer_id', flat=True))
+    new = [customer_id for customer_id in ids if customer_id not in tagged]
+    if new:
+        Link.objects.bulk_create([Link(customer_id=customer_id, customertag=tag) for customer_id in new])
+        Customer.objects.filter(pk__in=new).update(updated_at=now, version=F('version') + 1)
+    return len(new)
+
+
+def _untag(ids, tag, now):
+    Link = Customer.tags.through
+    links = Link.objects.filter(customertag=tag, customer_id__in=ids)
+    untagged = list(links.values_list('customer_id', flat=True))
+    if untagged:
+        links.delete()
+        Customer.objects.filter(pk__in=untagged).update(updated_at=now, version=F('version') + 1)
+    return len(untagged)
+
+
+def apply_bulk_action(queryset, action, tag_name='', chunk_size=None, progress=None):
+    """
+    Apply ``action`` to every customer in ``queryset``.
+
+    ``tag`` and ``untag`` need ``tag_name``; tagging creates the tag if
+    needed. ``progress(selected, affected)`` is called after each chunk.
+
+    Returns ``(selected, affected)``: customers in the selection and
+    customers actually changed.
+    """
+    if action not in ACTIONS:
+        raise ValueError(_('Acción no válida'))
+
+    tag = None
+    tag_name = tag_name.strip()
+    if action in (ACTION_TAG, ACTION_UNTAG):
+        if not tag_name:
+            raise ValueError(_('Indique la etiqueta'))
+        if action == ACTION_TAG:
+            tag, _created = CustomerTag.objects.get_or_create(name=tag_name)
+        else:
+            tag = CustomerTag.objects.filter(name=tag_name).first()
+            if tag is None:
+                return queryset.count(), 0
+
+    chunk_size = chunk_size or BULK_CHUNK_SIZE
+    now = timezone.now()
+    selected = affected = 0
+    for ids in _id_chunks(queryset, chunk_size):
+        with transaction.atomic():
+            if action == ACTION_DEACTIVATE:
+                affected += _set_active(ids, False, now)
+            elif action == ACTION_REACTIVATE:
+                affected += _set_active(ids, True, now)
+            elif action == ACTION_TAG:
+                affected += _tag(ids, tag, now)
+            else:
+                affected += _untag(ids, tag, now)
+        selected += len(ids)
+        if progress:
+            progress(selected, affected)
+
+    if affected:
+        # queryset.update() skips the post_save signal
+        transaction.on_commit(bump_version)
+    return selected, affected
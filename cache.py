@@ -0,0 +1,111 @@
+"""
+Cache helpers for the customers module.
+
+Cached values are keyed on a table version token that is bumped on every
+write to customers, so invalidation is a single cache increment and stale
+entries simply expire.
+
+Each customer also has a sales version token, changed whenever its sales
+or purchase stats change, for fragments that only depend on those.
+
+Writers bump the tokens with ``transaction.on_commit``: bumping before
+the commit would let a concurrent request cache the old rows again under
+the new token.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.utils import timezone
+
+VERSION_KEY = 'customers:version'
+
+MODIFIED_KEY = 'customers:modified'
+
+
+def _token(key):
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so a cleared cache never reuses old tokens
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_version():
+    """
+    Return the current customers version token.
+    """
+    return _token(VERSION_KEY)
+
+
+async def aget_version():
+    """
+    Async ``get_version()``.
+    """
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, int(time.time() * 1000), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """
+    Invalidate everything cached for the current customers version.
+    """
+    cache.set(MODIFIED_KEY, timezone.now(), timeout=None)
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+        return cache.incr(VERSION_KEY)
+
+
+def _sales_version_key(customer_id):
+    return f'customers:sales:{customer_id}'
+
+
+def get_sales_version(customer_id):
+    """
+    Return the sales version token of a customer.
+    """
+    return _token(_sales_version_key(customer_id))
+
+
+def bump_sales_version(customer_ids):
+    """
+    Invalidate what is cached for the sales of the given customers.
+
+    The tokens are deleted in one call; the next read restarts them from
+    the clock.
+    """
+    cache.delete_many([_sales_version_key(customer_id) for customer_id in customer_ids])
+
+
+def last_modified():
+    """
+    Time of the last write to customers, or None if unknown.
+    """
+    return cache.get(MODIFIED_KEY)
+
+
+async def alast_modified():
+    """
+    Async ``last_modified()``.
+    """
+    return await cache.aget(MODIFIED_KEY)
+
+
+def versioned_key(*parts):
+    """
+    Build a cache key that changes whenever customers are written.
+    """
+    return ':'.join(['customers', str(get_version()), *map(str, parts)])
+
+
+async def aversioned_key(*parts):
+    """
+    Async ``versioned_key()``.
+    """
+    return ':'.join(['customers', str(await aget_version()), *map(str, parts)])
@@ -0,0 +1,357 @@
+"""
+Duplicate customer detection and merging.
+
+Comparing every customer with every other is O(n²). Instead customers
+are grouped into blocks that share a key, and only customers within the
+same block are compared:
+
+- email (case-insensitive)
+- phone: last 9 digits of the normalized phone, so "+34 600 111 222" and
+  "600-111-222" share a block
+- normalized tax id
+- phonetic key of the name, so "José Pérez" and "Jose Peres" do
+
+The first three are grouped by the database (GROUP BY ... HAVING); the
+phonetic key is computed in one streaming pass over (id, name). Blocks
+larger than ``MAX_BLOCK_SIZE`` (very common names, placeholder emails)
+are skipped: they say little about identity and would bring back the
+quadratic cost. Candidate pairs are then scored, and ``merge_customers``
+folds duplicates into a primary customer in one transaction.
+"""
+
+from collections import defaultdict, namedtuple
+from difflib import SequenceMatcher
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import Length, Lower, Right
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .cache import bump_version
+from .models import Customer, CustomerSale
+from .normalization import phonetic_key
+from .stats import rebuild_monthly_spend
+
+# Customers sharing a block key beyond this are not compared
+MAX_BLOCK_SIZE = 50
+
+# Minimum score for a pair to be reported
+DUPLICATE_THRESHOLD = 0.45
+
+# Trailing digits of the normalized phone used as its block key
+PHONE_KEY_DIGITS = 9
+
+# Shorter phones are treated as noise (extensions, typos)
+MIN_PHONE_DIGITS = 7
+
+# Score contributed by each matching key; name similarity adds up to NAME_WEIGHT
+WEIGHTS = {
+    'tax_id': 0.6,
+    'email': 0.4,
+    'phone': 0.4,
+}
+NAME_WEIGHT = 0.5
+
+# Subtracted when both customers have an email (or phone) and they differ
+CONFLICT_PENALTY = 0.1
+
+# Customers loaded per query when scoring candidate pairs
+FETCH_BATCH_SIZE = 2000
+
+DuplicatePair = namedtuple('DuplicatePair', 'first_id second_id score reasons')
+
+_COMPARE_FIELDS = ('id', 'name_normalized', 'email', 'phone_normalized', 'tax_id_normalized')
+
+
+def _phone_key(phone_normalized):
+    if len(phone_normalized) < MIN_PHONE_DIGITS:
+        return ''
+    return phone_normalized[-PHONE_KEY_DIGITS:]
+
+
+def _key_expressions():
+    """
+    Block key -> (expression, filter excluding empty keys) for the keys
+    grouped in the database.
+    """
+    return {
+        'email': (Lower('email'), ~Q(email='')),
+        'phone': (
+            Right('phone_normalized', PHONE_KEY_DIGITS),
+            Q(phone_normalized_length__gte=MIN_PHONE_DIGITS),
+        ),
+        'tax_id': (F('tax_id_normalized'), ~Q(tax_id_normalized='')),
+    }
+
+
+def _database_blocks(queryset, max_block_size):
+    """
+    Yield lists of customer ids sharing an email, phone or tax id key.
+    """
+    queryset = queryset.order_by().annotate(phone_normalized_length=Length('phone_normalized'))
+
+    for expression, not_empty in _key_expressions().values():
+        keyed = queryset.filter(not_empty).annotate(block_key=expression)
+        duplicated_keys = (
+            keyed.values('block_key')
+            .annotate(size=Count('id'))
+            .filter(size__gt=1, size__lte=max_block_size)
+            .values('block_key')
+        )
+        members = (
+            keyed.filter(block_key__in=duplicated_keys)
+            .values_list('block_key', 'id')
+            .order_by('block_key')
+        )
+
+        block, current = [], None
+        for key, customer_id in members.iterator(chunk_size=FETCH_BATCH_SIZE):
+            if key != current:
+                if len(block) > 1:
+                    yield block
+                block, current = [], key
+            block.append(customer_id)
+        if len(block) > 1:
+            yield block
+
+
+def _phonetic_blocks(queryset, max_block_size):
+    """
+    Yield lists of customer ids whose names share a phonetic key.
+    """
+    blocks = defaultdict(list)
+    names = queryset.order_by().values_list('id', 'name_normalized')
+    for customer_id, name in names.iterator(chunk_size=FETCH_BATCH_SIZE):
+        key = phonetic_key(name)
+        if key:
+            blocks[key].append(customer_id)
+
+    for block in blocks.values():
+        if 1 < len(block) <= max_block_size:
+            yield block
+
+
+def candidate_pairs(queryset=None, max_block_size=None):
+    """
+    Set of (lower id, higher id) pairs sharing at least one block.
+    """
+    if queryset is None:
+        queryset = Customer.objects.filter(is_active=True)
+    max_block_size = max_block_size or MAX_BLOCK_SIZE
+
+    pairs = set()
+    for blocks in (_database_blocks(queryset, max_block_size), _phonetic_blocks(queryset, max_block_size)):
+        for block in blocks:
+            block = sorted(block)
+            for i, first_id in enumerate(block):
+                for second_id in block[i + 1:]:
+                    pairs.add((first_id, second_id))
+    return pairs
+
+
+def compare_row(values):
+    """
+    Dict of the compared fields plus the derived keys score_pair() reads.
+    """
+    row = {field: values[field] for field in _COMPARE_FIELDS}
+    row['email_key'] = row['email'].lower()
+    row['phone_key'] = _phone_key(row['phone_normalized'])
+    return row
+
+
+def score_pair(first, second, threshold=0.0):
+    """
+    Score two customers (rows built by compare_row()) from 0 to 1.
+
+    Returns ``(score, reasons)``. Different emails or phones count
+    against a match; different tax ids rule it out whatever else agrees.
+    Name similarity, the costly part, is skipped when even identical
+    names could not lift the score to ``threshold``.
+    """
+    if first['tax_id_normalized'] and second['tax_id_normalized']:
+        if first['tax_id_normalized'] != second['tax_id_normalized']:
+            return 0.0, []
+
+    score = 0.0
+    reasons = []
+    if first['tax_id_normalized'] and first['tax_id_normalized'] == second['tax_id_normalized']:
+        score += WEIGHTS['tax_id']
+        reasons.append('tax_id')
+    if first['email'] and second['email']:
+        if first['email_key'] == second['email_key']:
+            score += WEIGHTS['email']
+            reasons.append('email')
+        else:
+            score -= CONFLICT_PENALTY
+    if first['phone_key'] and second['phone_key']:
+        if first['phone_key'] == second['phone_key']:
+            score += WEIGHTS['phone']
+            reasons.append('phone')
+        else:
+            score -= CONFLICT_PENALTY
+
+    if score + NAME_WEIGHT < threshold:
+        return max(round(score, 3), 0.0), reasons
+
+    if first['name_normalized'] == second['name_normalized']:
+        similarity = 1.0
+    else:
+        matcher = SequenceMatcher(None, first['name_normalized'], second['name_normalized'])
+        if score + matcher.quick_ratio() * NAME_WEIGHT < threshold:
+            return max(round(score, 3), 0.0), reasons
+        similarity = matcher.ratio()
+    if similarity >= 0.8:
+        reasons.append('name')
+    score += similarity * NAME_WEIGHT
+
+    return min(max(round(score, 3), 0.0), 1.0), reasons
+
+
+def _fetch(customer_ids):
+    """
+    Compared fields of the given customers, keyed by id.
+    """
+    customer_ids = sorted(customer_ids)
+    rows = {}
+    for start in range(0, len(customer_ids), FETCH_BATCH_SIZE):
+        chunk = customer_ids[start:start + FETCH_BATCH_SIZE]
+        for row in Customer.objects.filter(pk__in=chunk).values(*_COMPARE_FIELDS):
+            rows[row['id']] = compare_row(row)
+    return rows
+
+
+def find_duplicates(queryset=None, threshold=None, max_block_size=None):
+    """
+    Likely duplicate pairs among ``queryset`` (active customers by
+    default), best matches first.
+    """
+    threshold = DUPLICATE_THRESHOLD if threshold is None else threshold
+    pairs = candidate_pairs(queryset, max_block_size)
+    rows = _fetch({customer_id for pair in pairs for customer_id in pair})
+
+    duplicates = []
+    for first_id, second_id in pairs:
+        score, reasons = score_pair(rows[first_id], rows[second_id], threshold)
+        if score >= threshold:
+            duplicates.append(DuplicatePair(first_id, second_id, score, reasons))
+
+    duplicates.sort(key=lambda pair: (-pair.score, pair.first_id, pair.second_id))
+    return duplicates
+
+
+def find_duplicates_of(customer, threshold=None, limit=20):
+    """
+    Likely duplicates of one customer, using the indexed keys only
+    (exact email, phone, tax id or normalized name).
+
+    Returns ``(customer, score, reasons)`` tuples, best matches first.
+    """
+    threshold = DUPLICATE_THRESHOLD if threshold is None else threshold
+
+    lookups = Q()
+    if customer.email:
+        lookups |= Q(email__in={customer.email, customer.email.lower()})
+    phone_key = _phone_key(customer.phone_normalized)
+    if phone_key:
+        lookups |= Q(phone_normalized__in={customer.phone_normalized, phone_key})
+    if customer.tax_id_normalized:
+        lookups |= Q(tax_id_normalized=customer.tax_id_normalized)
+    if customer.name_normalized:
+        lookups |= Q(name_normalized=customer.name_normalized)
+    if not lookups:
+        return []
+
+    this = compare_row(vars(customer))
+    candidates = (
+        Customer.objects.filter(lookups, is_active=True)
+        .exclude(pk=customer.pk)[:MAX_BLOCK_SIZE]
+    )
+
+    matches = []
+    for other in candidates:
+        score, reasons = score_pair(this, compare_row(vars(other)), threshold)
+        if score >= threshold:
+            matches.append((other, score, reasons))
+    matches.sort(key=lambda match: (-match[1], match[0].pk))
+    return matches[:limit]
+
+
+# Contact fields copied from a duplicate when the primary has none
+FILL_FIELDS = ('email', 'phone', 'tax_id', 'address')
+
+
+def merge_customers(primary, duplicate_ids):
+    """
+    Merge the customers in ``duplicate_ids`` into ``primary`` in one
+    transaction.
+
+    Linked sales move to the primary and its stats absorb the duplicates'
+    (each sale counts towards exactly one customer, so they add up); the
+    monthly spend buckets of all of them are rebuilt from the moved sales.
+    Empty contact fields are filled from the duplicates, their notes
+    appended and their tags added to the primary's. Duplicates are
+    deactivated and point to the primary through ``merged_into``.
+
+    Returns the updated primary.
+    """
+    duplicate_ids = set(duplicate_ids) - {primary.pk}
+    if not duplicate_ids:
+        return primary
+
+    with transaction.atomic():
+        primary = Customer.objects.select_for_update().get(pk=primary.pk)
+        if primary.merged_into_id:
+            raise ValueError(_('El cliente principal ya fue fusionado con otro'))
+        merged = list(
+            Customer.objects.select_for_update()
+            .filter(pk__in=duplicate_ids, merged_into__isnull=True)
+            .order_by('created_at', 'pk')
+        )
+        if len(merged) != len(duplicate_ids):
+            raise ValueError(_('Algunos clientes no existen o ya fueron fusionados'))
+
+        CustomerSale.objects.filter(customer__in=merged).update(customer=primary)
+
+        Link = Customer.tags.through
+        tag_ids = set(Link.objects.filter(customer_id__in=duplicate_ids).values_list('customertag_id', flat=True))
+        tag_ids -= set(Link.objects.filter(customer_id=primary.pk).values_list('customertag_id', flat=True))
+        Link.objects.bulk_create([Link(customer_id=primary.pk, customertag_id=tag_id) for tag_id in tag_ids])
+
+        notes = [primary.notes] if primary.notes else []
+        for customer in merged:
+            primary.total_spent += customer.total_spent
+            primary.visit_count += customer.visit_count
+            if customer.last_purchase_at and (
+                primary.last_purchase_at is None or customer.last_purchase_at > primary.last_purchase_at
+            ):
+                primary.last_purchase_at = customer.last_purchase_at
+            for field in FILL_FIELDS:
+                if not getattr(primary, field) and getattr(customer, field):
+                    setattr(primary, field, getattr(customer, field))
+            if customer.notes:
+                notes.append(customer.notes)
+        primary.notes = '\n\n'.join(notes)
+        # The row is locked, so no version check; bump it for open edit forms
+        primary.version += 1
+        primary.save(update_fields=[*Customer.STATS_FIELDS, *FILL_FIELDS, 'notes', 'version', 'updated_at'])
+
+        Customer.objects.filter(pk__in=duplicate_ids).update(
+            is_active=False,
+            merged_into=primary,
+            total_spent=0,
+            visit_count=0,
+            last_purchase_at=None,
+            updated_at=timezone.now(),
+            # Edit forms open on a duplicate must not bring it back
+            version=F('version') + 1,
+        )
+        # Customers already merged into a duplicate now point to the primary
+        Customer.objects.filter(merged_into__in=duplicate_ids).update(
+            merged_into=primary, updated_at=timezone.now(), version=F('version') + 1
+        )
+        rebuild_monthly_spend([primary.pk, *duplicate_ids])
+
+        # queryset.update() skips the post_save signal
+        transaction.on_commit(bump_version)
+    return primary
@@ -0,0 +1,302 @@
+"""
+Bulk customer import from CSV or XLSX files.
+
+Files are parsed incrementally and written in batches: each batch is
+validated, matched against existing customers by email, normalized phone
+or normalized tax id with one query, and written with bulk_create /
+bulk_update inside a transaction. Row errors are collected, not raised.
+"""
+
+import csv
+import io
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .cache import bump_version
+from .models import Customer
+from .normalization import normalize_phone, normalize_tax_id
+
+# Rows validated and written per transaction
+IMPORT_BATCH_SIZE = 500
+
+# Header (lowercased) -> Customer field; matches the export header too
+COLUMN_ALIASES = {
+    'name': 'name', 'nombre': 'name',
+    'email': 'email', 'correo': 'email', 'correo electrónico': 'email',
+    'phone': 'phone', 'teléfono': 'phone', 'telefono': 'phone',
+    'tax id': 'tax_id', 'tax_id': 'tax_id', 'nif': 'tax_id', 'nif/cif': 'tax_id', 'cif': 'tax_id',
+    'address': 'address', 'dirección': 'address', 'direccion': 'address',
+    'notes': 'notes', 'notas': 'notes',
+}
+
+IMPORT_FIELDS = ('name', 'email', 'phone', 'tax_id', 'address', 'notes')
+
+MAX_LENGTHS = {
+    field: Customer._meta.get_field(field).max_length
+    for field in IMPORT_FIELDS
+    if Customer._meta.get_field(field).max_length
+}
+
+
+class ImportResult:
+    """
+    Outcome of an import: counters, per-row errors and throughput.
+    """
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []  # (row number, message)
+        self.elapsed = 0.0
+
+    @property
+    def processed(self):
+        return self.created + self.updated + self.skipped + len(self.errors)
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self, max_errors=100):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'errors': [{'row': row, 'error': message} for row, message in self.errors[:max_errors]],
+            'error_count': len(self.errors),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+def _map_header(header):
+    return [COLUMN_ALIASES.get((column or '').strip().lower()) for column in header]
+
+
+def _rows_from_table(table):
+    """
+    Turn an iterator of row tuples (first one the header) into
+    (row number, {field: value}) pairs, skipping blank lines.
+    """
+    table = iter(table)
+    fields = _map_header(next(table, []))
+    if 'name' not in fields:
+        raise ValueError(_('El archivo debe tener una columna "Name" o "Nombre"'))
+
+    for number, values in enumerate(table, start=2):
+        row = {}
+        for field, value in zip(fields, values):
+            if field and value is not None:
+                row[field] = str(value).strip()
+        if any(row.values()):
+            yield number, row
+
+
+def read_csv(fileobj):
+    """
+    Iterate a CSV file (bytes or text, with or without BOM) row by row.
+    """
+    if not isinstance(fileobj, io.TextIOBase):
+        fileobj = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    sample = fileobj.read(4096)
+    fileobj.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return _rows_from_table(csv.reader(fileobj, dialect))
+
+
+def read_xlsx(fileobj):
+    """
+    Iterate the first sheet of an XLSX file row by row (needs openpyxl).
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError(_('Para importar archivos Excel instale openpyxl'))
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    return _rows_from_table(workbook.worksheets[0].iter_rows(values_only=True))
+
+
+def read_rows(fileobj, filename):
+    """
+    Pick the reader from the file extension.
+    """
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        return read_xlsx(fileobj)
+    return read_csv(fileobj)
+
+
+def _validate(row):
+    """
+    Clean a row in place; return an error message or None.
+    """
+    if not row.get('name'):
+        return _('El nombre es obligatorio')
+    for field, max_length in MAX_LENGTHS.items():
+        if len(row.get(field, '')) > max_length:
+            return _('%(field)s supera %(max)s caracteres') % {'field': field, 'max': max_length}
+    if row.get('email'):
+        row['email'] = row['email'].lower()
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            return _('Email no válido: %(email)s') % {'email': row['email']}
+    return None
+
+
+def _keys(row):
+    """
+    Dedup keys of a row: ('email', ...), ('phone', ...), ('tax_id', ...).
+    """
+    keys = []
+    if row.get('email'):
+        keys.append(('email', row['email']))
+    phone = normalize_phone(row.get('phone', ''))
+    if phone:
+        keys.append(('phone', phone))
+    tax_id = normalize_tax_id(row.get('tax_id', ''))
+    if tax_id:
+        keys.append(('tax_id', tax_id))
+    return keys
+
+
+def _existing_by_key(keys):
+    """
+    Load existing customers matching any of the keys, in one query, and
+    lock them until the end of the transaction.
+    """
+    values = {'email': set(), 'phone': set(), 'tax_id': set()}
+    for kind, value in keys:
+        values[kind].add(value)
+
+    query = Q()
+    if values['email']:
+        # Incoming emails are lowercased; stored ones may not be
+        query |= Q(email_key__in=values['email'])
+    if values['phone']:
+        query |= Q(phone_normalized__in=values['phone'])
+    if values['tax_id']:
+        query |= Q(tax_id_normalized__in=values['tax_id'])
+    if not query:
+        return {}
+
+    found = {}
+    customers = Customer.objects.select_for_update().annotate(email_key=Lower('email')).filter(query).order_by('pk')
+    for customer in customers:
+        for key in (('email', customer.email_key),
+                    ('phone', customer.phone_normalized),
+                    ('tax_id', customer.tax_id_normalized)):
+            if key[1]:
+                found.setdefault(key, customer)
+    return found
+
+
+def _write_batch(batch, result, update_existing, seen):
+    """
+    Validate, deduplicate and write one batch of (row number, row) pairs.
+
+    Matched customers are locked from the read to the write, so an edit
+    saved meanwhile either lands before the import reads the row or
+    fails its version check afterwards; it is never overwritten.
+    """
+    valid = []
+    for number, row in batch:
+        error = _validate(row)
+        if error:
+            result.errors.append((number, error))
+        else:
+            valid.append((number, row, _keys(row)))
+
+    with transaction.atomic():
+        existing = _existing_by_key([key for _number, _row, keys in valid for key in keys])
+
+        to_create = []
+        to_update = {}
+        update_fields = set()
+        for number, row, keys in valid:
+            duplicate_of = next((seen[key] for key in keys if key in seen), None)
+            if duplicate_of is not None:
+                result.errors.append((number, _('Duplicado de la fila %(row)s') % {'row': duplicate_of}))
+                continue
+            for key in keys:
+                seen[key] = number
+
+            customer = next((existing[key] for key in keys if key in existing), None)
+            if customer is None:
+                customer = Customer(**{field: row.get(field, '') for field in IMPORT_FIELDS})
+                customer.normalize_fields()
+                to_create.append(customer)
+            elif not update_existing:
+                result.skipped += 1
+            else:
+                changed = [
+                    field for field in IMPORT_FIELDS
+                    if row.get(field) and row[field] != getattr(customer, field)
+                ]
+                if changed:
+                    for field in changed:
+                        setattr(customer, field, row[field])
+                    customer.normalize_fields()
+                    customer.updated_at = timezone.now()
+                    # Reject edit forms opened before the import
+                    customer.version += 1
+                    update_fields.update(changed)
+                    to_update[customer.pk] = customer
+                else:
+                    result.skipped += 1
+
+        if to_create:
+            Customer.objects.bulk_create(to_create)
+        if to_update:
+            fields = set(update_fields)
+            for source, (target, _normalize) in Customer.NORMALIZED_FIELDS.items():
+                if source in fields:
+                    fields.add(target)
+            Customer.objects.bulk_update(list(to_update.values()), sorted(fields) + ['updated_at', 'version'])
+
+    result.created += len(to_create)
+    result.updated += len(to_update)
+
+
+def import_customers(rows, batch_size=None, update_existing=True, progress=None):
+    """
+    Import (row number, row) pairs as produced by ``read_rows``.
+
+    Existing customers matched by email, phone or tax id are updated with
+    the non-empty values of the row (or skipped if ``update_existing`` is
+    False). ``progress(result)`` is called after each batch.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    result = ImportResult()
+    seen = {}
+    started = time.monotonic()
+
+    batch = []
+    for item in rows:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            _write_batch(batch, result, update_existing, seen)
+            batch = []
+            result.elapsed = time.monotonic() - started
+            if progress:
+                progress(result)
+    if batch:
+        _write_batch(batch, result, update_existing, seen)
+
+    result.elapsed = time.monotonic() - started
+    if result.created or result.updated:
+        # bulk writes skip the post_save signal
+        transaction.on_commit(bump_version)
+    if progress:
+        progress(result)
+    return result
@@ -0,0 +1,225 @@
+"""
+Opt-in request instrumentation for the customers views.
+
+With ``CUSTOMERS_INSTRUMENTATION = True`` every view of this module
+records, per request, its duration, SQL query count and time (through a
+database execute wrapper, so it works without ``DEBUG``), time spent
+serializing the response (where views mark it with ``serializing()``) and
+response size. Samples are kept per endpoint in an in-process ring
+buffer of the last ``CUSTOMERS_INSTRUMENTATION_SAMPLES`` requests,
+summarized as percentiles by ``summary()`` and logged as one
+``key=value`` line per request on the ``customers.instrumentation``
+logger.
+
+Nothing is recorded and no wrapper is installed while disabled. Buffers
+are per process: with several workers each one reports its own requests.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Requests kept per endpoint
+DEFAULT_SAMPLES = 500
+
+PERCENTILES = (50, 95, 99)
+
+METRICS = ('duration_ms', 'queries', 'db_ms', 'serialize_ms', 'bytes')
+
+_buffers = {}
+_lock = threading.Lock()
+
+# Sample of the request being handled, if instrumented
+_current = ContextVar('customers_instrumentation_sample', default=None)
+
+
+def is_enabled():
+    return getattr(settings, 'CUSTOMERS_INSTRUMENTATION', False)
+
+
+def _buffer(endpoint):
+    with _lock:
+        buffer = _buffers.get(endpoint)
+        if buffer is None:
+            size = getattr(settings, 'CUSTOMERS_INSTRUMENTATION_SAMPLES', DEFAULT_SAMPLES)
+            buffer = _buffers[endpoint] = deque(maxlen=size)
+        return buffer
+
+
+class _QueryTimer:
+    """
+    Database execute wrapper adding each query's time to the sample.
+    """
+
+    def __init__(self, sample):
+        self.sample = sample
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sample['queries'] += 1
+            self.sample['db_ms'] += (time.perf_counter() - started) * 1000
+
+
+@contextmanager
+def serializing():
+    """
+    Count the enclosed block as serialization time of the current request.
+    """
+    sample = _current.get()
+    if sample is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        sample['serialize_ms'] += (time.perf_counter() - started) * 1000
+
+
+def _response_size(response):
+    if getattr(response, 'streaming', False):
+        return None
+    return len(response.content)
+
+
+def record(endpoint, sample):
+    """
+    Add a finished request to the endpoint's ring buffer and log it.
+    """
+    _buffer(endpoint).append(sample)
+    logger.info(
+        'endpoint=%s status=%s duration_ms=%.1f queries=%d db_ms=%.1f serialize_ms=%.1f bytes=%s',
+        endpoint, sample['status'], sample['duration_ms'], sample['queries'],
+        sample['db_ms'], sample['serialize_ms'], sample['bytes'],
+        extra={'customers_request': {'endpoint': endpoint, **sample}},
+    )
+
+
+def _new_sample():
+    return {'status': None, 'duration_ms': 0.0, 'queries': 0, 'db_ms': 0.0, 'serialize_ms': 0.0, 'bytes': None}
+
+
+def _wrap_queries(stack, timer):
+    """
+    Install the query timer on this thread's connections until ``stack`` closes.
+    """
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timer))
+
+
+def instrumented(view, endpoint=None):
+    """
+    Wrap a view so its requests are measured while instrumentation is on.
+    """
+    endpoint = endpoint or view.__name__
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not is_enabled():
+                return await view(request, *args, **kwargs)
+
+            sample = _new_sample()
+            token = _current.set(sample)
+            started = time.perf_counter()
+            stack = ExitStack()
+            try:
+                # The async ORM runs queries on the request's sync thread, so
+                # the timer is installed (and removed) there
+                await sync_to_async(_wrap_queries)(stack, _QueryTimer(sample))
+                try:
+                    response = await view(request, *args, **kwargs)
+                finally:
+                    await sync_to_async(stack.close)()
+                sample['status'] = response.status_code
+                sample['bytes'] = _response_size(response)
+                return response
+            finally:
+                sample['duration_ms'] = (time.perf_counter() - started) * 1000
+                _current.reset(token)
+                record(endpoint, sample)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_enabled():
+            return view(request, *args, **kwargs)
+
+        sample = _new_sample()
+        token = _current.set(sample)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                _wrap_queries(stack, _QueryTimer(sample))
+                response = view(request, *args, **kwargs)
+                sample['status'] = response.status_code
+                sample['bytes'] = _response_size(response)
+            return response
+        finally:
+            sample['duration_ms'] = (time.perf_counter() - started) * 1000
+            _current.reset(token)
+            record(endpoint, sample)
+
+    return wrapper
+
+
+def instrument_urlpatterns(urlpatterns):
+    """
+    Wrap the view of every pattern, named after its URL name.
+    """
+    for pattern in urlpatterns:
+        pattern.callback = instrumented(pattern.callback, pattern.name)
+    return urlpatterns
+
+
+def _percentile(ordered, percent):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    rank = max(-(-len(ordered) * percent // 100), 1)
+    return ordered[rank - 1]
+
+
+def summary():
+    """
+    ``{endpoint: {'count': n, metric: {'p50': .., 'p95': .., 'p99': .., 'max': ..}}}``
+    over the requests currently in each buffer.
+    """
+    with _lock:
+        samples = {endpoint: list(buffer) for endpoint, buffer in _buffers.items()}
+
+    result = {}
+    for endpoint, rows in sorted(samples.items()):
+        if not rows:
+            continue
+        stats = {'count': len(rows)}
+        for metric in METRICS:
+            values = sorted(row[metric] for row in rows if row[metric] is not None)
+            if not values:
+                continue
+            stats[metric] = {f'p{percent}': round(_percentile(values, percent), 2) for percent in PERCENTILES}
+            stats[metric]['max'] = round(values[-1], 2)
+        result[endpoint] = stats
+    return result
+
+
+def reset():
+    """
+    Drop every recorded sample.
+    """
+    with _lock:
+        _buffers.clear()
@@ -0,0 +1,279 @@
+"""
+Background jobs: exports, imports and stats/segment rebuilds run off the
+request path.
+
+Jobs are stored in ``CustomerJob`` and executed by a per-process thread
+pool; ``CUSTOMERS_JOBS_MAX_WORKERS`` bounds how many run at once and the
+rest wait in the pool queue. A job is claimed with a conditional UPDATE,
+so the ``run_customer_jobs`` command can also pick up pending jobs (for
+example those queued before a restart) without running any job twice.
+A job left running by a process that died is failed once it has been
+running for longer than ``CUSTOMERS_JOB_TIMEOUT``, so it does not show
+as running forever. Result files are written to ``CUSTOMERS_JOBS_DIR``
+on local disk.
+
+Settings:
+    CUSTOMERS_JOBS_MAX_WORKERS: concurrent jobs per process (default 2).
+    CUSTOMERS_JOBS_DIR: directory for uploads and results
+        (default ``MEDIA_ROOT/customers/jobs``).
+    CUSTOMERS_JOBS_EAGER: run jobs inline when queued (tests, debugging).
+    CUSTOMERS_JOB_TIMEOUT: seconds after which a running job is considered
+        lost (default 6 hours; None never fails running jobs).
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from .exporters import export_rows, export_queryset
+from .importers import read_rows, import_customers
+from .models import Customer, CustomerJob
+from .rfm import rebuild_metrics
+from .stats import rebuild_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_WORKERS = 2
+
+DEFAULT_JOB_TIMEOUT = 6 * 60 * 60
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def job_storage():
+    """
+    Local storage holding job uploads and result files.
+    """
+    location = getattr(settings, 'CUSTOMERS_JOBS_DIR', None)
+    if not location:
+        location = os.path.join(settings.MEDIA_ROOT or '.', 'customers', 'jobs')
+    return FileSystemStorage(location=location)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'CUSTOMERS_JOBS_MAX_WORKERS', DEFAULT_MAX_WORKERS),
+                thread_name_prefix='customer-jobs',
+            )
+        return _executor
+
+
+class Reporter:
+    """
+    Progress callback for job runners; only writes when something changed.
+    """
+
+    def __init__(self, job):
+        self.job = job
+        self.progress = job.progress
+        self.message = job.message
+
+    def __call__(self, progress=None, message=None):
+        progress = self.progress if progress is None else min(max(int(progress), 0), 99)
+        message = self.message if message is None else message[:255]
+        if (progress, message) == (self.progress, self.message):
+            return
+        self.progress, self.message = progress, message
+        try:
+            CustomerJob.objects.filter(pk=self.job.pk).update(progress=progress, message=message)
+        except DatabaseError:
+            # Progress is best effort (e.g. SQLite busy with another job's write)
+            logger.debug('Could not report progress of customer job %s', self.job.pk, exc_info=True)
+
+
+def _percent(done, total):
+    return done * 100 // total if total else 0
+
+
+def run_export(job, report):
+    queryset = export_queryset()
+    total = queryset.count()
+    storage = job_storage()
+    name = f'exports/customers_{job.pk}_{timezone.now().strftime("%Y%m%d")}.csv'
+    path = storage.path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    rows = -1  # header line
+    with open(path, 'w', encoding='utf-8', newline='') as output:
+        for line in export_rows(queryset):
+            output.write(line)
+            rows += 1
+            if rows and rows % 1000 == 0:
+                report(_percent(rows, total), f'{rows} / {total}')
+
+    job.result_file = name
+    return {'rows': rows}
+
+
+def run_import(job, report):
+    storage = job_storage()
+    with storage.open(job.input_file, 'rb') as upload:
+        size = storage.size(job.input_file)
+
+        def progress(result):
+            # Bytes consumed by the parser (buffered, so approximate); the
+            # CSV reader closes the file once it is exhausted
+            done = size if upload.closed else upload.tell()
+            report(_percent(done, size), f'{result.processed}')
+
+        rows = read_rows(upload, job.params.get('filename', job.input_file))
+        result = import_customers(
+            rows,
+            update_existing=job.params.get('update_existing', True),
+            progress=progress,
+        )
+    storage.delete(job.input_file)
+    return result.as_dict()
+
+
+def run_rebuild_stats(job, report):
+    customers = Customer.objects.all()
+    if job.params.get('active_only'):
+        customers = customers.filter(is_active=True)
+    total = customers.count()
+
+    def progress(processed, updated, last_id):
+        report(_percent(processed, total), f'{processed} / {total}')
+
+    processed, updated = rebuild_stats(customers, progress=progress)
+    return {'processed': processed, 'updated': updated}
+
+
+def run_rebuild_metrics(job, report):
+    customers = Customer.objects.all()
+    if job.params.get('active_only'):
+        customers = customers.filter(is_active=True)
+    total = customers.count()
+
+    def progress(processed, written, last_id):
+        report(_percent(processed, total), f'{processed} / {total}')
+
+    processed, written = rebuild_metrics(customers, progress=progress)
+    return {'processed': processed, 'updated': written}
+
+
+RUNNERS = {
+    CustomerJob.KIND_EXPORT: run_export,
+    CustomerJob.KIND_IMPORT: run_import,
+    CustomerJob.KIND_REBUILD_STATS: run_rebuild_stats,
+    CustomerJob.KIND_REBUILD_METRICS: run_rebuild_metrics,
+}
+
+
+def run_job(job_id):
+    """
+    Claim and run a pending job in the current thread.
+
+    Returns the finished job, or None if it was not pending (already
+    claimed by another worker, or unknown).
+    """
+    claimed = CustomerJob.objects.filter(
+        pk=job_id, status=CustomerJob.STATUS_PENDING
+    ).update(status=CustomerJob.STATUS_RUNNING, started_at=timezone.now())
+    if not claimed:
+        return None
+
+    job = CustomerJob.objects.get(pk=job_id)
+    try:
+        result = RUNNERS[job.kind](job, Reporter(job))
+    except Exception as e:
+        logger.exception('Customer job %s failed', job.pk)
+        job.status = CustomerJob.STATUS_FAILED
+        job.error = str(e)
+    else:
+        job.status = CustomerJob.STATUS_COMPLETED
+        job.progress = 100
+        job.message = ''
+        job.result = result
+    job.finished_at = timezone.now()
+    CustomerJob.objects.filter(pk=job.pk).update(
+        status=job.status,
+        progress=job.progress,
+        message=job.message,
+        result=job.result,
+        result_file=job.result_file,
+        error=job.error,
+        finished_at=job.finished_at,
+    )
+    return job
+
+
+def _work(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Worker threads open their own connections; don't leak them
+        connections.close_all()
+
+
+def enqueue(kind, params=None, input_file=''):
+    """
+    Create a job and hand it to the worker pool once the transaction commits.
+    """
+    job = CustomerJob.objects.create(kind=kind, params=params or {}, input_file=input_file)
+    if getattr(settings, 'CUSTOMERS_JOBS_EAGER', False):
+        run_job(job.pk)
+        job.refresh_from_db()
+    else:
+        transaction.on_commit(lambda: get_executor().submit(_work, job.pk))
+    return job
+
+
+def fail_stale_jobs(now=None):
+    """
+    Fail running jobs started more than ``CUSTOMERS_JOB_TIMEOUT`` seconds
+    ago: their worker died (e.g. the process was restarted mid-job).
+
+    Returns the number of jobs failed.
+    """
+    timeout = getattr(settings, 'CUSTOMERS_JOB_TIMEOUT', DEFAULT_JOB_TIMEOUT)
+    if timeout is None:
+        return 0
+    now = now or timezone.now()
+    return CustomerJob.objects.filter(
+        status=CustomerJob.STATUS_RUNNING,
+        started_at__lt=now - timedelta(seconds=timeout),
+    ).update(status=CustomerJob.STATUS_FAILED, error=_('Tiempo de ejecución agotado'), finished_at=now)
+
+
+def run_pending_jobs(limit=None):
+    """
+    Run pending jobs one after another in the current thread, after
+    failing stale running jobs (see ``fail_stale_jobs``).
+
+    Returns the number of jobs run.
+    """
+    fail_stale_jobs()
+    pending = CustomerJob.objects.filter(status=CustomerJob.STATUS_PENDING).order_by('created_at', 'id')
+    job_ids = list(pending.values_list('pk', flat=True)[:limit])
+    return sum(1 for job_id in job_ids if run_job(job_id) is not None)
+
+
+def purge_jobs(days):
+    """
+    Delete finished jobs older than ``days`` together with their files.
+
+    Returns the number of jobs deleted.
+    """
+    storage = job_storage()
+    old = CustomerJob.objects.filter(
+        status__in=[CustomerJob.STATUS_COMPLETED, CustomerJob.STATUS_FAILED],
+        finished_at__lt=timezone.now() - timedelta(days=days),
+    )
+    for name in old.exclude(result_file='').values_list('result_file', flat=True):
+        storage.delete(name)
+    for name in old.exclude(input_file='').values_list('input_file', flat=True):
+        storage.delete(name)
+    return old.delete()[0]
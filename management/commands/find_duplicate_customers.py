@@ -0,0 +1,61 @@
+"""
+List likely duplicate customers.
+
+    python manage.py find_duplicate_customers
+    python manage.py find_duplicate_customers --threshold 0.8 --limit 50
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from customers.dedup import find_duplicates, DUPLICATE_THRESHOLD, MAX_BLOCK_SIZE
+from customers.models import Customer
+
+
+class Command(BaseCommand):
+    help = 'List likely duplicate customers, best matches first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=float, default=DUPLICATE_THRESHOLD,
+            help='Minimum score from 0 to 1 (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--max-block-size', type=int, default=MAX_BLOCK_SIZE,
+            help='Skip blocking keys shared by more customers (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=100,
+            help='Maximum pairs to print (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Include inactive customers'
+        )
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.filter(merged_into__isnull=True)
+        if not options['all']:
+            customers = customers.filter(is_active=True)
+
+        started = time.monotonic()
+        pairs = find_duplicates(
+            customers,
+            threshold=options['threshold'],
+            max_block_size=options['max_block_size'],
+        )
+        elapsed = time.monotonic() - started
+
+        names = dict(
+            Customer.objects.filter(
+                pk__in={customer_id for pair in pairs[:options['limit']] for customer_id in pair[:2]}
+            ).values_list('pk', 'name')
+        )
+        for pair in pairs[:options['limit']]:
+            self.stdout.write(
+                f'{pair.score:.2f}  #{pair.first_id} {names[pair.first_id]}  '
+                f'#{pair.second_id} {names[pair.second_id]}  ({", ".join(pair.reasons)})'
+            )
+
+        self.stdout.write(self.style.SUCCESS(f'{len(pairs)} likely duplicate pairs ({elapsed:.1f}s)'))
@@ -0,0 +1,52 @@
+"""
+Import customers from a CSV or XLSX file.
+
+    python manage.py import_customers customers.csv
+    python manage.py import_customers customers.xlsx --batch-size 2000 --no-update
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from customers.importers import read_rows, import_customers, IMPORT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Import customers from a CSV or XLSX file in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or XLSX file')
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Rows per transaction (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--no-update', action='store_true',
+            help='Skip rows matching existing customers instead of updating them'
+        )
+
+    def handle(self, *args, **options):
+        def progress(result):
+            self.stdout.write(
+                f'{result.processed} rows: {result.created} created, {result.updated} updated, '
+                f'{result.skipped} skipped, {len(result.errors)} errors '
+                f'({result.rows_per_second:.0f} rows/s)'
+            )
+
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                result = import_customers(
+                    read_rows(fileobj, options['path']),
+                    batch_size=options['batch_size'],
+                    update_existing=not options['no_update'],
+                    progress=progress,
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for row, message in result.errors:
+            self.stderr.write(f'Row {row}: {message}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {result.created} created, {result.updated} updated, '
+            f'{result.skipped} skipped, {len(result.errors)} errors'
+        ))
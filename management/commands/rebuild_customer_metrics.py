@@ -0,0 +1,64 @@
+"""
+Recompute RFM scores, segments and churn risk for customers.
+
+    python manage.py rebuild_customer_metrics
+    python manage.py rebuild_customer_metrics --active --batch-size 10000
+    python manage.py rebuild_customer_metrics --start-after 120000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from customers.models import Customer
+from customers.rfm import rebuild_metrics, METRICS_BATCH_SIZE, np
+
+
+class Command(BaseCommand):
+    help = 'Recompute customer RFM segments in batches, writing only changed rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=METRICS_BATCH_SIZE,
+            help='Customers per batch (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--start-after', type=int, default=None,
+            help='Resume after this customer id (printed with each batch)'
+        )
+        parser.add_argument(
+            '--active', action='store_true',
+            help='Only recompute active customers'
+        )
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.all()
+        if options['active']:
+            customers = customers.filter(is_active=True)
+
+        remaining = customers
+        if options['start_after'] is not None:
+            remaining = customers.filter(pk__gt=options['start_after'])
+        total = remaining.count()
+        started = time.monotonic()
+        if np is None:
+            self.stdout.write('NumPy not installed: scoring in pure Python')
+
+        def progress(processed, written, last_id):
+            elapsed = time.monotonic() - started
+            rate = processed / elapsed if elapsed else 0
+            self.stdout.write(
+                f'{processed}/{total} processed, {written} written, '
+                f'last id {last_id} ({rate:.0f} customers/s)'
+            )
+
+        processed, written = rebuild_metrics(
+            customers,
+            batch_size=options['batch_size'],
+            start_after=options['start_after'],
+            progress=progress,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {processed} customers processed, {written} written'
+        ))
@@ -0,0 +1,69 @@
+"""
+Recompute total_spent, visit_count and last_purchase_at for customers
+from their linked sales (``CustomerSale``), and their monthly spend.
+
+    python manage.py rebuild_customer_stats
+    python manage.py rebuild_customer_stats --active --batch-size 5000
+    python manage.py rebuild_customer_stats --start-after 120000
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from customers.models import Customer
+from customers.stats import rebuild_stats, REBUILD_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Recompute customer stats from sales in batched aggregate queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=REBUILD_BATCH_SIZE,
+            help='Customers per batch (default: %(default)s)'
+        )
+        parser.add_argument(
+            '--start-after', type=int, default=None,
+            help='Resume after this customer id (printed with each batch)'
+        )
+        parser.add_argument(
+            '--active', action='store_true',
+            help='Only recompute active customers'
+        )
+        parser.add_argument(
+            '--ids', type=int, nargs='+',
+            help='Only recompute these customer ids'
+        )
+
+    def handle(self, *args, **options):
+        customers = Customer.objects.all()
+        if options['active']:
+            customers = customers.filter(is_active=True)
+        if options['ids']:
+            customers = customers.filter(pk__in=options['ids'])
+
+        remaining = customers
+        if options['start_after'] is not None:
+            remaining = customers.filter(pk__gt=options['start_after'])
+        total = remaining.count()
+        started = time.monotonic()
+
+        def progress(processed, updated, last_id):
+            elapsed = time.monotonic() - started
+            rate = processed / elapsed if elapsed else 0
+            self.stdout.write(
+                f'{processed}/{total} processed, {updated} updated, '
+                f'last id {last_id} ({rate:.0f} customers/s)'
+            )
+
+        processed, updated = rebuild_stats(
+            customers,
+            batch_size=options['batch_size'],
+            start_after=options['start_after'],
+            progress=progress,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Done: {processed} customers processed, {updated} updated'
+        ))
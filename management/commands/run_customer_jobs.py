@@ -0,0 +1,36 @@
+"""
+Run pending customer background jobs in this process.
+
+Useful after a restart (jobs queued in a stopped process stay pending)
+or to run jobs from cron instead of the web process. Jobs left running
+longer than ``CUSTOMERS_JOB_TIMEOUT`` are failed first.
+
+    python manage.py run_customer_jobs
+    python manage.py run_customer_jobs --limit 5 --purge-days 7
+"""
+
+from django.core.management.base import BaseCommand
+
+from customers.jobs import run_pending_jobs, purge_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run pending customer background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Maximum number of jobs to run'
+        )
+        parser.add_argument(
+            '--purge-days', type=int, default=None,
+            help='Also delete finished jobs (and their files) older than this many days'
+        )
+
+    def handle(self, *args, **options):
+        ran = run_pending_jobs(limit=options['limit'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {ran} jobs'))
+
+        if options['purge_days'] is not None:
+            deleted = purge_jobs(options['purge_days'])
+            self.stdout.write(f'Purged {deleted} finished jobs')
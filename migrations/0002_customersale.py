@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 01:35
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSale',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sale_id', models.PositiveBigIntegerField(unique=True, verbose_name='Sale')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10, verbose_name='Total')),
+                ('sold_at', models.DateTimeField(verbose_name='Sold At')),
+                ('completed', models.BooleanField(default=False, verbose_name='Completed')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='customer.customer', verbose_name='Customer')),
+            ],
+            options={
+                'verbose_name': 'Customer Sale',
+                'verbose_name_plural': 'Customer Sales',
+                'indexes': [models.Index(condition=models.Q(('completed', True)), fields=['customer', '-sold_at'], name='customer_sale_completed_idx')],
+            },
+        ),
+    ]
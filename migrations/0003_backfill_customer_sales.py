@@ -0,0 +1,82 @@
+"""
+Link historical sales to customers.
+
+Sales are read in primary-key batches and resolved to a customer the
+same way new sales are (see stats.resolve_customer_id): the sale's own
+customer when it has one, otherwise the only customer with that name.
+Sales whose name is ambiguous or unknown are left unlinked.
+"""
+
+from django.apps import apps as global_apps
+from django.db import migrations
+from django.db.models import Count, Min
+
+BATCH_SIZE = 2000
+
+# Historical models do not carry class constants such as Sale.STATUS_COMPLETED
+STATUS_COMPLETED = 'completed'
+
+SALES_INSTALLED = global_apps.is_installed('sales')
+
+
+def backfill_customer_sales(apps, schema_editor):
+    try:
+        Sale = apps.get_model('sales', 'Sale')
+    except LookupError:
+        # Sales plugin not installed
+        return
+
+    Customer = apps.get_model('customer', 'Customer')
+    CustomerSale = apps.get_model('customer', 'CustomerSale')
+
+    field_names = {field.name for field in Sale._meta.get_fields()}
+    has_customer_fk = 'customer' in field_names
+    columns = ['pk', 'customer_name', 'status', 'total', 'created_at']
+    if has_customer_fk:
+        columns.append('customer_id')
+
+    last_pk = 0
+    while True:
+        sales = list(
+            Sale.objects.filter(pk__gt=last_pk).order_by('pk').values(*columns)[:BATCH_SIZE]
+        )
+        if not sales:
+            break
+        last_pk = sales[-1]['pk']
+
+        names = {sale['customer_name'] for sale in sales if sale['customer_name']}
+        unique_names = dict(
+            Customer.objects.filter(name__in=names)
+            .values('name')
+            .annotate(matches=Count('id'), customer_id=Min('id'))
+            .filter(matches=1)
+            .values_list('name', 'customer_id')
+        )
+
+        links = []
+        for sale in sales:
+            customer_id = sale.get('customer_id') or unique_names.get(sale['customer_name'])
+            if customer_id is None:
+                continue
+            links.append(CustomerSale(
+                customer_id=customer_id,
+                sale_id=sale['pk'],
+                total=sale['total'] or 0,
+                sold_at=sale['created_at'],
+                completed=sale['status'] == STATUS_COMPLETED,
+            ))
+
+        CustomerSale.objects.bulk_create(links, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0002_customersale'),
+    ]
+    if SALES_INSTALLED:
+        dependencies.append(('sales', '__first__'))
+
+    operations = [
+        migrations.RunPython(backfill_customer_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,85 @@
+"""
+Search indexes for customer_list_ajax (see search.py).
+
+PostgreSQL: trigram GIN indexes on UPPER(field), which is what Django's
+icontains compiles to, so '%term%' lookups no longer scan the table.
+SQLite: an FTS5 shadow table with the trigram tokenizer (SQLite 3.34+),
+kept in sync with customer_customer by triggers.
+Other databases are left untouched and search with plain icontains.
+
+The SQL is frozen here as it stood when this migration was written;
+search.install_search_indexes() brings it up to date after migrate.
+"""
+
+import sqlite3
+
+from django.db import migrations, transaction, DatabaseError
+
+SEARCH_FIELDS = ('name', 'phone', 'email', 'tax_id')
+CUSTOMER_TABLE = 'customer_customer'
+FTS_TABLE = 'customer_customer_fts'
+COLUMNS = ', '.join(SEARCH_FIELDS)
+OLD_COLUMNS = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+NEW_COLUMNS = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+
+DELETE_OLD = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {COLUMNS}) VALUES ('delete', old.id, {OLD_COLUMNS});"
+INSERT_NEW = f'INSERT INTO {FTS_TABLE}(rowid, {COLUMNS}) VALUES (new.id, {NEW_COLUMNS});'
+
+SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f'CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {CUSTOMER_TABLE} BEGIN {INSERT_NEW} END',
+    f'{FTS_TABLE}_ad': f'CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {CUSTOMER_TABLE} BEGIN {DELETE_OLD} END',
+    f'{FTS_TABLE}_au': (
+        f'CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {COLUMNS} ON {CUSTOMER_TABLE} '
+        f'BEGIN {DELETE_OLD} {INSERT_NEW} END'
+    ),
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            try:
+                # In a savepoint, so a refusal does not abort the migration
+                with transaction.atomic(using=connection.alias):
+                    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            except DatabaseError:
+                # Search falls back to plain icontains
+                return
+            for field in SEARCH_FIELDS:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS customer_{field}_trgm_idx '
+                    f'ON {CUSTOMER_TABLE} USING gin (UPPER({field}::text) gin_trgm_ops)'
+                )
+        elif connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 34):
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5({COLUMNS}, "
+                f"content='{CUSTOMER_TABLE}', content_rowid='id', tokenize='trigram')"
+            )
+            for name, sql in SQLITE_TRIGGERS.items():
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+                cursor.execute(sql)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for field in SEARCH_FIELDS:
+                cursor.execute(f'DROP INDEX IF EXISTS customer_{field}_trgm_idx')
+        elif connection.vendor == 'sqlite':
+            for name in SQLITE_TRIGGERS:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0003_backfill_customer_sales'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 5.2 on 2026-10-17 01:40
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+# Frozen copies of normalization.py as of this migration
+_NON_DIGITS = re.compile(r'\D')
+_NON_ALNUM = re.compile(r'[^0-9A-Z]')
+_NON_WORD = re.compile(r'[^\w\s]')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_phone(value):
+    digits = _NON_DIGITS.sub('', value or '')
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return digits
+
+
+def normalize_tax_id(value):
+    return _NON_ALNUM.sub('', (value or '').upper())
+
+
+def normalize_name(value):
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    words = _NON_WORD.sub('', stripped.casefold()).replace('_', '')
+    return _SPACES.sub(' ', words).strip()
+
+
+def backfill_normalized_keys(apps, schema_editor):
+    """
+    Fill the normalized search keys of existing customers in batches.
+    """
+    Customer = apps.get_model('customer', 'Customer')
+
+    last_pk = 0
+    while True:
+        batch = list(
+            Customer.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .only('pk', 'name', 'phone', 'tax_id')[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+
+        for customer in batch:
+            customer.name_normalized = normalize_name(customer.name)
+            customer.phone_normalized = normalize_phone(customer.phone)
+            customer.tax_id_normalized = normalize_tax_id(customer.tax_id)
+
+        Customer.objects.bulk_update(
+            batch, ['name_normalized', 'phone_normalized', 'tax_id_normalized']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0004_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='name_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='tax_id_normalized',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+        migrations.RunPython(backfill_normalized_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['name_normalized'], name='customer_cu_name_no_65d37f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['phone_normalized'], name='customer_cu_phone_n_9cf968_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['tax_id_normalized'], name='customer_cu_tax_id__036348_idx'),
+        ),
+    ]
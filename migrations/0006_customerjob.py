@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-17 02:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0005_normalized_search_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('export', 'Export'), ('import', 'Import'), ('rebuild_stats', 'Rebuild Stats')], max_length=20, verbose_name='Kind')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='Status')),
+                ('progress', models.PositiveSmallIntegerField(default=0, verbose_name='Progress')),
+                ('message', models.CharField(blank=True, max_length=255, verbose_name='Message')),
+                ('params', models.JSONField(blank=True, default=dict, verbose_name='Parameters')),
+                ('result', models.JSONField(blank=True, default=dict, verbose_name='Result')),
+                ('input_file', models.CharField(blank=True, max_length=255, verbose_name='Input File')),
+                ('result_file', models.CharField(blank=True, max_length=255, verbose_name='Result File')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Started At')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Finished At')),
+            ],
+            options={
+                'verbose_name': 'Customer Job',
+                'verbose_name_plural': 'Customer Jobs',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['status', '-created_at'], name='customer_job_status_idx')],
+            },
+        ),
+    ]
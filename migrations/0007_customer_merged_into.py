@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-17 02:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0006_customerjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='merged_into',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='merged_customers', to='customer.customer', verbose_name='Merged Into'),
+        ),
+    ]
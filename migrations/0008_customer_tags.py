@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-17 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0007_customer_merged_into'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='Name')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'Customer Tag',
+                'verbose_name_plural': 'Customer Tags',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='tags',
+            field=models.ManyToManyField(blank=True, related_name='customers', to='customer.customertag', verbose_name='Tags'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0008_customer_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Version'),
+        ),
+    ]
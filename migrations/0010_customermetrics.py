@@ -0,0 +1,37 @@
+# Generated by Django 5.2 on 2026-10-17 03:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0009_customer_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customerjob',
+            name='kind',
+            field=models.CharField(choices=[('export', 'Export'), ('import', 'Import'), ('rebuild_stats', 'Rebuild Stats'), ('rebuild_metrics', 'Rebuild Segments')], max_length=20, verbose_name='Kind'),
+        ),
+        migrations.CreateModel(
+            name='CustomerMetrics',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metrics', serialize=False, to='customer.customer', verbose_name='Customer')),
+                ('recency_days', models.PositiveIntegerField(blank=True, null=True, verbose_name='Days Since Last Purchase')),
+                ('recency_score', models.PositiveSmallIntegerField(default=0, verbose_name='Recency Score')),
+                ('frequency_score', models.PositiveSmallIntegerField(default=0, verbose_name='Frequency Score')),
+                ('monetary_score', models.PositiveSmallIntegerField(default=0, verbose_name='Monetary Score')),
+                ('segment', models.CharField(choices=[('champions', 'Champions'), ('loyal', 'Loyal'), ('promising', 'Promising'), ('needs_attention', 'Needs Attention'), ('at_risk', 'At Risk'), ('hibernating', 'Hibernating'), ('no_purchases', 'No Purchases')], default='no_purchases', max_length=20, verbose_name='Segment')),
+                ('churn_risk', models.BooleanField(default=False, verbose_name='Churn Risk')),
+                ('computed_at', models.DateTimeField(verbose_name='Computed At')),
+            ],
+            options={
+                'verbose_name': 'Customer Metrics',
+                'verbose_name_plural': 'Customer Metrics',
+                'indexes': [models.Index(fields=['segment'], name='customer_metrics_segment_idx'), models.Index(condition=models.Q(('churn_risk', True)), fields=['customer'], name='customer_metrics_churn_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2 on 2026-10-17 11:20
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, DateField, Sum
+from django.db.models.functions import TruncMonth
+
+BATCH_SIZE = 2000
+
+
+def backfill_monthly_spend(apps, schema_editor):
+    """
+    Roll up the completed sales of existing customers by month, one
+    grouped aggregate per batch of customers.
+    """
+    Customer = apps.get_model('customer', 'Customer')
+    CustomerSale = apps.get_model('customer', 'CustomerSale')
+    CustomerMonthlySpend = apps.get_model('customer', 'CustomerMonthlySpend')
+
+    last_pk = 0
+    while True:
+        ids = list(
+            Customer.objects.filter(pk__gt=last_pk)
+            .order_by('pk')
+            .values_list('pk', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            break
+        last_pk = ids[-1]
+
+        rows = (
+            CustomerSale.objects.filter(customer_id__in=ids, completed=True)
+            .annotate(bucket=TruncMonth('sold_at', output_field=DateField()))
+            .values('customer_id', 'bucket')
+            .annotate(total=Sum('total'), visits=Count('pk'))
+            .order_by()
+        )
+        CustomerMonthlySpend.objects.bulk_create([
+            CustomerMonthlySpend(
+                customer_id=row['customer_id'],
+                month=row['bucket'],
+                total=row['total'],
+                visits=row['visits'],
+            )
+            for row in rows
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0010_customermetrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerMonthlySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Month')),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Total')),
+                ('visits', models.PositiveIntegerField(default=0, verbose_name='Visits')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_spend', to='customer.customer', verbose_name='Customer')),
+            ],
+            options={
+                'verbose_name': 'Customer Monthly Spend',
+                'verbose_name_plural': 'Customer Monthly Spend',
+                'ordering': ['customer', 'month'],
+                'constraints': [models.UniqueConstraint(fields=('customer', 'month'), name='customer_monthly_spend_unique')],
+            },
+        ),
+        migrations.RunPython(backfill_monthly_spend, migrations.RunPython.noop),
+    ]
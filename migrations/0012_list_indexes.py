@@ -0,0 +1,33 @@
+# Generated by Django 5.2 on 2026-10-17 13:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0011_customermonthlyspend'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customer',
+            name='customer_cu_created_17c50d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at', '-id'], name='customer_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['-created_at', '-id'], name='customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='customer_export_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['is_active', 'created_at', 'visit_count', 'total_spent'], name='customer_counters_idx'),
+        ),
+    ]
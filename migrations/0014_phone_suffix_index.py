@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-17 17:10
+
+from django.db import migrations, models
+from django.db.models.functions import Right
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0013_sync_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(Right('phone_normalized', 9), name='customer_phone_suffix_idx'),
+        ),
+    ]
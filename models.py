@@ -1,8 +1,36 @@
 from django.db import models
+from django.db.models.functions import Right
+from django.db.models.signals import post_save
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from decimal import Decimal
 
+from .cache import get_sales_version
+from .normalization import normalize_name, normalize_phone, normalize_tax_id
+
+
+class ConcurrentEditError(Exception):
+    """
+    The customer was saved by someone else since it was loaded.
+    """
+
+
+class CustomerTag(models.Model):
+    """
+    Free-form label for grouping customers (e.g. "VIP", "Mayorista").
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name=_("Name"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
+
+    class Meta:
+        app_label = 'customer'
+        verbose_name = _("Customer Tag")
+        verbose_name_plural = _("Customer Tags")
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
 
 class Customer(models.Model):
     """
@@ -20,6 +48,11 @@ class Customer(models.Model):
         help_text=_("DNI/NIF/CIF/VAT Number")
     )
 
+    # Normalized search keys (maintained on save, see normalization.py)
+    name_normalized = models.CharField(max_length=255, blank=True, editable=False)
+    phone_normalized = models.CharField(max_length=20, blank=True, editable=False)
+    tax_id_normalized = models.CharField(max_length=50, blank=True, editable=False)
+
     # Calculated Fields (updated via signals or methods)
     total_spent = models.DecimalField(
         max_digits=10,
@@ -31,10 +64,28 @@ class Customer(models.Model):
 
     # Metadata
     notes = models.TextField(blank=True, verbose_name=_("Notes"))
+    tags = models.ManyToManyField(
+        CustomerTag,
+        blank=True,
+        related_name='customers',
+        verbose_name=_("Tags")
+    )
     is_active = models.BooleanField(default=True, verbose_name=_("Active"))
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated At"))
     last_purchase_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Last Purchase"))
+    # Bumped by save_changes(); stats updates leave it alone
+    version = models.PositiveIntegerField(default=1, editable=False, verbose_name=_("Version"))
+    # Set when this customer was merged into another (see dedup.merge_customers)
+    merged_into = models.ForeignKey(
+        'self',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name='merged_customers',
+        verbose_name=_("Merged Into")
+    )
 
     class Meta:
         app_label = 'customer'
@@ -45,38 +96,154 @@ class Customer(models.Model):
             models.Index(fields=['name']),
             models.Index(fields=['phone']),
             models.Index(fields=['email']),
-            models.Index(fields=['-created_at']),
+            models.Index(fields=['name_normalized']),
+            models.Index(fields=['phone_normalized']),
+            # Typeahead fallback: numbers typed without the country code
+            # (see typeahead.PHONE_SUFFIX_DIGITS)
+            models.Index(Right('phone_normalized', 9), name='customer_phone_suffix_idx'),
+            models.Index(fields=['tax_id_normalized']),
+            # List API pages in keyset order (see pagination.DEFAULT_ORDER), active-only and all
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_active=True),
+                name='customer_active_created_idx'
+            ),
+            models.Index(fields=['-created_at', '-id'], name='customer_created_idx'),
+            # Export: active customers by name
+            models.Index(
+                fields=['name'],
+                condition=models.Q(is_active=True),
+                name='customer_export_name_idx'
+            ),
+            # Delta sync feed and typeahead catch-up, in (updated_at, id) order
+            models.Index(fields=['updated_at', 'id'], name='customer_updated_idx'),
+            # Dashboard counters read only these columns (covering index scan)
+            models.Index(
+                fields=['is_active', 'created_at', 'visit_count', 'total_spent'],
+                name='customer_counters_idx'
+            ),
         ]
 
+    # Source field -> normalized field, normalizer
+    NORMALIZED_FIELDS = {
+        'name': ('name_normalized', normalize_name),
+        'phone': ('phone_normalized', normalize_phone),
+        'tax_id': ('tax_id_normalized', normalize_tax_id),
+    }
+
+    # Maintained from sales (see stats.py), never by edits
+    STATS_FIELDS = ['total_spent', 'visit_count', 'last_purchase_at']
+
     def __str__(self):
         return self.name
 
-    def update_stats(self):
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Snapshot for get_dirty_fields()
+        instance._loaded_values = {
+            name: value for name, value in zip(field_names, values)
+            if value is not models.DEFERRED
+        }
+        return instance
+
+    def get_dirty_fields(self):
         """
-        Update calculated fields (total_spent, visit_count, last_purchase_at).
-        Call this method after a sale is completed.
+        Names of the loaded fields whose value changed since loading.
         """
-        # Import here to avoid circular imports
-        try:
-            from sales.models import Sale
-            sales = Sale.objects.filter(
-                customer_name=self.name,  # Match by name (simplified)
-                status=Sale.STATUS_COMPLETED
-            )
+        loaded = getattr(self, '_loaded_values', {})
+        return {name for name, value in loaded.items() if getattr(self, name) != value}
+
+    def normalize_fields(self):
+        """
+        Refresh the normalized search keys. Called by save(); call it
+        explicitly before bulk_create()/bulk_update(), which skip save().
+        """
+        for source, (target, normalize) in self.NORMALIZED_FIELDS.items():
+            setattr(self, target, normalize(getattr(self, source)))
 
-            self.visit_count = sales.count()
-            self.total_spent = sales.aggregate(
-                total=models.Sum('total')
-            )['total'] or Decimal('0.00')
+    def save(self, *args, **kwargs):
+        self.normalize_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            for source, (target, _normalize) in self.NORMALIZED_FIELDS.items():
+                if source in update_fields:
+                    update_fields.add(target)
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
 
-            last_sale = sales.order_by('-created_at').first()
-            if last_sale:
-                self.last_purchase_at = last_sale.created_at
+        saved = update_fields or [field.attname for field in self._meta.concrete_fields]
+        loaded = self.__dict__.setdefault('_loaded_values', {})
+        for name in saved:
+            attname = self._meta.get_field(name).attname
+            loaded[attname] = getattr(self, attname)
 
+    def save_changes(self, expected_version=None):
+        """
+        Write only the fields changed since the customer was loaded.
+
+        The UPDATE is conditional on the row's ``version`` still being
+        ``expected_version`` (by default, the version loaded); if another
+        user saved in between, ConcurrentEditError is raised and nothing
+        is written. Stats columns are never written here, so edits cannot
+        overwrite totals updated concurrently by sales.
+
+        Returns the set of fields written (empty if nothing changed).
+        """
+        if self._state.adding:
             self.save()
-        except ImportError:
-            # Sales plugin not installed
-            pass
+            return {field.name for field in self._meta.concrete_fields}
+
+        self.normalize_fields()
+        changed = self.get_dirty_fields() - set(self.STATS_FIELDS)
+        if not changed:
+            return set()
+
+        if expected_version is None:
+            expected_version = self._loaded_values.get('version', self.version)
+        updated_at = timezone.now()
+        values = {name: getattr(self, name) for name in changed - {'version', 'updated_at'}}
+        updated = (
+            type(self)._base_manager.using(self._state.db)
+            .filter(pk=self.pk, version=expected_version)
+            .update(**values, version=expected_version + 1, updated_at=updated_at)
+        )
+        if not updated:
+            raise ConcurrentEditError(self.pk)
+
+        self.version = expected_version + 1
+        self.updated_at = updated_at
+        update_fields = changed | {'version', 'updated_at'}
+        for name in update_fields:
+            self._loaded_values[name] = getattr(self, name)
+        # update() skips save(); cache and typeahead listeners expect post_save
+        post_save.send(
+            sender=type(self), instance=self, created=False, update_fields=frozenset(update_fields),
+            raw=False, using=self._state.db,
+        )
+        return update_fields
+
+    def update_stats(self):
+        """
+        Recalculate stats (total_spent, visit_count, last_purchase_at) from
+        scratch. Sales keep them up to date incrementally (see stats.py);
+        use this only to repair a customer whose stats have drifted. Its
+        monthly spend buckets are rebuilt too.
+        """
+        from .stats import rebuild_monthly_spend
+
+        totals = self.sales.filter(completed=True).aggregate(
+            total=models.Sum('total'),
+            visits=models.Count('id'),
+            last=models.Max('sold_at'),
+        )
+
+        self.total_spent = totals['total'] or Decimal('0.00')
+        self.visit_count = totals['visits']
+        self.last_purchase_at = totals['last']
+        self.save(update_fields=self.STATS_FIELDS)
+        rebuild_monthly_spend([self.pk])
 
     def get_recent_purchases(self, limit=10):
         """
@@ -84,13 +251,26 @@ class Customer(models.Model):
         """
         try:
             from sales.models import Sale
-            return Sale.objects.filter(
-                customer_name=self.name,
-                status=Sale.STATUS_COMPLETED
-            ).order_by('-created_at')[:limit]
         except ImportError:
             return []
 
+        sale_ids = list(
+            self.sales.filter(completed=True)
+            .order_by('-sold_at')
+            .values_list('sale_id', flat=True)[:limit]
+        )
+        if not sale_ids:
+            return []
+        return Sale.objects.filter(pk__in=sale_ids).order_by('-created_at')
+
+    @property
+    def sales_version(self):
+        """
+        Token that changes whenever this customer's sales or stats change,
+        used to key cached fragments of purchase data.
+        """
+        return get_sales_version(self.pk)
+
     @property
     def average_purchase(self):
         """
@@ -99,3 +279,214 @@ class Customer(models.Model):
         if self.visit_count > 0:
             return self.total_spent / self.visit_count
         return Decimal('0.00')
+
+
+class CustomerSale(models.Model):
+    """
+    Link between a customer and a sale from the Sales module.
+
+    Sales are resolved to a customer when first seen, so purchase history
+    and stats are keyed by customer id rather than by name; the link only
+    moves if the sale is reassigned to another customer.
+    """
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='sales',
+        verbose_name=_("Customer")
+    )
+    sale_id = models.PositiveBigIntegerField(unique=True, verbose_name=_("Sale"))
+    total = models.DecimalField(
+        max_digits=10,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name=_("Total")
+    )
+    sold_at = models.DateTimeField(verbose_name=_("Sold At"))
+    completed = models.BooleanField(default=False, verbose_name=_("Completed"))
+
+    class Meta:
+        app_label = 'customer'
+        verbose_name = _("Customer Sale")
+        verbose_name_plural = _("Customer Sales")
+        indexes = [
+            # Purchase history and stats only ever read completed sales
+            models.Index(
+                fields=['customer', '-sold_at'],
+                condition=models.Q(completed=True),
+                name='customer_sale_completed_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.customer_id} - {self.sale_id}'
+
+
+class CustomerMonthlySpend(models.Model):
+    """
+    Completed sales of a customer in one calendar month, kept up to date
+    as sales are completed, refunded or deleted (see ``stats.sync_sale``)
+    so spending charts read a few buckets instead of the whole history.
+    """
+    customer = models.ForeignKey(
+        Customer,
+        on_delete=models.CASCADE,
+        related_name='monthly_spend',
+        verbose_name=_("Customer")
+    )
+    # First day of the month, in the local timezone
+    month = models.DateField(verbose_name=_("Month"))
+    total = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal('0.00'),
+        verbose_name=_("Total")
+    )
+    visits = models.PositiveIntegerField(default=0, verbose_name=_("Visits"))
+
+    class Meta:
+        app_label = 'customer'
+        verbose_name = _("Customer Monthly Spend")
+        verbose_name_plural = _("Customer Monthly Spend")
+        ordering = ['customer', 'month']
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'month'], name='customer_monthly_spend_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.customer_id} - {self.month:%Y-%m}'
+
+    @property
+    def average_ticket(self):
+        if self.visits > 0:
+            return self.total / self.visits
+        return Decimal('0.00')
+
+
+class CustomerMetrics(models.Model):
+    """
+    Precomputed RFM (recency, frequency, monetary) scores and segment of a
+    customer, rebuilt in batches by ``rfm.rebuild_metrics``.
+
+    Scores are quintiles from 1 (worst) to 5 (best) among customers with
+    purchases; customers without purchases score 0.
+    """
+    SEGMENT_CHAMPIONS = 'champions'
+    SEGMENT_LOYAL = 'loyal'
+    SEGMENT_PROMISING = 'promising'
+    SEGMENT_NEEDS_ATTENTION = 'needs_attention'
+    SEGMENT_AT_RISK = 'at_risk'
+    SEGMENT_HIBERNATING = 'hibernating'
+    SEGMENT_NO_PURCHASES = 'no_purchases'
+    SEGMENT_CHOICES = [
+        (SEGMENT_CHAMPIONS, _("Champions")),
+        (SEGMENT_LOYAL, _("Loyal")),
+        (SEGMENT_PROMISING, _("Promising")),
+        (SEGMENT_NEEDS_ATTENTION, _("Needs Attention")),
+        (SEGMENT_AT_RISK, _("At Risk")),
+        (SEGMENT_HIBERNATING, _("Hibernating")),
+        (SEGMENT_NO_PURCHASES, _("No Purchases")),
+    ]
+
+    customer = models.OneToOneField(
+        Customer,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='metrics',
+        verbose_name=_("Customer")
+    )
+    recency_days = models.PositiveIntegerField(null=True, blank=True, verbose_name=_("Days Since Last Purchase"))
+    recency_score = models.PositiveSmallIntegerField(default=0, verbose_name=_("Recency Score"))
+    frequency_score = models.PositiveSmallIntegerField(default=0, verbose_name=_("Frequency Score"))
+    monetary_score = models.PositiveSmallIntegerField(default=0, verbose_name=_("Monetary Score"))
+    segment = models.CharField(
+        max_length=20,
+        choices=SEGMENT_CHOICES,
+        default=SEGMENT_NO_PURCHASES,
+        verbose_name=_("Segment")
+    )
+    churn_risk = models.BooleanField(default=False, verbose_name=_("Churn Risk"))
+    computed_at = models.DateTimeField(verbose_name=_("Computed At"))
+
+    class Meta:
+        app_label = 'customer'
+        verbose_name = _("Customer Metrics")
+        verbose_name_plural = _("Customer Metrics")
+        indexes = [
+            models.Index(fields=['segment'], name='customer_metrics_segment_idx'),
+            models.Index(
+                fields=['customer'],
+                condition=models.Q(churn_risk=True),
+                name='customer_metrics_churn_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.customer_id} - {self.rfm}'
+
+    @property
+    def rfm(self):
+        return f'{self.recency_score}{self.frequency_score}{self.monetary_score}'
+
+
+class CustomerJob(models.Model):
+    """
+    Long-running operation (export, import, stats rebuild) run off the
+    request path by the background worker in ``jobs``.
+    """
+    KIND_EXPORT = 'export'
+    KIND_IMPORT = 'import'
+    KIND_REBUILD_STATS = 'rebuild_stats'
+    KIND_REBUILD_METRICS = 'rebuild_metrics'
+    KIND_CHOICES = [
+        (KIND_EXPORT, _("Export")),
+        (KIND_IMPORT, _("Import")),
+        (KIND_REBUILD_STATS, _("Rebuild Stats")),
+        (KIND_REBUILD_METRICS, _("Rebuild Segments")),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, _("Pending")),
+        (STATUS_RUNNING, _("Running")),
+        (STATUS_COMPLETED, _("Completed")),
+        (STATUS_FAILED, _("Failed")),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name=_("Kind"))
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name=_("Status")
+    )
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name=_("Progress"))
+    message = models.CharField(max_length=255, blank=True, verbose_name=_("Message"))
+    params = models.JSONField(default=dict, blank=True, verbose_name=_("Parameters"))
+    result = models.JSONField(default=dict, blank=True, verbose_name=_("Result"))
+    # Names inside the jobs storage (see jobs.job_storage)
+    input_file = models.CharField(max_length=255, blank=True, verbose_name=_("Input File"))
+    result_file = models.CharField(max_length=255, blank=True, verbose_name=_("Result File"))
+    error = models.TextField(blank=True, verbose_name=_("Error"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created At"))
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Started At"))
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Finished At"))
+
+    class Meta:
+        app_label = 'customer'
+        verbose_name = _("Customer Job")
+        verbose_name_plural = _("Customer Jobs")
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['status', '-created_at'], name='customer_job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.pk} ({self.status})'
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_COMPLETED, self.STATUS_FAILED)
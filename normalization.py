@@ -0,0 +1,100 @@
+"""
+Normalized search keys for customers.
+
+Free-text contact fields are reduced to canonical forms so they can be
+matched with anchored prefix lookups on a B-tree index:
+
+- phone: digits only, international "00" prefix dropped ("+34 600-12" -> "3460012")
+- tax id: uppercase letters and digits ("x-1234567 l" -> "X1234567L")
+- name: casefolded, accents and punctuation removed ("José-Luis" -> "joseluis")
+
+``phonetic_key`` further reduces a normalized name to a sound-alike key
+used to block candidate duplicates (see dedup.py).
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+
+_NON_DIGITS = re.compile(r'\D')
+_NON_ALNUM = re.compile(r'[^0-9A-Z]')
+_NON_WORD = re.compile(r'[^\w\s]')
+_SPACES = re.compile(r'\s+')
+_PHONE_LIKE = re.compile(r'^[\d\s+\-().]+$')
+
+
+def normalize_phone(value):
+    digits = _NON_DIGITS.sub('', value or '')
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return digits
+
+
+def normalize_tax_id(value):
+    return _NON_ALNUM.sub('', (value or '').upper())
+
+
+def normalize_name(value):
+    decomposed = unicodedata.normalize('NFKD', value or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    words = _NON_WORD.sub('', stripped.casefold()).replace('_', '')
+    return _SPACES.sub(' ', words).strip()
+
+
+def looks_like_phone(value):
+    """
+    Whether a search term is made only of phone number characters.
+    """
+    return bool(_PHONE_LIKE.match(value))
+
+
+def prefix_lookup(field, prefix):
+    """
+    Q for ``field`` starting with ``prefix`` that a plain B-tree index can serve.
+
+    The range bounds the index scan on every database; ``startswith``
+    keeps the result exact whatever the column collation.
+    """
+    from django.db.models import Q
+
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return Q(**{
+        f'{field}__gte': prefix,
+        f'{field}__lt': upper,
+        f'{field}__startswith': prefix,
+    })
+
+
+# Spanish-oriented sound rules, applied in order to each normalized word
+_PHONETIC_RULES = [
+    (re.compile(r'ch'), 'x'),
+    (re.compile(r'qu'), 'k'),
+    (re.compile(r'gu(?=[ei])'), 'g'),
+    (re.compile(r'g(?=[ei])'), 'j'),
+    (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'll'), 'y'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'y$'), 'i'),
+    (re.compile(r'[cq]'), 'k'),
+    (re.compile(r'z'), 's'),
+    (re.compile(r'[vw]'), 'b'),
+    (re.compile(r'h'), ''),
+]
+_REPEATS = re.compile(r'(.)\1+')
+_VOWELS = re.compile(r'[aeiou]')
+
+
+@lru_cache(maxsize=65536)
+def phonetic_word(word):
+    for pattern, replacement in _PHONETIC_RULES:
+        word = pattern.sub(replacement, word)
+    word = _REPEATS.sub(r'\1', word)
+    return word[:1] + _VOWELS.sub('', word[1:])
+
+
+def phonetic_key(name):
+    """
+    Sound-alike key of a normalized name, insensitive to word order
+    ("garcia lopez ana" and "ana lopes garsia" -> "an grs lps").
+    """
+    return ' '.join(sorted(filter(None, map(phonetic_word, name.split()))))
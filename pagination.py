@@ -0,0 +1,103 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with a WHERE clause on the last row seen instead of an
+OFFSET, so every page costs the same index range scan as the first one.
+Rows are ordered by descending keys, by default (created_at, id); the
+last key must be unique. Cursors are opaque URL-safe strings.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+DEFAULT_ORDER = ('-created_at', '-id')
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded."""
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+def encode_cursor(values):
+    """
+    Encode the key values of a row as an opaque cursor.
+    """
+    raw = json.dumps(list(values), default=_json_default, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    Decode a cursor into a list of ``size`` key values.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(cursor) from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
+
+
+def _after(fields, values):
+    """
+    Build the WHERE clause selecting rows after ``values`` in descending order.
+    """
+    query = Q()
+    for i, field in enumerate(fields):
+        equal = {f: v for f, v in zip(fields[:i], values[:i])}
+        query |= Q(**equal, **{f'{field}__lt': values[i]})
+    return query
+
+
+def _page_queryset(queryset, cursor, limit, order):
+    fields = [key.lstrip('-') for key in order]
+    queryset = queryset.order_by(*order)
+    if cursor:
+        try:
+            queryset = queryset.filter(_after(fields, decode_cursor(cursor, len(fields))))
+        except (TypeError, ValueError, ValidationError) as e:
+            raise InvalidCursor(cursor) from e
+    return queryset[:limit + 1]
+
+
+def _page(rows, limit, order):
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last = rows[-1]
+    fields = [key.lstrip('-') for key in order]
+    if isinstance(last, dict):
+        return rows, encode_cursor(last[field] for field in fields)
+    return rows, encode_cursor(getattr(last, field) for field in fields)
+
+
+def paginate(queryset, cursor=None, limit=100, order=DEFAULT_ORDER):
+    """
+    Return ``(rows, next_cursor)`` for the page after ``cursor``.
+
+    ``order`` lists descending keys (``'-field'``). Rows may be model
+    instances or ``values()`` dicts that include the keys. ``next_cursor``
+    is None on the last page.
+    """
+    rows = list(_page_queryset(queryset, cursor, limit, order))
+    return _page(rows, limit, order)
+
+
+async def apaginate(queryset, cursor=None, limit=100, order=DEFAULT_ORDER):
+    """
+    Async ``paginate()``.
+    """
+    rows = [row async for row in _page_queryset(queryset, cursor, limit, order)]
+    return _page(rows, limit, order)
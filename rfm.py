@@ -0,0 +1,251 @@
+"""
+RFM segmentation: recency, frequency and monetary scores per customer.
+
+Scores are quintiles (1-5, 5 best) of days since the last purchase,
+visit count and total spent among active customers with purchases, and
+are stored in ``CustomerMetrics`` so lists can filter by segment or churn
+risk through an index instead of computing them over every customer.
+
+``rebuild_metrics`` first reads the three stats columns once to find the
+quintile cut points, then walks customers in primary-key order in
+batches, scoring each batch column-wise (with NumPy when installed) and
+writing only the rows whose scores changed, so a nightly run costs
+writes proportional to what moved rather than to the table size.
+
+Metrics are eventually consistent: scores are relative to every other
+customer, so they are not updated on each sale or new customer. A
+customer created or changed since the last rebuild keeps its previous
+segment (new ones have none and match no segment filter) until the next
+``rebuild_metrics`` run.
+"""
+
+from bisect import bisect_left
+from collections import namedtuple
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import Customer, CustomerMetrics
+
+try:
+    import numpy as np
+except ImportError:  # optional speed-up
+    np = None
+
+# Customers scored per batch
+METRICS_BATCH_SIZE = 5000
+
+# Repeat customers without a purchase for longer than this are at risk
+DEFAULT_CHURN_RISK_DAYS = 90
+
+QUINTILES = (0.2, 0.4, 0.6, 0.8)
+
+# Columns compared to decide whether a metrics row needs writing
+SCORE_FIELDS = ['recency_days', 'recency_score', 'frequency_score', 'monetary_score', 'segment', 'churn_risk']
+
+Thresholds = namedtuple('Thresholds', 'recency frequency monetary')
+
+
+def churn_risk_days():
+    return getattr(settings, 'CUSTOMERS_CHURN_RISK_DAYS', DEFAULT_CHURN_RISK_DAYS)
+
+
+def segment_for(recency, frequency):
+    """
+    Segment label from the recency and frequency scores.
+    """
+    if not recency:
+        return CustomerMetrics.SEGMENT_NO_PURCHASES
+    if recency >= 4 and frequency >= 4:
+        return CustomerMetrics.SEGMENT_CHAMPIONS
+    if recency >= 3 and frequency >= 3:
+        return CustomerMetrics.SEGMENT_LOYAL
+    if recency >= 4:
+        return CustomerMetrics.SEGMENT_PROMISING
+    if frequency >= 3:
+        return CustomerMetrics.SEGMENT_AT_RISK
+    if recency <= 2:
+        return CustomerMetrics.SEGMENT_HIBERNATING
+    return CustomerMetrics.SEGMENT_NEEDS_ATTENTION
+
+
+def _quantiles(values):
+    """
+    Linear-interpolated quintile cut points (same as numpy.quantile).
+    """
+    values = sorted(values)
+    last = len(values) - 1
+    cuts = []
+    for q in QUINTILES:
+        position = q * last
+        low = int(position)
+        high = min(low + 1, last)
+        cuts.append(values[low] + (values[high] - values[low]) * (position - low))
+    return tuple(cuts)
+
+
+def compute_thresholds(now=None, batch_size=None):
+    """
+    Quintile cut points of recency (days), frequency and monetary among
+    active customers with purchases, or None if nobody has purchased.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or METRICS_BATCH_SIZE
+    rows = (
+        Customer.objects.filter(is_active=True, visit_count__gt=0, last_purchase_at__isnull=False)
+        .order_by()
+        .values_list('last_purchase_at', 'visit_count', 'total_spent')
+        .iterator(chunk_size=batch_size)
+    )
+
+    recency, frequency, monetary = [], [], []
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        days = [(now - last).days for last, _visits, _spent in batch]
+        visits = [row[1] for row in batch]
+        spent = [float(row[2]) for row in batch]
+        if np is not None:
+            # Keep compact arrays rather than Python objects for big tables
+            recency.append(np.asarray(days, dtype=np.float64))
+            frequency.append(np.asarray(visits, dtype=np.float64))
+            monetary.append(np.asarray(spent, dtype=np.float64))
+        else:
+            recency.extend(days)
+            frequency.extend(visits)
+            monetary.extend(spent)
+
+    if not recency:
+        return None
+    if np is not None:
+        return Thresholds(*(
+            tuple(np.quantile(np.concatenate(column), QUINTILES))
+            for column in (recency, frequency, monetary)
+        ))
+    return Thresholds(_quantiles(recency), _quantiles(frequency), _quantiles(monetary))
+
+
+def _score_python(rows, thresholds, now):
+    risk_days = churn_risk_days()
+    scores = []
+    for _pk, last, visits, spent in rows:
+        if not visits or last is None:
+            scores.append((None, 0, 0, 0, CustomerMetrics.SEGMENT_NO_PURCHASES, False))
+            continue
+        days = (now - last).days
+        recency = 5 - bisect_left(thresholds.recency, days)
+        frequency = 1 + bisect_left(thresholds.frequency, visits)
+        monetary = 1 + bisect_left(thresholds.monetary, float(spent))
+        churn = visits >= 2 and days > risk_days
+        scores.append((days, recency, frequency, monetary, segment_for(recency, frequency), churn))
+    return scores
+
+
+def _score_numpy(rows, thresholds, now):
+    risk_days = churn_risk_days()
+    bought = np.array([bool(visits) and last is not None for _pk, last, visits, _spent in rows])
+    days = np.array([(now - last).days if last is not None else 0 for _pk, last, _visits, _spent in rows])
+    visits = np.array([visits for _pk, _last, visits, _spent in rows])
+    spent = np.array([float(spent) for _pk, _last, _visits, spent in rows])
+
+    recency = np.where(bought, 5 - np.searchsorted(thresholds.recency, days, side='left'), 0)
+    frequency = np.where(bought, 1 + np.searchsorted(thresholds.frequency, visits, side='left'), 0)
+    monetary = np.where(bought, 1 + np.searchsorted(thresholds.monetary, spent, side='left'), 0)
+    segments = np.select(
+        [
+            ~bought,
+            (recency >= 4) & (frequency >= 4),
+            (recency >= 3) & (frequency >= 3),
+            recency >= 4,
+            frequency >= 3,
+            recency <= 2,
+        ],
+        [
+            CustomerMetrics.SEGMENT_NO_PURCHASES,
+            CustomerMetrics.SEGMENT_CHAMPIONS,
+            CustomerMetrics.SEGMENT_LOYAL,
+            CustomerMetrics.SEGMENT_PROMISING,
+            CustomerMetrics.SEGMENT_AT_RISK,
+            CustomerMetrics.SEGMENT_HIBERNATING,
+        ],
+        default=CustomerMetrics.SEGMENT_NEEDS_ATTENTION,
+    )
+    churn = bought & (visits >= 2) & (days > risk_days)
+
+    return [
+        (int(d) if b else None, int(r), int(f), int(m), str(s), bool(c))
+        for b, d, r, f, m, s, c in zip(bought, days, recency, frequency, monetary, segments, churn)
+    ]
+
+
+def score_rows(rows, thresholds, now):
+    """
+    Score ``(pk, last_purchase_at, visit_count, total_spent)`` rows.
+
+    Returns ``(recency_days, recency, frequency, monetary, segment,
+    churn_risk)`` tuples in the same order.
+    """
+    if thresholds is None:
+        return [(None, 0, 0, 0, CustomerMetrics.SEGMENT_NO_PURCHASES, False)] * len(rows)
+    if np is not None:
+        return _score_numpy(rows, thresholds, now)
+    return _score_python(rows, thresholds, now)
+
+
+def rebuild_metrics(customers=None, batch_size=None, start_after=None, progress=None, now=None):
+    """
+    Recompute the metrics of ``customers`` (all by default) in batches.
+
+    Each batch costs one SELECT of the stats columns, one SELECT of the
+    existing metrics and at most one bulk INSERT and one bulk UPDATE of
+    the rows that changed. ``progress(processed, written, last_id)`` is
+    called after each batch; pass ``start_after`` to resume.
+
+    Returns a ``(processed, written)`` tuple.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or METRICS_BATCH_SIZE
+    if customers is None:
+        customers = Customer.objects.all()
+    thresholds = compute_thresholds(now, batch_size)
+
+    rows = customers.order_by('pk').values_list('pk', 'last_purchase_at', 'visit_count', 'total_spent')
+    processed = written = 0
+    last_id = start_after
+    while True:
+        batch = list((rows.filter(pk__gt=last_id) if last_id is not None else rows)[:batch_size])
+        if not batch:
+            break
+
+        existing = CustomerMetrics.objects.in_bulk([row[0] for row in batch])
+        to_create, to_update = [], []
+        for row, values in zip(batch, score_rows(batch, thresholds, now)):
+            metrics = existing.get(row[0])
+            if metrics is None:
+                to_create.append(CustomerMetrics(customer_id=row[0], computed_at=now, **dict(zip(SCORE_FIELDS, values))))
+            elif tuple(getattr(metrics, field) for field in SCORE_FIELDS) != values:
+                for field, value in zip(SCORE_FIELDS, values):
+                    setattr(metrics, field, value)
+                metrics.computed_at = now
+                to_update.append(metrics)
+
+        with transaction.atomic():
+            if to_create:
+                CustomerMetrics.objects.bulk_create(to_create, batch_size=batch_size)
+            if to_update:
+                CustomerMetrics.objects.bulk_update(to_update, SCORE_FIELDS + ['computed_at'], batch_size=batch_size)
+
+        processed += len(batch)
+        written += len(to_create) + len(to_update)
+        last_id = batch[-1][0]
+        if progress:
+            progress(processed, written, last_id)
+
+    if written:
+        # Cached lists may be filtered by segment
+        transaction.on_commit(bump_version)
+    return processed, written
@@ -0,0 +1,278 @@
+"""
+Pluggable customer search backends.
+
+The backend is picked from the database vendor (or the
+``CUSTOMERS_SEARCH_BACKEND`` setting, a dotted path):
+
+- PostgreSQL: substring match served by trigram GIN indexes (pg_trgm),
+  ranked by trigram similarity. If the pg_trgm extension cannot be
+  created (e.g. the database user lacks the privilege), plain
+  ``icontains`` is used instead.
+- SQLite: an FTS5 shadow table with the trigram tokenizer, kept in sync
+  by triggers, ranked by where the term matches.
+- Anything else: plain ``icontains`` (sequential scan).
+
+Every backend also matches anchored prefixes of the normalized name,
+phone and tax id (see normalization.py), which plain B-tree indexes
+serve, so "+34 600-12" finds "+34600123456".
+
+Indexes and the FTS table are created by ``install_search_indexes()``,
+run by migration 0004 and again after every ``migrate`` (SQLite drops
+the sync triggers whenever a migration rebuilds the customer table).
+"""
+
+import logging
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from django.db.models import Q, Case, When, Value, IntegerField, FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .normalization import (
+    normalize_name, normalize_phone, normalize_tax_id, looks_like_phone, prefix_lookup
+)
+
+SEARCH_FIELDS = ('name', 'phone', 'email', 'tax_id')
+
+CUSTOMER_TABLE = 'customer_customer'
+
+FTS_TABLE = 'customer_customer_fts'
+
+logger = logging.getLogger(__name__)
+
+
+class SearchBackend:
+    """
+    Case-insensitive substring search over name, phone, email and tax id.
+    """
+
+    def search(self, queryset, term):
+        """
+        Return ``(queryset, order)``: matching customers annotated with
+        ``search_rank`` and the ordering keys for cursor pagination.
+        """
+        queryset = self.filter(queryset, term).annotate(search_rank=self.rank(term))
+        return queryset, ('-search_rank', '-id')
+
+    def filter(self, queryset, term):
+        return queryset.filter(self.contains_query(term) | self.prefix_query(term))
+
+    def contains_query(self, term):
+        """
+        Q matching the term anywhere in the searched fields.
+        """
+        query = Q()
+        for field in SEARCH_FIELDS:
+            query |= Q(**{f'{field}__icontains': term})
+        return query
+
+    def prefix_query(self, term):
+        """
+        Q matching normalized name, phone or tax id starting with the term.
+        """
+        query = Q()
+        name = normalize_name(term)
+        if name:
+            query |= prefix_lookup('name_normalized', name)
+        if looks_like_phone(term):
+            phone = normalize_phone(term)
+            if phone:
+                query |= prefix_lookup('phone_normalized', phone)
+        tax_id = normalize_tax_id(term)
+        if tax_id and any(char.isdigit() for char in tax_id):
+            query |= prefix_lookup('tax_id_normalized', tax_id)
+        return query
+
+    def rank(self, term):
+        """
+        Score a match: exact name, name prefix, other field prefix, anywhere.
+        """
+        name = normalize_name(term)
+        phone = normalize_phone(term) if looks_like_phone(term) else ''
+        tax_id = normalize_tax_id(term)
+
+        other_prefix = Q(email__istartswith=term)
+        if phone:
+            other_prefix |= Q(phone_normalized__startswith=phone)
+        if tax_id:
+            other_prefix |= Q(tax_id_normalized__startswith=tax_id)
+
+        return Case(
+            When(name_normalized=name, then=Value(4)),
+            When(name_normalized__startswith=name, then=Value(3)),
+            When(other_prefix, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """
+    Filter through the FTS5 trigram table. The trigram tokenizer needs at
+    least three characters, so shorter terms fall back to ``icontains``.
+    """
+
+    min_length = 3
+
+    def filter(self, queryset, term):
+        if len(term) < self.min_length or not _sqlite_fts_available():
+            return super().filter(queryset, term)
+
+        match = '"' + term.replace('"', '""') + '"'
+        fts = Q(id__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,)
+        ))
+        return queryset.filter(fts | self.prefix_query(term))
+
+
+class PostgresTrigramBackend(SearchBackend):
+    """
+    ``icontains`` served by GIN trigram indexes on UPPER(field), ranked by
+    the best trigram similarity across the searched fields.
+    """
+
+    def rank(self, term):
+        from django.contrib.postgres.search import TrigramSimilarity
+        from django.db.models.functions import Greatest
+
+        return Greatest(
+            *(TrigramSimilarity(field, term) for field in SEARCH_FIELDS),
+            output_field=FloatField(),
+        )
+
+
+@lru_cache(maxsize=None)
+def _sqlite_fts_available():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+        )
+        return cursor.fetchone() is not None
+
+
+@lru_cache(maxsize=None)
+def _pg_trgm_available():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """
+    Return the configured search backend instance.
+    """
+    path = getattr(settings, 'CUSTOMERS_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'postgresql':
+        return PostgresTrigramBackend() if _pg_trgm_available() else SearchBackend()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    return SearchBackend()
+
+
+def _columns(prefix=''):
+    return ', '.join(f'{prefix}{field}' for field in SEARCH_FIELDS)
+
+
+def _sqlite_fts_statements():
+    delete_old = (
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns()}) "
+        f"VALUES ('delete', old.id, {_columns('old.')});"
+    )
+    insert_new = f'INSERT INTO {FTS_TABLE}(rowid, {_columns()}) VALUES (new.id, {_columns("new.")});'
+    return {
+        f'{FTS_TABLE}_ai': (
+            f'CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {CUSTOMER_TABLE} '
+            f'BEGIN {insert_new} END'
+        ),
+        f'{FTS_TABLE}_ad': (
+            f'CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {CUSTOMER_TABLE} '
+            f'BEGIN {delete_old} END'
+        ),
+        f'{FTS_TABLE}_au': (
+            f'CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {_columns()} ON {CUSTOMER_TABLE} '
+            f'BEGIN {delete_old} {insert_new} END'
+        ),
+    }
+
+
+def _clear_backend_caches():
+    _sqlite_fts_available.cache_clear()
+    _pg_trgm_available.cache_clear()
+    get_search_backend.cache_clear()
+
+
+def install_search_indexes(connection):
+    """
+    Create the database-specific search indexes if they are missing.
+    Idempotent; returns True if anything was created.
+    """
+    import sqlite3
+
+    if CUSTOMER_TABLE not in connection.introspection.table_names():
+        return False
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            try:
+                # In a savepoint, so a refusal does not abort the migration
+                with transaction.atomic(using=connection.alias):
+                    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            except DatabaseError:
+                logger.warning(
+                    'Could not create the pg_trgm extension; customer search '
+                    'falls back to unindexed icontains', exc_info=True
+                )
+                _clear_backend_caches()
+                return False
+            for field in SEARCH_FIELDS:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS customer_{field}_trgm_idx '
+                    f'ON {CUSTOMER_TABLE} USING gin (UPPER({field}::text) gin_trgm_ops)'
+                )
+            _clear_backend_caches()
+            return True
+
+        if connection.vendor != 'sqlite' or sqlite3.sqlite_version_info < (3, 34):
+            return False
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = {
+            name: sql for name, sql in _sqlite_fts_statements().items() if name not in existing
+        }
+        if FTS_TABLE in existing and not missing:
+            return False
+
+        if FTS_TABLE not in existing:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({_columns()}, "
+                f"content='{CUSTOMER_TABLE}', content_rowid='id', tokenize='trigram')"
+            )
+        for sql in missing.values():
+            cursor.execute(sql)
+        # Rows written while the triggers were missing are not indexed
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+    _clear_backend_caches()
+    return True
+
+
+def uninstall_search_indexes(connection):
+    """
+    Drop the database-specific search indexes.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            for field in SEARCH_FIELDS:
+                cursor.execute(f'DROP INDEX IF EXISTS customer_{field}_trgm_idx')
+        elif connection.vendor == 'sqlite':
+            for name in _sqlite_fts_statements():
+                cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+    _clear_backend_caches()
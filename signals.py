@@ -0,0 +1,80 @@
+"""
+Signal handlers keeping customer stats in sync with the Sales module,
+cached customer data and the typeahead index fresh, and search indexes in
+place after migrations.
+
+Each sale is linked to its customer (see ``CustomerSale``); the link
+stores the state already counted, so on save only the delta is applied.
+"""
+
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete
+
+from . import stats, typeahead
+from .cache import bump_version
+from .search import install_search_indexes
+
+
+def sale_post_save(sender, instance, **kwargs):
+    """
+    Link the sale to its customer and apply any change to stats.
+    """
+    stats.sync_sale(instance, completed=instance.status == sender.STATUS_COMPLETED)
+
+
+def sale_post_delete(sender, instance, **kwargs):
+    """
+    Remove a deleted sale from the stats if it was counted.
+    """
+    stats.unlink_sale(instance.pk)
+
+
+def connect_sales_signals():
+    """
+    Connect the handlers to the Sale model, if the Sales module is installed.
+    """
+    try:
+        from sales.models import Sale
+    except ImportError:
+        # Sales plugin not installed
+        return
+
+    post_save.connect(sale_post_save, sender=Sale, dispatch_uid='customers_sale_post_save')
+    post_delete.connect(sale_post_delete, sender=Sale, dispatch_uid='customers_sale_post_delete')
+
+
+def customer_changed(sender, using=None, **kwargs):
+    """
+    Invalidate cached customer data (post_save / post_delete on Customer)
+    once the write is committed, so no request caches the old data after
+    the bump.
+    """
+    transaction.on_commit(bump_version, using=using)
+
+
+# Fields the typeahead index is built from
+TYPEAHEAD_FIELDS = {'name', 'phone', 'email', 'is_active', 'merged_into'}
+
+
+def customer_saved_typeahead(sender, instance, update_fields=None, using=None, **kwargs):
+    """
+    Reflect a saved customer in this process's typeahead index (post_save).
+    Saves limited to other fields (e.g. stats) are skipped.
+    """
+    if update_fields is not None and not TYPEAHEAD_FIELDS.intersection(update_fields):
+        return
+    typeahead.customer_saved(instance, using=using)
+
+
+def customer_deleted_typeahead(sender, instance, using=None, **kwargs):
+    """
+    Drop a deleted customer from this process's typeahead index (post_delete).
+    """
+    typeahead.customer_deleted(instance, using=using)
+
+
+def ensure_search_indexes(sender, using, **kwargs):
+    """
+    Recreate search indexes dropped by a migration (post_migrate).
+    """
+    install_search_indexes(connections[using])
@@ -0,0 +1,419 @@
+"""
+Customer statistics.
+
+Completed sales are applied to the customer row as deltas using F()
+expressions, so a checkout costs a single UPDATE regardless of how many
+purchases the customer already has. ``Customer.update_stats()`` remains
+the full recomputation for a single customer, and ``rebuild_stats()``
+repairs many customers at once with one grouped aggregate per batch.
+
+The same deltas are applied to the customer's ``CustomerMonthlySpend``
+bucket for the month of the sale, so spending over time is read from
+one row per month rather than from every sale.
+
+Sales are tied to customers through ``CustomerSale`` links, so every
+lookup here is keyed by customer id.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, Value, DateField, DateTimeField, Sum, Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, TruncMonth
+from django.utils import timezone
+
+from .cache import aversioned_key, bump_sales_version, bump_version, versioned_key
+from .models import Customer, CustomerMonthlySpend, CustomerSale
+
+
+def apply_sale(customers, amount, purchased_at):
+    """
+    Add one completed sale to the stats of the given customers.
+
+    ``customers`` is a Customer queryset; the update is a single atomic
+    statement. Returns the number of customers updated.
+    """
+    purchased_at = Value(purchased_at, output_field=DateTimeField())
+    updated = customers.update(
+        total_spent=F('total_spent') + (amount or Decimal('0.00')),
+        visit_count=F('visit_count') + 1,
+        last_purchase_at=Greatest(Coalesce('last_purchase_at', purchased_at), purchased_at),
+    )
+    transaction.on_commit(bump_version)
+    return updated
+
+
+def revert_sale(customers, amount, purchased_at):
+    """
+    Remove one previously applied sale (refund, cancellation, deletion).
+
+    If the reverted sale was the customer's latest purchase,
+    ``last_purchase_at`` is recomputed from the remaining linked sales.
+    Returns the number of customers updated.
+    """
+    with transaction.atomic():
+        updated = customers.update(
+            total_spent=F('total_spent') - (amount or Decimal('0.00')),
+            visit_count=Greatest(F('visit_count') - 1, Value(0)),
+        )
+        if purchased_at is not None:
+            last_sale = CustomerSale.objects.filter(
+                customer=OuterRef('pk'),
+                completed=True
+            ).order_by('-sold_at').values('sold_at')[:1]
+            customers.filter(last_purchase_at=purchased_at).update(
+                last_purchase_at=Subquery(last_sale)
+            )
+    transaction.on_commit(bump_version)
+    return updated
+
+
+def month_of(moment):
+    """
+    First day of the (local) month of a datetime: its monthly spend bucket.
+    """
+    return timezone.localtime(moment).date().replace(day=1)
+
+
+def add_to_month(customer_id, amount, sold_at):
+    """
+    Add one completed sale to the customer's bucket for its month.
+    """
+    amount = amount or Decimal('0.00')
+    month = month_of(sold_at)
+    bucket = CustomerMonthlySpend.objects.filter(customer_id=customer_id, month=month)
+    if bucket.update(total=F('total') + amount, visits=F('visits') + 1):
+        return
+    try:
+        with transaction.atomic():
+            CustomerMonthlySpend.objects.create(customer_id=customer_id, month=month, total=amount, visits=1)
+    except IntegrityError:
+        # Created by a concurrent sale of the same customer and month
+        bucket.update(total=F('total') + amount, visits=F('visits') + 1)
+
+
+def remove_from_month(customer_id, amount, sold_at):
+    """
+    Remove one previously added sale from its month bucket, dropping the
+    bucket when no sales are left in it.
+    """
+    bucket = CustomerMonthlySpend.objects.filter(customer_id=customer_id, month=month_of(sold_at))
+    bucket.update(
+        total=F('total') - (amount or Decimal('0.00')),
+        visits=Greatest(F('visits') - 1, Value(0)),
+    )
+    bucket.filter(visits=0).delete()
+
+
+def rebuild_monthly_spend(customer_ids):
+    """
+    Recompute the month buckets of the given customers from their linked
+    sales: one DELETE, one grouped aggregate and one bulk INSERT. Their
+    sales versions are bumped, since callers have just changed their stats.
+    """
+    rows = (
+        CustomerSale.objects.filter(customer_id__in=customer_ids, completed=True)
+        .annotate(bucket=TruncMonth('sold_at', output_field=DateField()))
+        .values('customer_id', 'bucket')
+        .annotate(total=Sum('total'), visits=Count('pk'))
+        .order_by()
+    )
+    with transaction.atomic():
+        CustomerMonthlySpend.objects.filter(customer_id__in=customer_ids).delete()
+        CustomerMonthlySpend.objects.bulk_create([
+            CustomerMonthlySpend(
+                customer_id=row['customer_id'],
+                month=row['bucket'],
+                total=row['total'],
+                visits=row['visits'],
+            )
+            for row in rows
+        ])
+    transaction.on_commit(partial(bump_sales_version, list(customer_ids)))
+
+
+def get_monthly_spend(customer_id, months=12, today=None):
+    """
+    Spending of a customer over the last ``months`` months, oldest first,
+    with empty months included: a list of ``(month, total, visits)``.
+    Reads at most ``months`` bucket rows.
+    """
+    current = month_of(today or timezone.now())
+    buckets = []
+    for _ in range(months):
+        buckets.append(current)
+        current = (current - timedelta(days=1)).replace(day=1)
+    buckets.reverse()
+
+    rows = CustomerMonthlySpend.objects.filter(
+        customer_id=customer_id, month__gte=buckets[0]
+    ).order_by('month').values_list('month', 'total', 'visits')
+    rows = {month: (total, visits) for month, total, visits in rows}
+    return [(month, *rows.get(month, (Decimal('0.00'), 0))) for month in buckets]
+
+
+async def aget_recent_purchases(customer_id, limit=10):
+    """
+    Async ``Customer.get_recent_purchases()`` keyed by customer id, so it
+    can be awaited alongside the customer fetch. Returns a list of sales
+    (empty when the Sales module is not installed).
+    """
+    try:
+        from sales.models import Sale
+    except ImportError:
+        return []
+
+    sale_ids = CustomerSale.objects.filter(
+        customer_id=customer_id, completed=True
+    ).order_by('-sold_at').values_list('sale_id', flat=True)[:limit]
+    sale_ids = [sale_id async for sale_id in sale_ids]
+    if not sale_ids:
+        return []
+    return [sale async for sale in Sale.objects.filter(pk__in=sale_ids).order_by('-created_at')]
+
+
+def resolve_customer_id(sale):
+    """
+    Return the id of the customer a sale belongs to, or None.
+
+    A customer set on the sale itself wins; otherwise the sale is matched
+    by name, and only when exactly one customer has that name. Customers
+    merged into another are followed to the one kept: a name is matched
+    against merged customers only when no other customer has it.
+    """
+    customer_id = getattr(sale, 'customer_id', None)
+    if customer_id:
+        merged_into = Customer.objects.filter(pk=customer_id).values_list('merged_into_id', flat=True).first()
+        return merged_into or customer_id
+    if not sale.customer_name:
+        return None
+
+    named = Customer.objects.filter(name=sale.customer_name)
+    matches = list(named.filter(merged_into__isnull=True).values_list('pk', flat=True)[:2])
+    if not matches:
+        matches = list(
+            named.filter(merged_into__isnull=False).values_list('merged_into_id', flat=True).distinct().order_by()[:2]
+        )
+    return matches[0] if len(matches) == 1 else None
+
+
+def _sale_link(sale_id, lock=False):
+    """
+    The link of a sale with its customer's name, or None. With ``lock``,
+    the link row is locked until the end of the transaction.
+    """
+    links = CustomerSale.objects.filter(sale_id=sale_id).select_related('customer').only(
+        'sale_id', 'total', 'sold_at', 'completed', 'customer__name'
+    )
+    if lock:
+        links = links.select_for_update(of=('self',))
+    return links.first()
+
+
+def _moved_to(sale, link):
+    """
+    Id of the customer a linked sale now belongs to, or None if it still
+    belongs to the linked one.
+
+    A customer set on the sale is compared directly (following merges,
+    see ``resolve_customer_id``); otherwise the sale
+    is re-resolved by name, but only when the name no longer matches the
+    linked customer and names exactly one other customer, so renaming
+    the customer keeps the link.
+    """
+    customer_id = getattr(sale, 'customer_id', None)
+    if customer_id == link.customer_id:
+        return None
+    if not customer_id and (not sale.customer_name or sale.customer_name == link.customer.name):
+        return None
+    # Follows merges, so a sale naming a merged customer stays with the one kept
+    customer_id = resolve_customer_id(sale)
+    return customer_id if customer_id not in (None, link.customer_id) else None
+
+
+def sync_sale(sale, completed):
+    """
+    Bring the link and stats of one sale in line with its current state.
+
+    ``completed`` tells whether the sale should count towards stats.
+    Changes are made with the link row locked, so concurrent saves of the
+    same sale are applied one after the other. A sale moved to another
+    customer is reverted from the old one and applied to the new one.
+    Unchanged sales cost a single indexed lookup.
+    """
+    current = (completed, sale.total or Decimal('0.00'), sale.created_at)
+    link = _sale_link(sale.pk)
+    if link is not None and (link.completed, link.total, link.sold_at) == current and not _moved_to(sale, link):
+        return link
+
+    with transaction.atomic():
+        link = _sale_link(sale.pk, lock=True)
+        if link is None:
+            customer_id = resolve_customer_id(sale)
+            if customer_id is None:
+                return None
+            link, created = CustomerSale.objects.get_or_create(
+                sale_id=sale.pk, defaults={'customer_id': customer_id, 'sold_at': sale.created_at}
+            )
+            if not created:
+                # Linked by a concurrent save of the same sale
+                link = _sale_link(sale.pk, lock=True)
+
+        previous = (link.completed, link.total, link.sold_at)
+        previous_customer_id = link.customer_id
+        customer_id = _moved_to(sale, link) or previous_customer_id
+        if previous == current and customer_id == previous_customer_id:
+            return link
+
+        link.customer_id = customer_id
+        link.completed, link.total, link.sold_at = current
+        link.save()
+        if previous[0]:
+            revert_sale(Customer.objects.filter(pk=previous_customer_id), previous[1], previous[2])
+            remove_from_month(previous_customer_id, previous[1], previous[2])
+        if completed:
+            apply_sale(Customer.objects.filter(pk=customer_id), link.total, link.sold_at)
+            add_to_month(customer_id, link.total, link.sold_at)
+        transaction.on_commit(partial(bump_sales_version, {previous_customer_id, customer_id}))
+    return link
+
+
+def unlink_sale(sale_id):
+    """
+    Drop the link of a deleted sale, reverting it from stats if counted.
+    """
+    with transaction.atomic():
+        link = CustomerSale.objects.select_for_update().filter(sale_id=sale_id).first()
+        if link is None:
+            return
+        link.delete()
+        if link.completed:
+            revert_sale(Customer.objects.filter(pk=link.customer_id), link.total, link.sold_at)
+            remove_from_month(link.customer_id, link.total, link.sold_at)
+        transaction.on_commit(partial(bump_sales_version, [link.customer_id]))
+
+
+# Customers recomputed per batch by rebuild_stats()
+REBUILD_BATCH_SIZE = 1000
+
+STATS_FIELDS = Customer.STATS_FIELDS
+
+
+def _sales_totals(customer_ids):
+    """
+    Return {customer_id: (total, visits, last_purchase)} for the completed
+    sales of the given customers, in a single grouped query.
+    """
+    rows = CustomerSale.objects.filter(
+        customer_id__in=customer_ids,
+        completed=True
+    ).values('customer_id').annotate(
+        total=Sum('total'),
+        visits=Count('pk'),
+        last=Max('sold_at'),
+    ).order_by()
+
+    return {row['customer_id']: (row['total'], row['visits'], row['last']) for row in rows}
+
+
+def rebuild_stats(customers=None, batch_size=None, start_after=None, progress=None):
+    """
+    Recompute stats for many customers from their linked sales.
+
+    Customers are walked in primary-key order in batches of ``batch_size``;
+    each batch costs one SELECT, one grouped aggregate over sales, at
+    most one bulk UPDATE of the rows that actually changed, and the three
+    queries of ``rebuild_monthly_spend()`` for its month buckets. Pass
+    ``start_after`` (a customer id) to resume an interrupted run.
+    ``progress(processed, updated, last_id)`` is called after each batch.
+
+    Returns a ``(processed, updated)`` tuple.
+    """
+    if customers is None:
+        customers = Customer.objects.all()
+    batch_size = batch_size or REBUILD_BATCH_SIZE
+
+    customers = customers.order_by('pk').only('pk', *STATS_FIELDS)
+
+    processed = updated = 0
+    last_id = start_after
+    while True:
+        batch = customers.filter(pk__gt=last_id) if last_id is not None else customers
+        batch = list(batch[:batch_size])
+        if not batch:
+            break
+
+        totals = _sales_totals([customer.pk for customer in batch])
+        changed = []
+        for customer in batch:
+            total, visits, last = totals.get(customer.pk, (None, 0, None))
+            values = (total or Decimal('0.00'), visits, last)
+            if values != (customer.total_spent, customer.visit_count, customer.last_purchase_at):
+                customer.total_spent, customer.visit_count, customer.last_purchase_at = values
+                changed.append(customer)
+
+        with transaction.atomic():
+            if changed:
+                Customer.objects.bulk_update(changed, STATS_FIELDS, batch_size=batch_size)
+            # Also bumps the sales versions of the batch
+            rebuild_monthly_spend([customer.pk for customer in batch])
+
+        processed += len(batch)
+        updated += len(changed)
+        last_id = batch[-1].pk
+        if progress:
+            progress(processed, updated, last_id)
+
+    if updated:
+        transaction.on_commit(bump_version)
+    return processed, updated
+
+
+# Seconds the dashboard counters are cached (writes invalidate them sooner)
+DASHBOARD_CACHE_TIMEOUT = 3600
+
+
+def _dashboard_month_start():
+    return timezone.localtime().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _dashboard_aggregates(month_start):
+    return {
+        'total_customers': Count('pk', filter=Q(is_active=True)),
+        'inactive_customers': Count('pk', filter=Q(is_active=False)),
+        'new_this_month': Count('pk', filter=Q(created_at__gte=month_start)),
+        'with_purchases': Count('pk', filter=Q(visit_count__gt=0)),
+        'total_revenue': Coalesce(Sum('total_spent'), Value(Decimal('0.00'))),
+    }
+
+
+def get_dashboard_stats():
+    """
+    Counters for the customer list cards, computed with one conditional
+    aggregate and cached until the next write to customers.
+    """
+    month_start = _dashboard_month_start()
+    key = versioned_key('dashboard', month_start.strftime('%Y%m'))
+
+    stats = cache.get(key)
+    if stats is None:
+        stats = Customer.objects.aggregate(**_dashboard_aggregates(month_start))
+        cache.set(key, stats, DASHBOARD_CACHE_TIMEOUT)
+    return stats
+
+
+async def aget_dashboard_stats():
+    """
+    Async ``get_dashboard_stats()``, sharing its cache entries.
+    """
+    month_start = _dashboard_month_start()
+    key = await aversioned_key('dashboard', month_start.strftime('%Y%m'))
+
+    stats = await cache.aget(key)
+    if stats is None:
+        stats = await Customer.objects.aaggregate(**_dashboard_aggregates(month_start))
+        await cache.aset(key, stats, DASHBOARD_CACHE_TIMEOUT)
+    return stats
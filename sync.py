@@ -0,0 +1,126 @@
+"""
+Delta sync for offline terminals.
+
+A terminal keeps a local copy of the customer book and asks for what
+changed since its last sync token. Changes are read in ``(updated_at,
+id)`` order with a keyset WHERE clause, so every page is an index range
+scan. A customer that is active is returned in full (an upsert); one
+that was deactivated or merged into another is returned as a tombstone,
+``{'id', 'merged_into'}``, telling the terminal to drop it (and where
+its purchases went).
+
+Tokens are opaque cursors over ``(updated_at, id)``. Once a terminal is
+caught up, its token is moved back to ``CUSTOMERS_SYNC_OVERLAP`` seconds
+before the request, so rows committed late by concurrent transactions
+are picked up by the next sync; re-sent rows are simply applied again.
+
+Only writes that set ``updated_at`` are reported: edits, imports, bulk
+actions, deactivations and merges. Purchase stats are not part of the
+feed, since sales update them without touching ``updated_at``.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .pagination import decode_cursor, encode_cursor, InvalidCursor
+
+# Customers returned per page by default and at most
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+
+# Seconds a caught-up token is moved back, for transactions committing late
+DEFAULT_OVERLAP = 5
+
+SYNC_FIELDS = ('id', 'name', 'email', 'phone', 'address', 'tax_id', 'is_active', 'merged_into_id', 'updated_at')
+
+
+class InvalidSyncToken(InvalidCursor):
+    """Raised when a sync token cannot be decoded."""
+
+
+def decode_token(token):
+    """
+    Decode a sync token into its ``(updated_at, id)`` key.
+    """
+    try:
+        updated_at, customer_id = decode_cursor(token, 2)
+        updated_at = parse_datetime(updated_at)
+    except (InvalidCursor, TypeError, ValueError) as e:
+        raise InvalidSyncToken(token) from e
+    if updated_at is None or not isinstance(customer_id, int):
+        raise InvalidSyncToken(token)
+    return updated_at, customer_id
+
+
+def encode_token(updated_at, customer_id):
+    return encode_cursor((updated_at, customer_id))
+
+
+def _serialize(row):
+    if not row['is_active'] or row['merged_into_id']:
+        return None, {'id': row['id'], 'merged_into': row['merged_into_id']}
+    return {
+        'id': row['id'],
+        'name': row['name'],
+        'email': row['email'],
+        'phone': row['phone'],
+        'address': row['address'],
+        'tax_id': row['tax_id'],
+        'updated_at': row['updated_at'].isoformat(),
+    }, None
+
+
+def changes_since(token=None, limit=DEFAULT_LIMIT, now=None):
+    """
+    Customers changed after ``token`` (all of them without one), one page
+    in ``(updated_at, id)`` order, in a single query.
+
+    Returns ``{'customers': [...], 'deleted': [...], 'sync_token': str,
+    'has_more': bool}``. Keep calling with the returned token while
+    ``has_more``; store it for the next sync once it is False.
+    """
+    from .models import Customer
+
+    now = now or timezone.now()
+    limit = min(max(limit, 1), MAX_LIMIT)
+
+    rows = Customer.objects.order_by('updated_at', 'id')
+    position = None
+    if token:
+        position = decode_token(token)
+        updated_at, customer_id = position
+        try:
+            rows = rows.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=customer_id))
+        except ValidationError as e:
+            raise InvalidSyncToken(token) from e
+    rows = list(rows.values(*SYNC_FIELDS)[:limit + 1])
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        position = (rows[-1]['updated_at'], rows[-1]['id'])
+
+    if not has_more:
+        overlap = timedelta(seconds=getattr(settings, 'CUSTOMERS_SYNC_OVERLAP', DEFAULT_OVERLAP))
+        floor = (now - overlap, 0)
+        position = min(position, floor) if position else floor
+
+    customers, deleted = [], []
+    for row in rows:
+        customer, tombstone = _serialize(row)
+        if customer:
+            customers.append(customer)
+        else:
+            deleted.append(tombstone)
+
+    return {
+        'customers': customers,
+        'deleted': deleted,
+        'sync_token': encode_token(*position),
+        'has_more': has_more,
+    }
@@ -0,0 +1,111 @@
+"""
+Shared fixtures for the customers tests.
+"""
+
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+# Table sizes compared by the scaling_queries fixture
+SCALING_SIZES = (1, 500)
+
+# Transaction control statements (atomic blocks inside the test
+# transaction) are not queries an endpoint should be charged for
+TRANSACTION_SQL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test with an empty cache (the database is rolled back)."""
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def captured_queries(fn):
+    """
+    Run ``fn`` and return the SQL of the queries it executed, excluding
+    transaction control.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+    return [query['sql'] for query in queries if not query['sql'].startswith(TRANSACTION_SQL)]
+
+
+def seed_scaling_data(start, stop, sales_of=None):
+    """
+    Create customers ``start``..``stop`` with everything endpoints may
+    touch per row: a tag, a linked completed sale, metrics and a monthly
+    spend bucket. ``sales_of`` also gets one more sale per new customer.
+    """
+    from customers.models import (
+        Customer, CustomerMetrics, CustomerMonthlySpend, CustomerSale, CustomerTag,
+    )
+    from customers.stats import month_of
+
+    now = timezone.now()
+    tag, _created = CustomerTag.objects.get_or_create(name='VIP')
+    customers = Customer.objects.bulk_create([
+        Customer(name=f'Cliente {i}', phone=f'600{i:06d}', total_spent=Decimal('10.00'), visit_count=1,
+                 last_purchase_at=now)
+        for i in range(start, stop)
+    ])
+    Customer.tags.through.objects.bulk_create([
+        Customer.tags.through(customer_id=customer.pk, customertag=tag) for customer in customers
+    ])
+    owners = [customer.pk for customer in customers]
+    if sales_of is not None:
+        owners += [sales_of.pk] * len(customers)
+    next_sale = CustomerSale.objects.count() + 1
+    CustomerSale.objects.bulk_create([
+        CustomerSale(customer_id=owner, sale_id=next_sale + i, total=Decimal('10.00'), sold_at=now, completed=True)
+        for i, owner in enumerate(owners)
+    ])
+    CustomerMetrics.objects.bulk_create([
+        CustomerMetrics(customer=customer, recency_days=0, recency_score=5, frequency_score=1,
+                        monetary_score=1, segment=CustomerMetrics.SEGMENT_PROMISING, computed_at=now)
+        for customer in customers
+    ])
+    CustomerMonthlySpend.objects.bulk_create([
+        CustomerMonthlySpend(customer=customer, month=month_of(now), total=Decimal('10.00'), visits=1)
+        for customer in customers
+    ])
+    return customers
+
+
+@pytest.fixture
+def scaling_queries(db):
+    """
+    Check that a request costs the same number of queries, within a fixed
+    budget, with 1 and with 500 customers.
+
+    ``check(request, budget)`` calls ``request(customer)`` (customer being
+    the first one created, which also owns one sale per customer) at each
+    size with a cold cache, after a warm-up call for one-off lookups
+    cached per process, and fails listing the SQL if the counts differ or
+    exceed ``budget``.
+    """
+    def check(request, budget):
+        counts = {}
+        customer = None
+        seeded = 0
+        for size in SCALING_SIZES:
+            created = seed_scaling_data(seeded, size, sales_of=customer)
+            customer = customer or created[0]
+            seeded = size
+
+            request(customer)
+            cache.clear()
+            sql = captured_queries(lambda: request(customer))
+            counts[size] = len(sql)
+            assert len(sql) <= budget, (
+                f'{len(sql)} queries with {size} customers, budget {budget}:\n' + '\n'.join(sql)
+            )
+        assert len(set(counts.values())) == 1, f'Query count grows with customers: {counts}'
+        return counts[SCALING_SIZES[0]]
+
+    return check
@@ -0,0 +1,167 @@
+"""
+Tests for the async variants of the read-heavy views.
+"""
+
+import json
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.http import Http404
+from django.test import AsyncRequestFactory, RequestFactory
+
+from customers import async_views, instrumentation, views
+from customers.models import Customer
+from customers.stats import aget_dashboard_stats, get_dashboard_stats
+
+
+@pytest.fixture
+def rf():
+    """Create async request factory."""
+    return AsyncRequestFactory()
+
+
+def call(view, request, *args, **kwargs):
+    return async_to_sync(view)(request, *args, **kwargs)
+
+
+@pytest.mark.django_db
+class TestAsyncListAjax:
+    """Tests for async_views.customer_list_ajax."""
+
+    def test_same_response_as_sync(self, rf):
+        """Test the async view returns the sync view's page."""
+        for i in range(5):
+            Customer.objects.create(name=f'Cliente {i}')
+
+        response = call(async_views.customer_list_ajax, rf.get('/modules/customers/api/list/', {'limit': 2}))
+        expected = views.customer_list_ajax(RequestFactory().get('/modules/customers/api/list/', {'limit': 2}))
+
+        assert response.status_code == 200
+        assert json.loads(response.content) == json.loads(expected.content)
+
+    def test_next_page_and_search(self, rf):
+        """Test cursor pagination and search."""
+        Customer.objects.create(name='Ana Garcia')
+        Customer.objects.create(name='Luis Perez')
+        Customer.objects.create(name='Marta Garcia')
+
+        first = json.loads(call(
+            async_views.customer_list_ajax, rf.get('/modules/customers/api/list/', {'limit': 2})
+        ).content)
+        second = json.loads(call(
+            async_views.customer_list_ajax,
+            rf.get('/modules/customers/api/list/', {'limit': 2, 'cursor': first['next_cursor']})
+        ).content)
+        found = json.loads(call(
+            async_views.customer_list_ajax, rf.get('/modules/customers/api/list/', {'search': 'garcia'})
+        ).content)
+
+        assert [c['name'] for c in first['customers'] + second['customers']] == [
+            'Marta Garcia', 'Luis Perez', 'Ana Garcia'
+        ]
+        assert second['next_cursor'] is None
+        assert {c['name'] for c in found['customers']} == {'Ana Garcia', 'Marta Garcia'}
+
+    def test_invalid_cursor(self, rf):
+        """Test an invalid cursor is rejected."""
+        response = call(async_views.customer_list_ajax, rf.get('/modules/customers/api/list/', {'cursor': '@@'}))
+
+        assert response.status_code == 400
+
+    def test_cached(self, rf, django_assert_num_queries):
+        """Test a repeated request is served from the cache."""
+        Customer.objects.create(name='Ana')
+        call(async_views.customer_list_ajax, rf.get('/modules/customers/api/list/'))
+
+        with django_assert_num_queries(0):
+            response = call(async_views.customer_list_ajax, rf.get('/modules/customers/api/list/'))
+
+        assert json.loads(response.content)['customers'][0]['name'] == 'Ana'
+
+    def test_conditional_request(self, rf, django_capture_on_commit_callbacks):
+        """Test the ETag matches the sync view's and a matching If-None-Match gets a 304."""
+        with django_capture_on_commit_callbacks(execute=True):
+            Customer.objects.create(name='Ana')
+        expected = views.customer_list_ajax(RequestFactory().get('/modules/customers/api/list/'))
+
+        response = call(async_views.customer_list_ajax, rf.get('/modules/customers/api/list/'))
+        not_modified = call(
+            async_views.customer_list_ajax,
+            rf.get('/modules/customers/api/list/', headers={'If-None-Match': response['ETag']})
+        )
+
+        assert response['ETag'] == expected['ETag']
+        assert response['Last-Modified'] == expected['Last-Modified']
+        assert not_modified.status_code == 304
+
+    def test_cache_not_read_on_event_loop(self, rf, monkeypatch):
+        """Test the cache key, ETag and page are read without blocking the event loop."""
+        import asyncio
+        from django.core.cache import caches
+
+        backend = caches['default']
+        blocking = []
+        get = backend.get
+
+        def spy(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                blocking.append(args[0])
+            except RuntimeError:
+                pass
+            return get(*args, **kwargs)
+
+        monkeypatch.setattr(backend, 'get', spy)
+        Customer.objects.create(name='Ana')
+
+        call(async_views.customer_list_ajax, rf.get('/modules/customers/api/list/'))
+
+        assert blocking == []
+
+
+@pytest.mark.django_db
+class TestAsyncPages:
+    """Tests for async_views.customer_list and customer_detail."""
+
+    def test_list(self, rf):
+        """Test the list page renders the counters."""
+        Customer.objects.create(name='Ana')
+
+        response = call(async_views.customer_list, rf.get('/modules/customers/'))
+
+        assert response.status_code == 200
+
+    def test_dashboard_stats_match(self):
+        """Test async counters equal the sync ones."""
+        Customer.objects.create(name='Ana')
+        Customer.objects.create(name='Luis', is_active=False)
+
+        assert async_to_sync(aget_dashboard_stats)() == get_dashboard_stats()
+
+    def test_detail(self, rf):
+        """Test the detail page."""
+        customer = Customer.objects.create(name='Ana Garcia')
+
+        response = call(async_views.customer_detail, rf.get(f'/modules/customers/{customer.pk}/'), customer.pk)
+
+        assert response.status_code == 200
+        assert b'Ana Garcia' in response.content
+
+    def test_detail_missing(self, rf):
+        """Test a missing customer is a 404."""
+        with pytest.raises(Http404):
+            call(async_views.customer_detail, rf.get('/modules/customers/999999/'), 999999)
+
+    def test_instrumented(self, rf, settings):
+        """Test async views are measured, queries included."""
+        settings.CUSTOMERS_INSTRUMENTATION = True
+        instrumentation.reset()
+        Customer.objects.create(name='Ana')
+        view = instrumentation.instrumented(async_views.customer_list_ajax, 'list_ajax')
+
+        call(view, rf.get('/modules/customers/api/list/'))
+
+        stats = instrumentation.summary()['list_ajax']
+        assert stats['count'] == 1
+        assert stats['queries']['max'] >= 1
+        instrumentation.reset()
@@ -0,0 +1,175 @@
+"""
+Tests for bulk customer actions.
+"""
+
+import json
+
+import pytest
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from customers import bulk
+from customers.cache import get_version
+from customers.models import Customer, CustomerTag
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+@pytest.fixture
+def customers():
+    """Create 5 active and 2 inactive customers."""
+    active = [Customer.objects.create(name=f"Activo {i}") for i in range(5)]
+    inactive = [Customer.objects.create(name=f"Inactivo {i}", is_active=False) for i in range(2)]
+    return active, inactive
+
+
+@pytest.mark.django_db
+class TestApplyBulkAction:
+    """Tests for bulk.apply_bulk_action."""
+
+    def test_deactivate_counts_changed_rows(self, customers):
+        """Test only customers that change are counted."""
+        selected, affected = bulk.apply_bulk_action(Customer.objects.all(), 'deactivate')
+
+        assert (selected, affected) == (7, 5)
+        assert not Customer.objects.filter(is_active=True).exists()
+
+    def test_reactivate(self, customers):
+        """Test reactivating inactive customers."""
+        _active, inactive = customers
+
+        selected, affected = bulk.apply_bulk_action(
+            Customer.objects.filter(pk__in=[c.pk for c in inactive]), 'reactivate'
+        )
+
+        assert affected == 2
+        assert Customer.objects.filter(is_active=True).count() == 7
+
+    def test_stale_edit_after_bulk_rejected(self, client, customers):
+        """Test an edit form opened before a bulk deactivate gets 409."""
+        customer = customers[0][0]
+        bulk.apply_bulk_action(Customer.objects.filter(pk=customer.pk), 'deactivate')
+
+        response = client.post(f'/modules/customers/{customer.pk}/edit/', {
+            'name': customer.name, 'is_active': 'on', 'version': str(customer.version),
+        })
+
+        assert response.status_code == 409
+        customer.refresh_from_db()
+        assert customer.is_active is False
+
+    def test_tagging_bumps_version(self, customers):
+        """Test tagging and untagging bump the version of changed customers."""
+        customer = customers[0][0]
+        customer_qs = Customer.objects.filter(pk=customer.pk)
+
+        bulk.apply_bulk_action(customer_qs, 'tag', tag_name='VIP')
+        bulk.apply_bulk_action(customer_qs, 'untag', tag_name='VIP')
+
+        customer.refresh_from_db()
+        assert customer.version == 3
+
+    def test_chunked_updates(self, customers):
+        """Test each chunk costs one SELECT of ids and one UPDATE."""
+        with CaptureQueriesContext(connection) as queries:
+            selected, affected = bulk.apply_bulk_action(Customer.objects.all(), 'deactivate', chunk_size=2)
+
+        statements = [query['sql'].split()[0] for query in queries.captured_queries]
+        assert statements.count('UPDATE') == 4
+        assert statements.count('SELECT') == 5  # 4 chunks + the empty one
+        assert (selected, affected) == (7, 5)
+
+    def test_tag_and_untag(self, customers):
+        """Test tagging is idempotent and untagging removes links."""
+        active, _inactive = customers
+        queryset = Customer.objects.filter(pk__in=[c.pk for c in active[:3]])
+
+        assert bulk.apply_bulk_action(queryset, 'tag', tag_name='VIP') == (3, 3)
+        assert bulk.apply_bulk_action(Customer.objects.all(), 'tag', tag_name='VIP') == (7, 4)
+        assert CustomerTag.objects.get(name='VIP').customers.count() == 7
+
+        assert bulk.apply_bulk_action(queryset, 'untag', tag_name='VIP') == (3, 3)
+        assert CustomerTag.objects.get(name='VIP').customers.count() == 4
+
+    def test_untag_unknown_tag(self, customers):
+        """Test removing a tag that does not exist changes nothing."""
+        assert bulk.apply_bulk_action(Customer.objects.all(), 'untag', tag_name='Nope') == (7, 0)
+        assert not CustomerTag.objects.exists()
+
+    def test_invalid_action(self, customers):
+        """Test unknown actions and missing tags are rejected."""
+        with pytest.raises(ValueError):
+            bulk.apply_bulk_action(Customer.objects.all(), 'delete')
+        with pytest.raises(ValueError):
+            bulk.apply_bulk_action(Customer.objects.all(), 'tag')
+
+    def test_invalidates_cached_lists(self, customers, django_capture_on_commit_callbacks):
+        """Test bulk writes bump the cache version once committed."""
+        version = get_version()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            bulk.apply_bulk_action(Customer.objects.all(), 'deactivate')
+            assert get_version() == version
+
+        assert get_version() != version
+
+
+@pytest.mark.django_db
+class TestBulkView:
+    """Tests for the bulk action endpoint."""
+
+    def test_bulk_by_ids(self, client, customers):
+        """Test applying an action to selected ids."""
+        active, _inactive = customers
+
+        response = client.post('/modules/customers/bulk/', {
+            'action': 'deactivate',
+            'ids': f'{active[0].pk},{active[1].pk}',
+        })
+
+        data = json.loads(response.content)
+        assert (data['selected'], data['affected']) == (2, 2)
+        assert Customer.objects.filter(is_active=True).count() == 3
+
+    def test_bulk_by_filter(self, client, customers):
+        """Test applying an action to every customer matching the list filter."""
+        response = client.post('/modules/customers/bulk/', {
+            'action': 'tag',
+            'tag': 'Antiguo',
+            'select_all': 'on',
+            'status': 'inactive',
+        })
+
+        data = json.loads(response.content)
+        assert data['affected'] == 2
+        assert set(CustomerTag.objects.get(name='Antiguo').customers.values_list('is_active', flat=True)) == {False}
+
+    def test_bulk_by_search(self, client, customers):
+        """Test the search filter narrows the selection."""
+        response = client.post('/modules/customers/bulk/', {
+            'action': 'deactivate',
+            'select_all': 'on',
+            'status': 'all',
+            'search': 'Activo 3',
+        })
+
+        assert json.loads(response.content)['affected'] == 1
+        assert not Customer.objects.get(name="Activo 3").is_active
+
+    def test_bulk_requires_selection(self, client, customers):
+        """Test an empty selection is rejected instead of touching everything."""
+        response = client.post('/modules/customers/bulk/', {'action': 'deactivate'})
+
+        assert json.loads(response.content)['success'] is False
+        assert Customer.objects.filter(is_active=True).count() == 5
+
+    def test_bulk_invalid_ids(self, client, customers):
+        """Test malformed ids are rejected."""
+        response = client.post('/modules/customers/bulk/', {'action': 'deactivate', 'ids': '1,abc'})
+
+        assert json.loads(response.content)['success'] is False
@@ -0,0 +1,274 @@
+"""
+Tests for duplicate detection and merging.
+"""
+
+import json
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.utils import timezone
+
+from customers import dedup
+from customers.models import Customer, CustomerMonthlySpend, CustomerSale, CustomerTag
+from customers.normalization import phonetic_key, normalize_name
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+def pair_ids(pairs):
+    return {(pair.first_id, pair.second_id) for pair in pairs}
+
+
+class TestPhoneticKey:
+    """Tests for normalization.phonetic_key."""
+
+    @pytest.mark.parametrize('first, second', [
+        ("José Pérez", "Jose Peres"),
+        ("Ana García López", "López Garsia, Ana"),
+        ("Guillermo Vázquez", "Guiyermo Basquez"),
+        ("Hernández", "Ernandez"),
+    ])
+    def test_sound_alike_names(self, first, second):
+        """Test spelling variants share a key."""
+        assert phonetic_key(normalize_name(first)) == phonetic_key(normalize_name(second))
+
+    def test_different_names(self):
+        """Test different names get different keys."""
+        assert phonetic_key('ana garcia') != phonetic_key('luis garcia')
+
+
+@pytest.mark.django_db
+class TestFindDuplicates:
+    """Tests for dedup.find_duplicates."""
+
+    def test_same_phone_different_format(self):
+        """Test phones with and without country code are matched."""
+        first = Customer.objects.create(name="Ana Garcia", phone="+34 600 111 222")
+        second = Customer.objects.create(name="Ana García", phone="600-111-222")
+
+        pairs = dedup.find_duplicates()
+
+        assert pair_ids(pairs) == {(first.pk, second.pk)}
+        assert set(pairs[0].reasons) == {'phone', 'name'}
+
+    def test_email_case_and_tax_id(self):
+        """Test emails ignore case and tax ids are normalized."""
+        first = Customer.objects.create(name="Luis", email="Luis@Example.com")
+        second = Customer.objects.create(name="Luis Perez", email="luis@example.com")
+        third = Customer.objects.create(name="Marta", tax_id="12345678-z")
+        fourth = Customer.objects.create(name="M. Ruiz", tax_id="12345678Z")
+
+        assert pair_ids(dedup.find_duplicates()) == {(first.pk, second.pk), (third.pk, fourth.pk)}
+
+    def test_misspelt_name(self):
+        """Test misspelt names with no contact data are matched."""
+        first = Customer.objects.create(name="Francisco Jimenez")
+        second = Customer.objects.create(name="Francisco Gimenez")
+
+        assert pair_ids(dedup.find_duplicates()) == {(first.pk, second.pk)}
+
+    def test_namesakes_with_different_contact(self):
+        """Test namesakes with different emails and phones are not reported."""
+        Customer.objects.create(name="Maria Lopez", email="maria1@example.com", phone="600111222")
+        Customer.objects.create(name="Maria Lopez", email="maria2@example.com", phone="600333444")
+
+        assert dedup.find_duplicates() == []
+
+    def test_conflicting_tax_ids(self):
+        """Test different tax ids rule out a match."""
+        Customer.objects.create(name="Ana", phone="600111222", tax_id="11111111H")
+        Customer.objects.create(name="Ana", phone="600111222", tax_id="22222222J")
+
+        assert dedup.find_duplicates() == []
+
+    def test_large_blocks_skipped(self):
+        """Test keys shared by too many customers are not compared."""
+        for i in range(4):
+            Customer.objects.create(name=f"Cliente {i}", email="no@example.com")
+
+        assert dedup.candidate_pairs(max_block_size=3) == set()
+        assert len(dedup.candidate_pairs(max_block_size=4)) == 6
+
+    def test_inactive_excluded(self):
+        """Test inactive customers are ignored by default."""
+        Customer.objects.create(name="Ana", phone="600111222")
+        Customer.objects.create(name="Ana", phone="600111222", is_active=False)
+
+        assert dedup.find_duplicates() == []
+
+    def test_query_count_independent_of_size(self, django_assert_max_num_queries):
+        """Test detection runs a fixed number of queries."""
+        for i in range(30):
+            Customer.objects.create(name=f"Cliente {i}", phone=f"6001112{i:02d}")
+            Customer.objects.create(name=f"Cliente {i}", phone=f"+34 6001112{i:02d}")
+
+        with django_assert_max_num_queries(5):
+            pairs = dedup.find_duplicates()
+        assert len(pairs) == 30
+
+
+@pytest.mark.django_db
+class TestFindDuplicatesOf:
+    """Tests for dedup.find_duplicates_of."""
+
+    def test_matches_by_indexed_keys(self):
+        """Test duplicates of one customer are found by phone or email."""
+        customer = Customer.objects.create(name="Ana Garcia", phone="+34 600 111 222", email="ana@example.com")
+        by_phone = Customer.objects.create(name="Ana G.", phone="600111222")
+        by_email = Customer.objects.create(name="Ana", email="ana@example.com")
+        Customer.objects.create(name="Luis", phone="600999888")
+
+        matches = dedup.find_duplicates_of(customer)
+
+        assert {other.pk for other, score, reasons in matches} == {by_phone.pk, by_email.pk}
+
+
+@pytest.mark.django_db
+class TestMergeCustomers:
+    """Tests for dedup.merge_customers."""
+
+    def test_merge_moves_sales_and_stats(self):
+        """Test stats and linked sales move to the primary customer."""
+        now = timezone.now()
+        primary = Customer.objects.create(
+            name="Ana Garcia", total_spent=Decimal('30.00'), visit_count=1, last_purchase_at=now
+        )
+        duplicate = Customer.objects.create(
+            name="Ana García", phone="600111222", notes="VIP",
+            total_spent=Decimal('20.00'), visit_count=2,
+        )
+        CustomerSale.objects.create(customer=duplicate, sale_id=1, total='20.00', sold_at=now, completed=True)
+
+        dedup.merge_customers(primary, [duplicate.pk])
+
+        primary.refresh_from_db()
+        duplicate.refresh_from_db()
+        assert (primary.total_spent, primary.visit_count) == (Decimal('50.00'), 3)
+        assert primary.phone == "600111222"
+        assert primary.notes == "VIP"
+        assert CustomerSale.objects.get(sale_id=1).customer_id == primary.pk
+        assert duplicate.merged_into_id == primary.pk
+        assert not duplicate.is_active
+        assert duplicate.visit_count == 0
+        assert list(CustomerMonthlySpend.objects.values_list('customer_id', 'total', 'visits')) == [
+            (primary.pk, Decimal('20.00'), 1)
+        ]
+
+    def test_merge_unions_tags(self):
+        """Test the primary keeps its tags and gains the duplicates'."""
+        vip, wholesale, local = (CustomerTag.objects.create(name=name) for name in ("VIP", "Mayorista", "Local"))
+        primary = Customer.objects.create(name="Ana")
+        primary.tags.add(vip)
+        first = Customer.objects.create(name="Ana")
+        first.tags.add(vip, wholesale)
+        second = Customer.objects.create(name="Ana")
+        second.tags.add(local)
+
+        dedup.merge_customers(primary, [first.pk, second.pk])
+
+        assert set(primary.tags.values_list('name', flat=True)) == {"VIP", "Mayorista", "Local"}
+
+    def test_merge_invalidates_cache_on_commit(self, django_capture_on_commit_callbacks):
+        """Test cached customer data is invalidated once the merge commits."""
+        from customers.cache import get_version
+
+        primary = Customer.objects.create(name="Ana")
+        duplicate = Customer.objects.create(name="Ana")
+        version = get_version()
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            dedup.merge_customers(primary, [duplicate.pk])
+            assert get_version() == version
+
+        assert callbacks
+        assert get_version() != version
+
+    def test_merge_is_atomic(self):
+        """Test nothing changes when a duplicate cannot be merged."""
+        primary = Customer.objects.create(name="Ana")
+        duplicate = Customer.objects.create(name="Ana", visit_count=2)
+
+        with pytest.raises(ValueError):
+            dedup.merge_customers(primary, [duplicate.pk, 99999])
+
+        duplicate.refresh_from_db()
+        assert duplicate.is_active and duplicate.merged_into_id is None
+
+    def test_merge_repoints_earlier_merges(self):
+        """Test customers merged into a duplicate follow it to the primary."""
+        primary = Customer.objects.create(name="Ana")
+        duplicate = Customer.objects.create(name="Ana")
+        older = Customer.objects.create(name="Ana")
+        dedup.merge_customers(duplicate, [older.pk])
+
+        dedup.merge_customers(primary, [duplicate.pk])
+
+        assert Customer.objects.get(pk=older.pk).merged_into_id == primary.pk
+
+
+@pytest.mark.django_db
+class TestDuplicateViews:
+    """Tests for the duplicates and merge endpoints."""
+
+    def test_duplicates_endpoint(self, client):
+        """Test listing duplicates of a customer."""
+        customer = Customer.objects.create(name="Ana", phone="600111222")
+        other = Customer.objects.create(name="Ana", phone="+34 600 111 222")
+
+        data = json.loads(client.get(f'/modules/customers/{customer.pk}/duplicates/').content)
+
+        assert [row['id'] for row in data['duplicates']] == [other.pk]
+
+    def test_merge_endpoint(self, client):
+        """Test merging through the API."""
+        customer = Customer.objects.create(name="Ana", visit_count=1)
+        other = Customer.objects.create(name="Ana", visit_count=2)
+
+        response = client.post(f'/modules/customers/{customer.pk}/merge/', {'duplicate_ids': str(other.pk)})
+
+        data = json.loads(response.content)
+        assert data['success'] is True
+        assert data['visit_count'] == 3
+
+    def test_edit_duplicate_after_merge(self, client):
+        """Test an edit form opened on a duplicate cannot revive it after the merge."""
+        primary = Customer.objects.create(name="Ana")
+        duplicate = Customer.objects.create(name="Ana", visit_count=2)
+        opened_version = duplicate.version
+
+        dedup.merge_customers(primary, [duplicate.pk])
+        response = client.post(f'/modules/customers/{duplicate.pk}/edit/', {
+            'name': 'Ana', 'is_active': 'on', 'version': str(opened_version),
+        })
+
+        duplicate.refresh_from_db()
+        assert response.status_code == 404
+        assert not duplicate.is_active
+        assert duplicate.merged_into_id == primary.pk
+        assert duplicate.version == opened_version + 1
+
+    def test_merge_endpoint_requires_ids(self, client):
+        """Test merging without duplicates is rejected."""
+        customer = Customer.objects.create(name="Ana")
+
+        response = client.post(f'/modules/customers/{customer.pk}/merge/')
+
+        assert json.loads(response.content)['success'] is False
+
+    def test_find_command(self):
+        """Test the management command lists pairs."""
+        from io import StringIO
+
+        Customer.objects.create(name="Ana", phone="600111222")
+        Customer.objects.create(name="Ana", phone="600111222")
+        out = StringIO()
+
+        call_command('find_duplicate_customers', stdout=out)
+
+        assert '1 likely duplicate pairs' in out.getvalue()
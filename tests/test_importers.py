@@ -0,0 +1,231 @@
+"""
+Tests for bulk customer import.
+"""
+
+import io
+import json
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client
+
+from customers.importers import read_csv, import_customers
+from customers.models import Customer
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+def run_import(text, **kwargs):
+    return import_customers(read_csv(io.BytesIO(text.encode('utf-8'))), **kwargs)
+
+
+@pytest.mark.django_db
+class TestImportCustomers:
+    """Tests for importers.import_customers."""
+
+    def test_import_creates_customers(self):
+        """Test new rows are created with normalized keys."""
+        result = run_import(
+            "Name,Email,Phone,Tax ID\n"
+            "Ana Garcia,ANA@example.com,+34 600 111 222,x-1234567-l\n"
+            "Luis Perez,,,\n"
+        )
+
+        assert (result.created, result.updated, result.errors) == (2, 0, [])
+        ana = Customer.objects.get(name="Ana Garcia")
+        assert ana.email == "ana@example.com"
+        assert ana.phone_normalized == "34600111222"
+        assert ana.tax_id_normalized == "X1234567L"
+
+    def test_stale_edit_after_import_rejected(self, client):
+        """Test an edit form opened before an import that updated the customer gets 409."""
+        customer = Customer.objects.create(name="Ana Garcia", email="ana@example.com")
+        run_import("Name,Email,Phone\nAna Garcia,ana@example.com,600111222\n")
+
+        response = client.post(f'/modules/customers/{customer.pk}/edit/', {
+            'name': 'Ana Garcia', 'phone': '', 'is_active': 'on', 'version': str(customer.version),
+        })
+
+        assert response.status_code == 409
+        customer.refresh_from_db()
+        assert customer.phone == "600111222"
+
+    def test_existing_customers_locked_until_written(self, monkeypatch):
+        """Test matched customers are read with a row lock, so edits cannot be lost in between."""
+        from django.db import connection
+        from django.db.models.query import QuerySet
+        from django.test.utils import CaptureQueriesContext
+
+        Customer.objects.create(name="Ana Garcia", email="ana@example.com")
+        locked = []
+        select_for_update = QuerySet.select_for_update
+
+        def spy(queryset, *args, **kwargs):
+            locked.append(queryset.model)
+            return select_for_update(queryset, *args, **kwargs)
+
+        monkeypatch.setattr(QuerySet, 'select_for_update', spy)
+        with CaptureQueriesContext(connection) as queries:
+            result = run_import("Name,Email,Phone\nAna Garcia,ana@example.com,600111222\n")
+
+        assert result.updated == 1
+        assert locked == [Customer]
+        if connection.features.has_select_for_update:
+            assert any('FOR UPDATE' in query['sql'] for query in queries)
+
+    def test_mixed_case_email_matches_existing(self):
+        """Test a stored mixed-case email is matched instead of duplicated."""
+        customer = Customer.objects.create(name="Ana Garcia", email="Ana@Example.com")
+
+        result = run_import("Name,Email,Phone\nAna Garcia,ANA@example.COM,600111222\n")
+
+        assert (result.created, result.updated) == (0, 1)
+        assert Customer.objects.count() == 1
+        customer.refresh_from_db()
+        assert customer.phone == "600111222"
+
+    def test_spanish_headers_and_semicolons(self):
+        """Test Spanish headers and semicolon-separated files."""
+        result = run_import("Nombre;Teléfono;Notas\nMaría;600111222;VIP\n")
+
+        assert result.created == 1
+        assert Customer.objects.get(name="María").notes == "VIP"
+
+    def test_missing_name_column(self):
+        """Test files without a name column are rejected."""
+        with pytest.raises(ValueError):
+            run_import("Email\nx@example.com\n")
+
+    def test_row_errors_reported(self):
+        """Test invalid rows are reported with their line number."""
+        result = run_import(
+            "Name,Email\n"
+            ",nobody@example.com\n"
+            "Bad Email,not-an-email\n"
+            "Good,good@example.com\n"
+        )
+
+        assert result.created == 1
+        assert [row for row, _ in result.errors] == [2, 3]
+
+    def test_existing_customers_updated(self):
+        """Test rows matching an existing phone update that customer."""
+        existing = Customer.objects.create(name="Old Name", phone="+34600111222", notes="keep")
+
+        result = run_import("Name,Phone,Email\nNew Name,600-111-222 ,\n".replace('600-111-222 ', '0034 600 111 222'))
+
+        existing.refresh_from_db()
+        assert (result.created, result.updated) == (0, 1)
+        assert existing.name == "New Name"
+        assert existing.notes == "keep"
+        assert existing.name_normalized == "new name"
+
+    def test_existing_customers_skipped(self):
+        """Test update_existing=False leaves matches untouched."""
+        Customer.objects.create(name="Old Name", email="same@example.com")
+
+        result = run_import("Name,Email\nNew Name,SAME@example.com\n", update_existing=False)
+
+        assert (result.created, result.skipped) == (0, 1)
+        assert Customer.objects.get().name == "Old Name"
+
+    def test_duplicates_within_file(self):
+        """Test a repeated key in the same file is reported, across batches."""
+        result = run_import(
+            "Name,Tax ID\nFirst,B12345678\nFiller,\nSecond,b-12345678\n",
+            batch_size=2
+        )
+
+        assert result.created == 2
+        assert result.errors == [(4, 'Duplicado de la fila 2')]
+
+    def test_queries_per_batch_constant(self):
+        """Test each batch costs the same number of queries, whatever the file size."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        def queries_for(start, count):
+            lines = ''.join(f"Customer {i},c{i}@example.com,6{i:08d}\n" for i in range(start, start + count))
+            with CaptureQueriesContext(connection) as queries:
+                result = run_import("Name,Email,Phone\n" + lines, batch_size=100)
+            assert result.created == count
+            return len(queries)
+
+        one_batch = queries_for(0, 100)
+        four_batches = queries_for(1000, 400)
+
+        assert four_batches == 4 * one_batch
+
+    def test_export_round_trip(self, client):
+        """Test an exported file can be imported back without changes."""
+        Customer.objects.create(name="Round Trip", email="rt@example.com", phone="600000000")
+        content = b''.join(client.get('/modules/customers/export/').streaming_content)
+
+        result = import_customers(read_csv(io.BytesIO(content)))
+
+        assert (result.created, result.updated, result.skipped) == (0, 0, 1)
+
+    def test_import_command(self, tmp_path):
+        """Test the management command imports a file."""
+        path = tmp_path / 'customers.csv'
+        path.write_text("Name,Email\nFrom Command,cmd@example.com\n", encoding='utf-8')
+        out = io.StringIO()
+
+        call_command('import_customers', str(path), stdout=out)
+
+        assert Customer.objects.filter(name="From Command").exists()
+        assert '1 created' in out.getvalue()
+
+    def test_import_xlsx(self):
+        """Test XLSX files are read when openpyxl is installed."""
+        openpyxl = pytest.importorskip('openpyxl')
+        from customers.importers import read_xlsx
+
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['Name', 'Phone'])
+        workbook.active.append(['Excel Customer', 600123123])
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        buffer.seek(0)
+
+        result = import_customers(read_xlsx(buffer))
+
+        assert result.created == 1
+        assert Customer.objects.get().phone == "600123123"
+
+
+@pytest.mark.django_db
+class TestImportView:
+    """Tests for the import upload endpoint."""
+
+    def test_upload_csv(self, client):
+        """Test uploading a CSV imports it and reports counters."""
+        upload = SimpleUploadedFile('customers.csv', b"Name,Email\nUploaded,up@example.com\n,\n")
+
+        response = client.post('/modules/customers/import/', {'file': upload})
+
+        data = json.loads(response.content)
+        assert data['success'] is True
+        assert data['created'] == 1
+        assert Customer.objects.filter(name="Uploaded").exists()
+
+    def test_upload_refreshes_list(self, client, django_capture_on_commit_callbacks):
+        """Test imported customers show up in the cached list API once committed."""
+        client.get('/modules/customers/api/list/')
+        upload = SimpleUploadedFile('customers.csv', b"Name\nFresh Import\n")
+
+        with django_capture_on_commit_callbacks(execute=True):
+            client.post('/modules/customers/import/', {'file': upload})
+
+        data = json.loads(client.get('/modules/customers/api/list/').content)
+        assert [customer['name'] for customer in data['customers']] == ["Fresh Import"]
+
+    def test_upload_without_file(self, client):
+        """Test posting without a file returns an error."""
+        response = client.post('/modules/customers/import/')
+
+        assert json.loads(response.content)['success'] is False
@@ -0,0 +1,128 @@
+"""
+Query plans of the hot paths: the list API, the dashboard counters, the
+export and the sync feed must be served by an index, without sorting or
+reading the whole table.
+
+The SQL each path actually runs is captured and passed to EXPLAIN, on
+SQLite (EXPLAIN QUERY PLAN) and PostgreSQL (with sequential scans and
+sorts disabled, so the plan shows whether an index can replace them).
+"""
+
+import pytest
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from customers.exporters import export_rows, export_queryset
+from customers.models import Customer
+from customers.stats import get_dashboard_stats
+from customers.sync import changes_since
+
+TABLE = Customer._meta.db_table
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+@pytest.fixture
+def customers():
+    """Create a few active and inactive customers."""
+    return [
+        Customer.objects.create(name=f'Cliente {i:02d}', phone=f'6000000{i:02d}', is_active=i % 3 != 0)
+        for i in range(30)
+    ]
+
+
+def customer_selects(fn):
+    """SELECTs on the customer table run by ``fn``."""
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        fn()
+    return [
+        query['sql'] for query in queries
+        if query['sql'].startswith('SELECT') and f'FROM "{TABLE}"' in query['sql']
+    ]
+
+
+def explain(sql):
+    """Query plan of ``sql`` as one string."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+        with transaction.atomic():
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute(f'EXPLAIN {sql}')
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def assert_indexed(sql, index):
+    """Assert the plan reads ``index`` and neither sorts nor scans the table."""
+    plan = explain(sql)
+    assert index in plan, plan
+    if connection.vendor == 'sqlite':
+        assert 'TEMP B-TREE' not in plan, plan
+        assert f'SCAN {TABLE}\n' not in f'{plan}\n', plan
+    elif connection.vendor == 'postgresql':
+        assert 'Sort' not in plan, plan
+        assert 'Seq Scan' not in plan, plan
+
+
+@pytest.fixture(autouse=True)
+def supported_database():
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        pytest.skip(f'No query plan checks for {connection.vendor}')
+
+
+@pytest.mark.django_db
+class TestQueryPlans:
+    """Test the indexes serving the list, counters and export paths."""
+
+    def test_list_page(self, client, customers):
+        """Test the first page of active customers."""
+        sql, = customer_selects(lambda: client.get('/modules/customers/api/list/'))
+        assert_indexed(sql, 'customer_active_created_idx')
+
+    def test_list_next_page(self, client, customers):
+        """Test a page after a cursor."""
+        cursor = client.get('/modules/customers/api/list/', {'limit': 5}).json()['next_cursor']
+        assert cursor
+        sql, = customer_selects(
+            lambda: client.get('/modules/customers/api/list/', {'limit': 5, 'cursor': cursor})
+        )
+        assert_indexed(sql, 'customer_active_created_idx')
+
+    def test_list_inactive(self, client, customers):
+        """Test the inactive filter walks the ordered index instead of sorting."""
+        sql, = customer_selects(lambda: client.get('/modules/customers/api/list/', {'status': 'inactive'}))
+        assert_indexed(sql, 'customer_created_idx')
+
+    def test_list_all(self, client, customers):
+        """Test the list without a status filter."""
+        sql, = customer_selects(lambda: client.get('/modules/customers/api/list/', {'status': 'all'}))
+        assert_indexed(sql, 'customer_created_idx')
+
+    def test_export(self, customers):
+        """Test the export reads active customers in name order from the partial index."""
+        sql, = customer_selects(lambda: list(export_rows(export_queryset())))
+        assert_indexed(sql, 'customer_export_name_idx')
+
+    def test_sync(self, customers):
+        """Test the delta sync feed reads changes in index order."""
+        token = changes_since(None, limit=5)['sync_token']
+        sql, = customer_selects(lambda: changes_since(token, limit=5))
+        assert_indexed(sql, 'customer_updated_idx')
+
+    def test_counters(self, customers):
+        """Test the dashboard counters scan the covering index, not the table."""
+        sql, = customer_selects(get_dashboard_stats)
+        plan = explain(sql)
+        if connection.vendor == 'sqlite':
+            assert 'USING COVERING INDEX customer_counters_idx' in plan, plan
+        else:
+            assert 'Seq Scan' not in plan, plan
@@ -0,0 +1,106 @@
+"""
+Tests for the opt-in request instrumentation.
+"""
+
+import logging
+
+import pytest
+from django.test import Client
+
+from customers import instrumentation
+from customers.models import Customer
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+@pytest.fixture(autouse=True)
+def clean_buffers():
+    """Start every test with empty buffers."""
+    instrumentation.reset()
+    yield
+    instrumentation.reset()
+
+
+@pytest.fixture
+def enabled(settings):
+    """Turn instrumentation on."""
+    settings.CUSTOMERS_INSTRUMENTATION = True
+    return settings
+
+
+class TestSummary:
+    """Tests for instrumentation.summary."""
+
+    def test_percentiles(self):
+        """Test nearest-rank percentiles over the buffered samples."""
+        for duration in range(1, 101):
+            instrumentation.record('list', {
+                'status': 200, 'duration_ms': float(duration), 'queries': 2,
+                'db_ms': 1.0, 'serialize_ms': 0.0, 'bytes': None,
+            })
+
+        stats = instrumentation.summary()['list']
+
+        assert stats['count'] == 100
+        assert stats['duration_ms'] == {'p50': 50.0, 'p95': 95.0, 'p99': 99.0, 'max': 100.0}
+        assert stats['queries']['p99'] == 2
+        assert 'bytes' not in stats
+
+    def test_ring_buffer_bounded(self, settings):
+        """Test only the latest samples are kept."""
+        settings.CUSTOMERS_INSTRUMENTATION_SAMPLES = 3
+        for duration in range(10):
+            instrumentation.record('list', {
+                'status': 200, 'duration_ms': float(duration), 'queries': 0,
+                'db_ms': 0.0, 'serialize_ms': 0.0, 'bytes': 0,
+            })
+
+        stats = instrumentation.summary()['list']
+
+        assert stats['count'] == 3
+        assert stats['duration_ms']['p50'] == 8.0
+
+
+@pytest.mark.django_db
+class TestInstrumentedViews:
+    """Tests for the instrumented views."""
+
+    def test_disabled_records_nothing(self, client):
+        """Test nothing is recorded unless enabled."""
+        client.get('/modules/customers/api/list/')
+
+        assert instrumentation.summary() == {}
+
+    def test_records_queries_and_size(self, client, enabled):
+        """Test query count, serialization and response size are recorded."""
+        Customer.objects.create(name="Ana")
+
+        response = client.get('/modules/customers/api/list/')
+
+        stats = instrumentation.summary()['list_ajax']
+        assert stats['count'] == 1
+        assert stats['queries']['max'] >= 1
+        assert stats['serialize_ms']['max'] > 0
+        assert stats['bytes']['max'] == len(response.content)
+
+    def test_log_line(self, client, enabled, caplog):
+        """Test each request is logged as one key=value line."""
+        with caplog.at_level(logging.INFO, logger='customers.instrumentation'):
+            client.get('/modules/customers/api/list/')
+
+        [line] = [record for record in caplog.records if record.name == 'customers.instrumentation']
+        assert line.getMessage().startswith('endpoint=list_ajax status=200 ')
+        assert line.customers_request['endpoint'] == 'list_ajax'
+
+    def test_stats_endpoint(self, client, enabled):
+        """Test the stats endpoint reports recorded endpoints."""
+        client.get('/modules/customers/api/list/')
+
+        data = client.get('/modules/customers/instrumentation/').json()
+
+        assert data['enabled'] is True
+        assert data['endpoints']['list_ajax']['count'] == 1
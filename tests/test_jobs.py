@@ -0,0 +1,280 @@
+"""
+Tests for background jobs.
+"""
+
+import json
+import threading
+from datetime import timedelta
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client
+from django.utils import timezone
+
+from customers import jobs
+from customers.models import Customer, CustomerJob, CustomerSale
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+@pytest.fixture(autouse=True)
+def jobs_dir(settings, tmp_path):
+    """Write job files to a temporary directory."""
+    settings.CUSTOMERS_JOBS_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def eager(settings):
+    """Run jobs inline when queued."""
+    settings.CUSTOMERS_JOBS_EAGER = True
+
+
+@pytest.fixture
+def customers():
+    """Create a few active customers and one inactive."""
+    Customer.objects.create(name="Ana Garcia", email="ana@example.com")
+    Customer.objects.create(name="Luis Perez", phone="600111222")
+    Customer.objects.create(name="Old", is_active=False)
+
+
+@pytest.mark.django_db
+class TestRunJob:
+    """Tests for jobs.run_job and the job runners."""
+
+    def test_export_writes_result_file(self, customers, jobs_dir):
+        """Test an export job writes the CSV of active customers to disk."""
+        job = CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT)
+
+        job = jobs.run_job(job.pk)
+
+        assert job.status == CustomerJob.STATUS_COMPLETED
+        assert job.progress == 100
+        assert job.result == {'rows': 2}
+        lines = (jobs_dir / job.result_file).read_text().splitlines()
+        assert lines[0].startswith('Name,Email')
+        assert [line.split(',')[0] for line in lines[1:]] == ["Ana Garcia", "Luis Perez"]
+
+    def test_import_reads_uploaded_file(self, jobs_dir):
+        """Test an import job imports the stored file and removes it."""
+        name = jobs.job_storage().save(
+            'imports/customers.csv',
+            SimpleUploadedFile('customers.csv', b"Name,Email\nAna,ana@example.com\nLuis,\n"),
+        )
+        job = CustomerJob.objects.create(
+            kind=CustomerJob.KIND_IMPORT, input_file=name, params={'filename': 'customers.csv'}
+        )
+
+        job = jobs.run_job(job.pk)
+
+        assert job.status == CustomerJob.STATUS_COMPLETED
+        assert job.result['created'] == 2
+        assert Customer.objects.count() == 2
+        assert not (jobs_dir / name).exists()
+
+    def test_rebuild_stats(self, customers):
+        """Test a stats job recomputes stats from linked sales."""
+        ana = Customer.objects.get(name="Ana Garcia")
+        CustomerSale.objects.create(
+            customer=ana, sale_id=1, total='40.00', sold_at=timezone.now(), completed=True
+        )
+        job = CustomerJob.objects.create(kind=CustomerJob.KIND_REBUILD_STATS)
+
+        job = jobs.run_job(job.pk)
+
+        assert job.result == {'processed': 3, 'updated': 1}
+        ana.refresh_from_db()
+        assert ana.visit_count == 1
+
+    def test_failure_is_recorded(self):
+        """Test a runner error marks the job failed instead of raising."""
+        job = CustomerJob.objects.create(kind=CustomerJob.KIND_IMPORT, input_file='imports/missing.csv')
+
+        job = jobs.run_job(job.pk)
+
+        assert job.status == CustomerJob.STATUS_FAILED
+        assert job.error
+        assert CustomerJob.objects.get(pk=job.pk).finished_at is not None
+
+    def test_job_only_runs_once(self):
+        """Test a job that is no longer pending is not claimed again."""
+        job = CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT)
+
+        assert jobs.run_job(job.pk) is not None
+        assert jobs.run_job(job.pk) is None
+
+    def test_progress_reported(self, monkeypatch):
+        """Test runners report progress through the job row."""
+        seen = []
+
+        def runner(job, report):
+            report(50, 'half')
+            seen.append(CustomerJob.objects.get(pk=job.pk).progress)
+            return {}
+
+        monkeypatch.setitem(jobs.RUNNERS, CustomerJob.KIND_EXPORT, runner)
+        job = CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT)
+        jobs.run_job(job.pk)
+
+        assert seen == [50]
+
+
+@pytest.mark.django_db
+class TestEnqueue:
+    """Tests for queueing jobs."""
+
+    def test_enqueue_submits_after_commit(self, monkeypatch, django_capture_on_commit_callbacks):
+        """Test jobs reach the worker pool only after the transaction commits."""
+        submitted = []
+
+        class Executor:
+            def submit(self, fn, job_id):
+                submitted.append(job_id)
+
+        monkeypatch.setattr(jobs, 'get_executor', Executor)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            job = jobs.enqueue(CustomerJob.KIND_EXPORT)
+            assert submitted == []
+
+        assert submitted == [job.pk]
+        assert job.status == CustomerJob.STATUS_PENDING
+
+    def test_executor_is_bounded(self, settings, monkeypatch):
+        """Test the worker pool size comes from the setting."""
+        settings.CUSTOMERS_JOBS_MAX_WORKERS = 3
+        monkeypatch.setattr(jobs, '_executor', None)
+
+        executor = jobs.get_executor()
+        try:
+            assert executor._max_workers == 3
+            assert jobs.get_executor() is executor
+        finally:
+            executor.shutdown()
+
+    def test_worker_runs_in_thread(self, monkeypatch):
+        """Test the pool entry point runs the job and releases connections."""
+        ran = []
+        monkeypatch.setattr(jobs, 'run_job', lambda job_id: ran.append(threading.current_thread().name))
+        monkeypatch.setattr(jobs.connections, 'close_all', lambda: ran.append('closed'))
+
+        jobs._work(1)
+
+        assert len(ran) == 2 and ran[-1] == 'closed'
+
+    def test_run_pending_command(self, customers):
+        """Test the management command runs queued jobs."""
+        CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT)
+        CustomerJob.objects.create(kind=CustomerJob.KIND_REBUILD_STATS)
+
+        call_command('run_customer_jobs')
+
+        assert not CustomerJob.objects.exclude(status=CustomerJob.STATUS_COMPLETED).exists()
+
+    def test_stale_running_jobs_failed(self, customers, settings):
+        """Test jobs running past the timeout are failed before pending jobs run."""
+        settings.CUSTOMERS_JOB_TIMEOUT = 60
+        now = timezone.now()
+        stale = CustomerJob.objects.create(
+            kind=CustomerJob.KIND_EXPORT, status=CustomerJob.STATUS_RUNNING,
+            started_at=now - timedelta(minutes=5),
+        )
+        running = CustomerJob.objects.create(
+            kind=CustomerJob.KIND_EXPORT, status=CustomerJob.STATUS_RUNNING,
+            started_at=now - timedelta(seconds=30),
+        )
+        pending = CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT)
+
+        assert jobs.run_pending_jobs() == 1
+
+        stale.refresh_from_db()
+        running.refresh_from_db()
+        pending.refresh_from_db()
+        assert stale.status == CustomerJob.STATUS_FAILED
+        assert stale.error and stale.finished_at
+        assert running.status == CustomerJob.STATUS_RUNNING
+        assert pending.status == CustomerJob.STATUS_COMPLETED
+
+    def test_job_timeout_disabled(self, settings):
+        """Test no running job is failed without a timeout."""
+        settings.CUSTOMERS_JOB_TIMEOUT = None
+        CustomerJob.objects.create(
+            kind=CustomerJob.KIND_EXPORT, status=CustomerJob.STATUS_RUNNING,
+            started_at=timezone.now() - timedelta(days=30),
+        )
+
+        assert jobs.fail_stale_jobs() == 0
+
+    def test_purge_removes_files(self, customers, jobs_dir):
+        """Test old finished jobs are deleted with their result files."""
+        job = jobs.run_job(CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT).pk)
+        CustomerJob.objects.filter(pk=job.pk).update(finished_at=timezone.now() - timedelta(days=10))
+
+        assert jobs.purge_jobs(7) == 1
+        assert not (jobs_dir / job.result_file).exists()
+
+
+@pytest.mark.django_db
+class TestJobViews:
+    """Tests for the background job endpoints."""
+
+    def test_export_job_and_download(self, client, eager, customers):
+        """Test queueing an export and downloading its file."""
+        response = client.post('/modules/customers/jobs/export/')
+
+        data = json.loads(response.content)
+        assert data['success'] is True
+        assert data['job']['status'] == 'completed'
+
+        download = client.get(data['job']['download_url'])
+        assert download.status_code == 200
+        assert b'Ana Garcia' in b''.join(download.streaming_content)
+
+    def test_import_job(self, client, eager):
+        """Test queueing an import from an uploaded file."""
+        upload = SimpleUploadedFile('customers.csv', b"Name\nAna\n", content_type='text/csv')
+
+        response = client.post('/modules/customers/jobs/import/', {'file': upload})
+
+        data = json.loads(response.content)
+        assert data['job']['result']['created'] == 1
+        assert Customer.objects.filter(name="Ana").exists()
+
+    def test_import_job_requires_file(self, client):
+        """Test an import without a file is rejected."""
+        response = client.post('/modules/customers/jobs/import/')
+
+        assert json.loads(response.content)['success'] is False
+        assert not CustomerJob.objects.exists()
+
+    def test_job_status(self, client):
+        """Test polling a pending job."""
+        job = CustomerJob.objects.create(kind=CustomerJob.KIND_REBUILD_STATS, progress=40)
+
+        data = json.loads(client.get(f'/modules/customers/jobs/{job.pk}/').content)
+
+        assert data['job']['status'] == 'pending'
+        assert data['job']['progress'] == 40
+        assert data['job']['download_url'] is None
+
+    def test_job_list_active(self, client):
+        """Test listing only queued or running jobs."""
+        CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT, status=CustomerJob.STATUS_COMPLETED)
+        running = CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT, status=CustomerJob.STATUS_RUNNING)
+
+        data = json.loads(client.get('/modules/customers/jobs/?active=1').content)
+
+        assert [job['id'] for job in data['jobs']] == [running.pk]
+
+    def test_download_unfinished_job(self, client):
+        """Test pending jobs have nothing to download."""
+        job = CustomerJob.objects.create(kind=CustomerJob.KIND_EXPORT)
+
+        response = client.get(f'/modules/customers/jobs/{job.pk}/download/')
+
+        assert response.status_code == 404
@@ -4,9 +4,13 @@ Unit tests for Customer model.
 
 import pytest
 from decimal import Decimal
+from django.db import models
 from django.utils import timezone
 
-from customers.models import Customer
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from customers.models import ConcurrentEditError, Customer, CustomerSale
 
 
 @pytest.mark.django_db
@@ -137,6 +141,132 @@ class TestCustomerStats:
 
         assert result == []
 
+    def test_update_stats_from_linked_sales(self):
+        """Test update_stats recomputes from completed linked sales."""
+        customer = Customer.objects.create(name="Linked", visit_count=7)
+        last = timezone.now()
+        CustomerSale.objects.create(customer=customer, sale_id=1, total=Decimal('10.00'), sold_at=last, completed=True)
+        CustomerSale.objects.create(customer=customer, sale_id=2, total=Decimal('5.50'), sold_at=last, completed=True)
+        CustomerSale.objects.create(customer=customer, sale_id=3, total=Decimal('99.00'), sold_at=last, completed=False)
+
+        customer.update_stats()
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('15.50')
+        assert customer.visit_count == 2
+        assert customer.last_purchase_at == last
+
+    def test_update_stats_ignores_namesakes(self):
+        """Test sales linked to a namesake are not counted."""
+        customer = Customer.objects.create(name="Same Name")
+        namesake = Customer.objects.create(name="Same Name")
+        CustomerSale.objects.create(customer=namesake, sale_id=1, total=Decimal('10.00'), sold_at=timezone.now(), completed=True)
+
+        customer.update_stats()
+
+        assert customer.visit_count == 0
+
+
+@pytest.mark.django_db
+class TestCustomerSaveChanges:
+    """Tests for dirty-field tracking and optimistic concurrency."""
+
+    def test_dirty_fields(self):
+        """Test only fields changed since loading are dirty."""
+        customer = Customer.objects.get(pk=Customer.objects.create(name="Ana").pk)
+        assert customer.get_dirty_fields() == set()
+
+        customer.notes = "VIP"
+        assert customer.get_dirty_fields() == {'notes'}
+
+    def test_writes_only_changed_columns(self):
+        """Test the UPDATE only sets changed columns plus version and updated_at."""
+        customer = Customer.objects.get(pk=Customer.objects.create(name="Ana", address="Calle 1").pk)
+        customer.phone = "600 111 222"
+
+        with CaptureQueriesContext(connection) as queries:
+            saved = customer.save_changes()
+
+        assert saved == {'phone', 'phone_normalized', 'version', 'updated_at'}
+        sql = queries.captured_queries[-1]['sql']
+        assert '"address"' not in sql and '"notes"' not in sql and '"total_spent"' not in sql
+        assert Customer.objects.get(pk=customer.pk).version == 2
+
+    def test_nothing_changed(self, django_assert_num_queries):
+        """Test saving an unchanged customer writes nothing."""
+        customer = Customer.objects.get(pk=Customer.objects.create(name="Ana").pk)
+
+        with django_assert_num_queries(0):
+            assert customer.save_changes() == set()
+
+    def test_concurrent_edit_rejected(self):
+        """Test a stale copy cannot overwrite a newer save."""
+        pk = Customer.objects.create(name="Ana").pk
+        first = Customer.objects.get(pk=pk)
+        second = Customer.objects.get(pk=pk)
+
+        first.email = "ana@example.com"
+        first.save_changes()
+        second.email = "other@example.com"
+        with pytest.raises(ConcurrentEditError):
+            second.save_changes()
+
+        assert Customer.objects.get(pk=pk).email == "ana@example.com"
+        assert second.version == 1
+
+    def test_rejected_edit_keeps_transaction_usable(self):
+        """Test a stale save writes nothing and leaves the caller's transaction usable."""
+        from django.db import transaction
+
+        pk = Customer.objects.create(name="Ana").pk
+        customer = Customer.objects.get(pk=pk)
+        Customer.objects.filter(pk=pk).update(version=2)
+
+        with transaction.atomic():
+            customer.name = "Ana Garcia"
+            with pytest.raises(ConcurrentEditError):
+                customer.save_changes()
+            assert Customer.objects.get(pk=pk).name == "Ana"
+
+        assert customer.version == 1
+
+    def test_edit_invalidates_cache_on_commit(self, django_capture_on_commit_callbacks):
+        """Test an edit still notifies post_save listeners, so cached lists are invalidated."""
+        from customers.cache import get_version
+
+        customer = Customer.objects.get(pk=Customer.objects.create(name="Ana").pk)
+        version = get_version()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            customer.name = "Ana Garcia"
+            customer.save_changes()
+
+        assert get_version() != version
+        assert customer.get_dirty_fields() == set()
+
+    def test_edit_keeps_concurrent_stats(self):
+        """Test an edit does not overwrite stats updated by a sale meanwhile."""
+        pk = Customer.objects.create(name="Ana").pk
+        customer = Customer.objects.get(pk=pk)
+        Customer.objects.filter(pk=pk).update(total_spent=Decimal('99.00'), visit_count=3)
+
+        customer.name = "Ana Garcia"
+        customer.save_changes()
+
+        customer.refresh_from_db()
+        assert (customer.name, customer.total_spent, customer.visit_count) == ("Ana Garcia", Decimal('99.00'), 3)
+
+    def test_update_stats_writes_stats_only(self):
+        """Test update_stats leaves other columns and the version alone."""
+        customer = Customer.objects.create(name="Ana")
+        Customer.objects.filter(pk=customer.pk).update(notes="Changed elsewhere")
+
+        customer.update_stats()
+
+        customer.refresh_from_db()
+        assert customer.notes == "Changed elsewhere"
+        assert customer.version == 1
+
 
 @pytest.mark.django_db
 class TestCustomerIndexes:
@@ -162,3 +292,39 @@ class TestCustomerIndexes:
         index_fields = [idx.fields for idx in indexes]
 
         assert ['email'] in index_fields
+
+
+@pytest.mark.django_db
+class TestCustomerSaleQueryPlans:
+    """Tests that purchase lookups by customer use the link index."""
+
+    def test_recent_purchases_use_index(self):
+        """Test recent purchases are an index lookup on customer id."""
+        from django.db import connection
+
+        if connection.vendor != 'sqlite':
+            pytest.skip('EXPLAIN output checked on SQLite only')
+
+        customer = Customer.objects.create(name="Planned")
+        index_name = CustomerSale._meta.indexes[0].name
+
+        plan = customer.sales.filter(completed=True).order_by('-sold_at').values('sale_id')[:10].explain()
+
+        assert index_name in plan
+        assert 'TEMP B-TREE' not in plan
+
+    def test_stats_aggregate_uses_index(self):
+        """Test the stats aggregate reads only the customer's index range."""
+        from django.db import connection
+
+        if connection.vendor != 'sqlite':
+            pytest.skip('EXPLAIN output checked on SQLite only')
+
+        customer = Customer.objects.create(name="Planned")
+
+        plan = customer.sales.filter(completed=True).values('customer').annotate(
+            total=models.Sum('total')
+        ).explain()
+
+        assert 'USING INDEX' in plan
+        assert 'SCAN customer_customersale' not in plan
@@ -0,0 +1,79 @@
+"""
+Query-count guards: every endpoint runs a fixed number of queries
+whatever the number of customers (see the scaling_queries fixture).
+"""
+
+import pytest
+from django.test import Client
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+def get(client, url, **params):
+    response = client.get(url, params)
+    assert response.status_code == 200
+    return response
+
+
+@pytest.mark.django_db
+class TestQueryCounts:
+    """Query budgets per endpoint, checked with 1 and 500 customers."""
+
+    def test_list(self, client, scaling_queries):
+        """Test the list page (cached counters are cold)."""
+        scaling_queries(lambda customer: get(client, '/modules/customers/'), 1)
+
+    def test_list_ajax(self, client, scaling_queries):
+        """Test a page of the list API."""
+        scaling_queries(lambda customer: get(client, '/modules/customers/api/list/'), 1)
+
+    def test_list_ajax_search(self, client, scaling_queries):
+        """Test a search in the list API."""
+        scaling_queries(lambda customer: get(client, '/modules/customers/api/list/', search='cliente'), 1)
+
+    def test_list_ajax_segment(self, client, scaling_queries):
+        """Test the list API filtered by segment."""
+        scaling_queries(lambda customer: get(client, '/modules/customers/api/list/', segment='promising'), 1)
+
+    def test_detail(self, client, scaling_queries):
+        """Test the detail page of a customer with many sales."""
+        # Customer with metrics, tags, and recent purchases when Sales is installed
+        scaling_queries(lambda customer: get(client, f'/modules/customers/{customer.pk}/'), 3)
+
+    def test_edit_form(self, client, scaling_queries):
+        """Test the edit form."""
+        scaling_queries(lambda customer: get(client, f'/modules/customers/{customer.pk}/edit/'), 1)
+
+    def test_edit_save(self, client, scaling_queries):
+        """Test saving an edit."""
+        def edit(customer):
+            response = client.post(f'/modules/customers/{customer.pk}/edit/', {'name': 'Editado', 'is_active': 'on'})
+            assert response.json()['success'] is True
+
+        # Load, then UPDATE of the changed columns
+        scaling_queries(edit, 2)
+
+    def test_export(self, client, scaling_queries):
+        """Test streaming the CSV export."""
+        def export(customer):
+            b''.join(get(client, '/modules/customers/export/').streaming_content)
+
+        scaling_queries(export, 1)
+
+    def test_update_stats(self, client, scaling_queries):
+        """Test recomputing the stats of a customer with many sales."""
+        # Load, sales aggregate, UPDATE, month buckets (DELETE, aggregate, INSERT)
+        scaling_queries(lambda customer: client.post(f'/modules/customers/{customer.pk}/update-stats/'), 6)
+
+    def test_spending(self, client, scaling_queries):
+        """Test the monthly spending endpoint."""
+        # Existence check and the month buckets
+        scaling_queries(lambda customer: get(client, f'/modules/customers/{customer.pk}/spending/'), 2)
+
+    def test_sync(self, client, scaling_queries):
+        """Test a page of the delta sync feed."""
+        scaling_queries(lambda customer: get(client, '/modules/customers/api/sync/', limit=100), 1)
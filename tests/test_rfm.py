@@ -0,0 +1,180 @@
+"""
+Tests for RFM segmentation.
+"""
+
+import json
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.utils import timezone
+
+from customers import rfm
+from customers.models import Customer, CustomerMetrics
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+@pytest.fixture
+def now():
+    return timezone.now()
+
+
+@pytest.fixture
+def buyers(now):
+    """Create 10 customers with increasing recency, visits and spend, plus one without purchases."""
+    created = [
+        Customer.objects.create(
+            name=f"Cliente {i}",
+            last_purchase_at=now - timedelta(days=10 * (10 - i)),
+            visit_count=i,
+            total_spent=Decimal(100 * i),
+        )
+        for i in range(1, 11)
+    ]
+    created.append(Customer.objects.create(name="Sin compras"))
+    return created
+
+
+class TestSegmentFor:
+    """Tests for rfm.segment_for."""
+
+    @pytest.mark.parametrize('recency, frequency, segment', [
+        (5, 5, CustomerMetrics.SEGMENT_CHAMPIONS),
+        (3, 3, CustomerMetrics.SEGMENT_LOYAL),
+        (5, 1, CustomerMetrics.SEGMENT_PROMISING),
+        (1, 4, CustomerMetrics.SEGMENT_AT_RISK),
+        (1, 1, CustomerMetrics.SEGMENT_HIBERNATING),
+        (3, 1, CustomerMetrics.SEGMENT_NEEDS_ATTENTION),
+        (0, 0, CustomerMetrics.SEGMENT_NO_PURCHASES),
+    ])
+    def test_segments(self, recency, frequency, segment):
+        """Test each score combination maps to its segment."""
+        assert rfm.segment_for(recency, frequency) == segment
+
+
+@pytest.mark.django_db
+class TestRebuildMetrics:
+    """Tests for rfm.rebuild_metrics."""
+
+    def test_quintile_scores(self, buyers, now):
+        """Test recent, frequent, big spenders score 5 and the rest lower."""
+        rfm.rebuild_metrics(now=now)
+
+        best = CustomerMetrics.objects.get(customer=buyers[9])
+        worst = CustomerMetrics.objects.get(customer=buyers[0])
+        assert best.rfm == '555'
+        assert best.segment == CustomerMetrics.SEGMENT_CHAMPIONS
+        assert worst.rfm == '111'
+        assert worst.segment == CustomerMetrics.SEGMENT_HIBERNATING
+
+        none = CustomerMetrics.objects.get(customer=buyers[10])
+        assert none.segment == CustomerMetrics.SEGMENT_NO_PURCHASES
+        assert none.recency_days is None
+
+    def test_churn_risk(self, buyers, now, settings):
+        """Test repeat customers silent for longer than the setting are at risk."""
+        settings.CUSTOMERS_CHURN_RISK_DAYS = 60
+        rfm.rebuild_metrics(now=now)
+
+        at_risk = set(CustomerMetrics.objects.filter(churn_risk=True).values_list('customer_id', flat=True))
+        # Customer 1 bought once, so it is not a repeat customer
+        assert at_risk == {customer.pk for customer in buyers[1:3]}
+
+    def test_numpy_and_python_agree(self, buyers, now, monkeypatch):
+        """Test the pure-Python fallback scores exactly like NumPy."""
+        if rfm.np is None:
+            pytest.skip('NumPy not installed')
+        rows = list(Customer.objects.order_by('pk').values_list('pk', 'last_purchase_at', 'visit_count', 'total_spent'))
+        with_numpy = rfm.score_rows(rows, rfm.compute_thresholds(now), now)
+
+        monkeypatch.setattr(rfm, 'np', None)
+        without_numpy = rfm.score_rows(rows, rfm.compute_thresholds(now), now)
+
+        assert with_numpy == without_numpy
+
+    def test_only_changed_rows_written(self, buyers, now):
+        """Test a second run writes nothing and a change rewrites few rows."""
+        assert rfm.rebuild_metrics(now=now) == (11, 11)
+        assert rfm.rebuild_metrics(now=now) == (11, 0)
+
+        Customer.objects.filter(pk=buyers[10].pk).update(
+            last_purchase_at=now, visit_count=1, total_spent=Decimal('5.00')
+        )
+        processed, written = rfm.rebuild_metrics(now=now)
+
+        assert processed == 11
+        assert 0 < written < 11
+        assert CustomerMetrics.objects.get(customer=buyers[10]).recency_days == 0
+
+    def test_batches_and_resume(self, buyers, now):
+        """Test batching reports progress and start_after skips done customers."""
+        calls = []
+        rfm.rebuild_metrics(batch_size=4, progress=lambda *args: calls.append(args), now=now)
+
+        assert [call[0] for call in calls] == [4, 8, 11]
+        assert rfm.rebuild_metrics(start_after=buyers[7].pk, now=now) == (3, 0)
+
+    def test_no_purchases_at_all(self, now):
+        """Test customers are scored even when nobody has purchased."""
+        Customer.objects.create(name="Ana")
+
+        assert rfm.rebuild_metrics(now=now) == (1, 1)
+        assert CustomerMetrics.objects.get().segment == CustomerMetrics.SEGMENT_NO_PURCHASES
+
+    def test_command(self, buyers):
+        """Test the management command reports progress."""
+        out = StringIO()
+
+        call_command('rebuild_customer_metrics', '--batch-size', '5', stdout=out)
+
+        assert 'Done: 11 customers processed, 11 written' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestSegmentFilters:
+    """Tests for the segment and churn filters of the list API."""
+
+    def test_filter_by_segment(self, client, buyers):
+        """Test filtering the list by segment and churn risk."""
+        rfm.rebuild_metrics()
+        url = '/modules/customers/api/list/'
+
+        data = json.loads(client.get(url, {'segment': 'champions'}).content)
+        champions = set(
+            CustomerMetrics.objects.filter(segment='champions').values_list('customer_id', flat=True)
+        )
+        assert champions
+        assert {row['id'] for row in data['customers']} == champions
+
+        data = json.loads(client.get(url, {'churn_risk': '1'}).content)
+        assert len(data['customers']) == CustomerMetrics.objects.filter(churn_risk=True).count()
+
+    def test_new_customer_listed_after_rebuild(self, client, buyers, django_capture_on_commit_callbacks):
+        """Test a customer created after a rebuild is filtered by segment once metrics are rebuilt."""
+        url = '/modules/customers/api/list/'
+        with django_capture_on_commit_callbacks(execute=True):
+            rfm.rebuild_metrics()
+            newcomer = Customer.objects.create(name="Nuevo")
+
+        data = json.loads(client.get(url, {'segment': 'no_purchases'}).content)
+        assert newcomer.pk not in {row['id'] for row in data['customers']}
+
+        with django_capture_on_commit_callbacks(execute=True):
+            rfm.rebuild_metrics()
+
+        data = json.loads(client.get(url, {'segment': 'no_purchases'}).content)
+        assert newcomer.pk in {row['id'] for row in data['customers']}
+
+    def test_unknown_segment_ignored(self, client, buyers):
+        """Test an unknown segment does not filter."""
+        data = json.loads(client.get('/modules/customers/api/list/', {'segment': 'nope'}).content)
+
+        assert len(data['customers']) == len(buyers)
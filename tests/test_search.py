@@ -0,0 +1,209 @@
+"""
+Tests for customer search backends.
+"""
+
+import pytest
+import json
+from types import SimpleNamespace
+
+from django.db import connection
+from django.test import Client
+
+from customers import search
+from customers.models import Customer
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+@pytest.fixture
+def backend():
+    """Return the search backend for the test database."""
+    return search.get_search_backend()
+
+
+def search_ids(backend, term):
+    queryset, order = backend.search(Customer.objects.all(), term)
+    return list(queryset.order_by(*order).values_list('id', flat=True))
+
+
+@pytest.mark.django_db
+class TestSearchBackend:
+    """Tests for the configured search backend."""
+
+    def test_backend_matches_vendor(self, backend):
+        """Test the backend is chosen from the database vendor."""
+        expected = {
+            'sqlite': search.SQLiteFTSBackend,
+            'postgresql': search.PostgresTrigramBackend,
+        }.get(connection.vendor, search.SearchBackend)
+        if connection.vendor == 'postgresql' and not search._pg_trgm_available():
+            expected = search.SearchBackend
+
+        assert type(backend) is expected
+
+    def test_substring_match_all_fields(self, backend):
+        """Test a term matches inside name, phone, email and tax id."""
+        by_name = Customer.objects.create(name="Maria Lopez")
+        by_phone = Customer.objects.create(name="A", phone="+34600123456")
+        by_email = Customer.objects.create(name="B", email="lopez@example.com")
+        by_tax_id = Customer.objects.create(name="C", tax_id="X1234567L")
+        Customer.objects.create(name="Nobody")
+
+        assert set(search_ids(backend, 'lopez')) == {by_name.id, by_email.id}
+        assert search_ids(backend, '0012') == [by_phone.id]
+        assert search_ids(backend, '234567l') == [by_tax_id.id]
+
+    def test_short_term(self, backend):
+        """Test terms shorter than a trigram still match."""
+        customer = Customer.objects.create(name="Jo")
+
+        assert search_ids(backend, 'jo') == [customer.id]
+
+    def test_index_follows_updates_and_deletes(self, backend):
+        """Test the search index is kept in sync with the customer table."""
+        customer = Customer.objects.create(name="Before Rename")
+
+        customer.name = "After Rename"
+        customer.save()
+        assert search_ids(backend, 'before') == []
+        assert search_ids(backend, 'after') == [customer.id]
+
+        customer.delete()
+        assert search_ids(backend, 'after') == []
+
+    def test_ranking(self, backend):
+        """Test exact and prefix name matches rank first."""
+        contains = Customer.objects.create(name="Ana Garcia")
+        prefix = Customer.objects.create(name="Garcia Perez")
+        exact = Customer.objects.create(name="Garcia")
+
+        assert search_ids(backend, 'garcia') == [exact.id, prefix.id, contains.id]
+
+    def test_install_search_indexes_idempotent(self):
+        """Test installing search indexes twice is a no-op on SQLite."""
+        if connection.vendor != 'sqlite':
+            pytest.skip('SQLite FTS only')
+
+        assert search.install_search_indexes(connection) is False
+
+    def test_pg_trgm_refused(self, monkeypatch):
+        """Test a refused CREATE EXTENSION is rolled back and search falls back to icontains."""
+        class RefusingCursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.cursor.close()
+
+            def execute(self, sql, params=None):
+                if sql.startswith('CREATE EXTENSION'):
+                    # Fail inside the savepoint, like PostgreSQL would
+                    self.cursor.execute('SELECT * FROM missing_table_for_test')
+                raise AssertionError(f'Unexpected SQL after refusal: {sql}')
+
+        postgres = SimpleNamespace(
+            vendor='postgresql',
+            alias=connection.alias,
+            introspection=connection.introspection,
+            cursor=lambda: RefusingCursor(connection.cursor()),
+        )
+
+        assert search.install_search_indexes(postgres) is False
+        # The surrounding transaction is still usable
+        assert Customer.objects.create(name='After refusal').pk
+
+        monkeypatch.setattr(search, 'connection', SimpleNamespace(vendor='postgresql'))
+        monkeypatch.setattr(search, '_pg_trgm_available', lambda: False)
+        search.get_search_backend.cache_clear()
+        try:
+            assert type(search.get_search_backend()) is search.SearchBackend
+        finally:
+            search.get_search_backend.cache_clear()
+
+    def test_plain_backend(self):
+        """Test the fallback icontains backend finds the same customers."""
+        customer = Customer.objects.create(name="Fallback Customer")
+
+        assert search_ids(search.SearchBackend(), 'back cust') == [customer.id]
+        assert search_ids(search.SearchBackend(), 'customers') == []
+
+
+@pytest.mark.django_db
+class TestSearchPagination:
+    """Tests for paging through ranked search results."""
+
+    def test_search_pages_cover_all_matches(self, client):
+        """Test following cursors returns every match exactly once."""
+        Customer.objects.bulk_create(
+            Customer(name=f"Smith {i}" if i % 3 else f"John Smith {i}") for i in range(240)
+        )
+        Customer.objects.create(name="Other")
+
+        seen = []
+        cursor = ''
+        while True:
+            response = client.get('/modules/customers/api/list/', {'search': 'smith', 'cursor': cursor})
+            data = json.loads(response.content)
+            seen.extend(customer['id'] for customer in data['customers'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        assert len(seen) == 240
+        assert len(set(seen)) == 240
+
+
+@pytest.mark.django_db
+class TestNormalizedSearch:
+    """Tests for prefix lookups on normalized search keys."""
+
+    def test_keys_maintained_on_save(self):
+        """Test normalized keys are computed when saving."""
+        customer = Customer.objects.create(name="  José-Luis  Núñez ", phone="+34 600-12-34", tax_id="x-1234567 l")
+
+        assert customer.name_normalized == "joseluis nunez"
+        assert customer.phone_normalized == "346001234"
+        assert customer.tax_id_normalized == "X1234567L"
+
+        customer.phone = "0044 20 7946 0000"
+        customer.save(update_fields=['phone'])
+        customer.refresh_from_db()
+        assert customer.phone_normalized == "442079460000"
+
+    def test_formatted_phone_prefix(self, backend):
+        """Test a differently formatted phone prefix finds the customer."""
+        customer = Customer.objects.create(name="Phone", phone="+34600123456")
+
+        assert search_ids(backend, '+34 600-12') == [customer.id]
+        assert search_ids(backend, '0034 600 123') == [customer.id]
+
+    def test_accent_insensitive_name_prefix(self, backend):
+        """Test a name prefix matches regardless of accents and case."""
+        customer = Customer.objects.create(name="Íñigo Martínez")
+
+        assert search_ids(backend, 'inigo mart') == [customer.id]
+
+    def test_tax_id_prefix(self, backend):
+        """Test a tax id prefix matches regardless of separators."""
+        customer = Customer.objects.create(name="Tax", tax_id="B-12.345.678")
+
+        assert search_ids(backend, 'b12345') == [customer.id]
+
+    def test_prefix_lookup_uses_index(self):
+        """Test the phone prefix lookup is served by an index."""
+        from customers.normalization import prefix_lookup
+
+        if connection.vendor != 'sqlite':
+            pytest.skip('EXPLAIN output checked on SQLite only')
+
+        plan = Customer.objects.filter(prefix_lookup('phone_normalized', '34600')).explain()
+
+        assert 'phone_n' in plan
+        assert 'SCAN customer_customer' not in plan
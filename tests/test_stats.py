@@ -0,0 +1,519 @@
+"""
+Unit tests for incremental customer stats.
+"""
+
+import pytest
+from datetime import timedelta
+from io import StringIO
+from decimal import Decimal
+from django.utils import timezone
+
+from customers import signals, stats
+from customers.models import Customer, CustomerMonthlySpend, CustomerSale
+
+from .conftest import captured_queries
+
+
+class FakeSale:
+    """Minimal stand-in for sales.models.Sale."""
+
+    STATUS_COMPLETED = 'completed'
+    STATUS_REFUNDED = 'refunded'
+
+    def __init__(self, pk=1, status='completed', customer_name='', total='0.00', created_at=None):
+        self.pk = pk
+        self.status = status
+        self.customer_name = customer_name
+        self.total = Decimal(total)
+        self.created_at = created_at or timezone.now()
+
+
+def save(sale):
+    """Simulate Sale.save() signal dispatch."""
+    signals.sale_post_save(sender=FakeSale, instance=sale)
+
+
+@pytest.fixture
+def customer():
+    """Create a customer with no purchases."""
+    return Customer.objects.create(name="Stats Customer")
+
+
+@pytest.mark.django_db
+class TestApplySale:
+    """Tests for stats.apply_sale and stats.revert_sale."""
+
+    def test_apply_sale(self, customer):
+        """Test applying a sale increments stats."""
+        now = timezone.now()
+
+        stats.apply_sale(Customer.objects.filter(pk=customer.pk), Decimal('30.00'), now)
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('30.00')
+        assert customer.visit_count == 1
+        assert customer.last_purchase_at == now
+
+    def test_apply_older_sale_keeps_last_purchase(self, customer):
+        """Test an older sale does not move last_purchase_at back."""
+        now = timezone.now()
+        customers = Customer.objects.filter(pk=customer.pk)
+
+        stats.apply_sale(customers, Decimal('10.00'), now)
+        stats.apply_sale(customers, Decimal('5.00'), now - timedelta(days=3))
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('15.00')
+        assert customer.visit_count == 2
+        assert customer.last_purchase_at == now
+
+    def test_revert_sale(self, customer):
+        """Test reverting a sale decrements stats."""
+        now = timezone.now()
+        customers = Customer.objects.filter(pk=customer.pk)
+        stats.apply_sale(customers, Decimal('10.00'), now - timedelta(days=1))
+        stats.apply_sale(customers, Decimal('20.00'), now)
+
+        stats.revert_sale(customers, Decimal('10.00'), now - timedelta(days=1))
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('20.00')
+        assert customer.visit_count == 1
+        assert customer.last_purchase_at == now
+
+    def test_revert_sale_visit_count_not_negative(self, customer):
+        """Test visit_count never drops below zero."""
+        stats.revert_sale(Customer.objects.filter(pk=customer.pk), Decimal('0.00'), None)
+
+        customer.refresh_from_db()
+        assert customer.visit_count == 0
+
+    def test_apply_sale_invalidates_dashboard(self, customer, django_capture_on_commit_callbacks):
+        """Test revenue counters are refreshed once the sale is committed."""
+        assert stats.get_dashboard_stats()['total_revenue'] == Decimal('0.00')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            stats.apply_sale(Customer.objects.filter(pk=customer.pk), Decimal('10.00'), timezone.now())
+            # Not invalidated before the commit, or the old counters could be cached again
+            assert stats.get_dashboard_stats()['total_revenue'] == Decimal('0.00')
+
+        assert stats.get_dashboard_stats()['total_revenue'] == Decimal('10.00')
+
+    def test_apply_sale_single_query(self, customer, django_assert_num_queries):
+        """Test a sale is applied with one UPDATE."""
+        customers = Customer.objects.filter(pk=customer.pk)
+
+        with django_assert_num_queries(1):
+            stats.apply_sale(customers, Decimal('10.00'), timezone.now())
+
+
+@pytest.mark.django_db
+class TestSaleSignals:
+    """Tests for the Sales signal handlers."""
+
+    def test_completed_sale_applied(self, customer):
+        """Test saving a new completed sale links it and updates stats."""
+        save(FakeSale(customer_name=customer.name, total='12.50'))
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('12.50')
+        assert customer.visit_count == 1
+        assert CustomerSale.objects.get(sale_id=1).customer == customer
+
+    def test_pending_sale_linked_not_counted(self, customer):
+        """Test a sale that is not completed is linked but not counted."""
+        save(FakeSale(status='pending', customer_name=customer.name, total='12.50'))
+
+        customer.refresh_from_db()
+        assert customer.visit_count == 0
+        assert CustomerSale.objects.filter(sale_id=1, completed=False).exists()
+
+    def test_unknown_customer_not_linked(self, customer):
+        """Test a sale for an unknown name is ignored."""
+        save(FakeSale(customer_name="Somebody Else", total='12.50'))
+
+        assert not CustomerSale.objects.exists()
+
+    def test_namesakes_not_linked(self, customer):
+        """Test an ambiguous name is not resolved to either customer."""
+        Customer.objects.create(name=customer.name)
+
+        save(FakeSale(customer_name=customer.name, total='12.50'))
+
+        assert not CustomerSale.objects.exists()
+
+    def test_sale_customer_id_wins(self, customer):
+        """Test a customer set on the sale is used over the name."""
+        other = Customer.objects.create(name="Other")
+        sale = FakeSale(customer_name=customer.name, total='5.00')
+        sale.customer_id = other.pk
+
+        save(sale)
+
+        other.refresh_from_db()
+        assert other.visit_count == 1
+
+    def test_sale_after_merge_reaches_primary(self, customer):
+        """Test sales naming or pointing at a merged duplicate count for the primary."""
+        from customers.dedup import merge_customers
+
+        namesake = Customer.objects.create(name=customer.name)
+        renamed = Customer.objects.create(name="Stats Customr")
+        merge_customers(customer, [namesake.pk, renamed.pk])
+
+        save(FakeSale(pk=1, customer_name=customer.name, total='1.00'))
+        save(FakeSale(pk=2, customer_name=renamed.name, total='2.00'))
+        by_id = FakeSale(pk=3, total='3.00')
+        by_id.customer_id = namesake.pk
+        save(by_id)
+        # Re-saving keeps the sale with the primary
+        save(by_id)
+
+        customer.refresh_from_db()
+        assert (customer.visit_count, customer.total_spent) == (3, Decimal('6.00'))
+        assert set(CustomerSale.objects.values_list('customer_id', flat=True)) == {customer.pk}
+
+    def test_link_survives_rename(self, customer):
+        """Test later saves use the link, not the (changed) name."""
+        sale = FakeSale(customer_name=customer.name, total='5.00')
+        save(sale)
+        customer.name = "Renamed"
+        customer.save()
+
+        sale.status = FakeSale.STATUS_REFUNDED
+        save(sale)
+
+        customer.refresh_from_db()
+        assert customer.visit_count == 0
+
+    def test_reassigned_sale_moves(self, customer):
+        """Test a sale moved to another customer is reverted from the old one."""
+        other = Customer.objects.create(name="Other")
+        sale = FakeSale(customer_name=customer.name, total='5.00')
+        sale.customer_id = customer.pk
+        save(sale)
+
+        sale.customer_id = other.pk
+        save(sale)
+
+        customer.refresh_from_db()
+        other.refresh_from_db()
+        assert (customer.visit_count, customer.total_spent) == (0, Decimal('0.00'))
+        assert (other.visit_count, other.total_spent) == (1, Decimal('5.00'))
+        assert CustomerSale.objects.get().customer_id == other.pk
+        assert buckets(customer) == {}
+        assert list(buckets(other).values()) == [(Decimal('5.00'), 1)]
+
+    def test_renamed_sale_customer_moves(self, customer):
+        """Test a sale whose customer name now names another customer is moved."""
+        other = Customer.objects.create(name="Other")
+        sale = FakeSale(customer_name=customer.name, total='5.00')
+        save(sale)
+
+        sale.customer_name = other.name
+        save(sale)
+
+        customer.refresh_from_db()
+        other.refresh_from_db()
+        assert customer.visit_count == 0
+        assert other.visit_count == 1
+
+    def test_existing_link_reused(self, customer, monkeypatch):
+        """Test a link created concurrently is updated rather than duplicated."""
+        sale = FakeSale(customer_name=customer.name, total='5.00')
+        CustomerSale.objects.create(customer=customer, sale_id=sale.pk, sold_at=sale.created_at)
+        real_sale_link = stats._sale_link
+        calls = []
+
+        def racing_sale_link(sale_id, lock=False):
+            # The link is not seen until it is read again
+            calls.append(lock)
+            return None if len(calls) <= 2 else real_sale_link(sale_id, lock)
+
+        monkeypatch.setattr(stats, '_sale_link', racing_sale_link)
+        save(sale)
+
+        customer.refresh_from_db()
+        assert CustomerSale.objects.count() == 1
+        assert customer.visit_count == 1
+
+    def test_resave_is_single_lookup(self, customer, django_assert_num_queries):
+        """Test re-saving an unchanged sale costs one indexed lookup."""
+        sale = FakeSale(customer_name=customer.name, total='12.50')
+        save(sale)
+
+        with django_assert_num_queries(1):
+            save(sale)
+
+        customer.refresh_from_db()
+        assert customer.visit_count == 1
+
+    def test_pending_to_completed(self, customer):
+        """Test completing a pending sale applies it."""
+        sale = FakeSale(status='pending', customer_name=customer.name, total='8.00')
+        save(sale)
+
+        sale.status = FakeSale.STATUS_COMPLETED
+        save(sale)
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('8.00')
+        assert customer.visit_count == 1
+
+    def test_refund_reverts(self, customer):
+        """Test refunding a completed sale reverts it."""
+        sale = FakeSale(customer_name=customer.name, total='8.00')
+        save(sale)
+
+        sale.status = FakeSale.STATUS_REFUNDED
+        save(sale)
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('0.00')
+        assert customer.visit_count == 0
+        assert customer.last_purchase_at is None
+
+    def test_refund_restores_previous_last_purchase(self, customer):
+        """Test refunding the latest sale falls back to the previous one."""
+        earlier = timezone.now() - timedelta(days=2)
+        save(FakeSale(pk=1, customer_name=customer.name, total='3.00', created_at=earlier))
+        latest = FakeSale(pk=2, customer_name=customer.name, total='8.00')
+        save(latest)
+
+        latest.status = FakeSale.STATUS_REFUNDED
+        save(latest)
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('3.00')
+        assert customer.last_purchase_at == earlier
+
+    def test_total_change_adjusts(self, customer):
+        """Test changing the total of a completed sale adjusts total_spent."""
+        sale = FakeSale(customer_name=customer.name, total='8.00')
+        save(sale)
+
+        sale.total = Decimal('10.00')
+        save(sale)
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('10.00')
+        assert customer.visit_count == 1
+
+    def test_delete_reverts(self, customer):
+        """Test deleting a completed sale reverts and unlinks it."""
+        sale = FakeSale(customer_name=customer.name, total='8.00')
+        save(sale)
+
+        signals.sale_post_delete(sender=FakeSale, instance=sale)
+
+        customer.refresh_from_db()
+        assert customer.total_spent == Decimal('0.00')
+        assert customer.visit_count == 0
+        assert not CustomerSale.objects.exists()
+
+
+def buckets(customer):
+    """Return {month: (total, visits)} of a customer's monthly spend."""
+    return {
+        row.month: (row.total, row.visits)
+        for row in CustomerMonthlySpend.objects.filter(customer=customer)
+    }
+
+
+@pytest.mark.django_db
+class TestMonthlySpend:
+    """Tests for the monthly spend buckets."""
+
+    def test_sales_rolled_up_by_month(self, customer):
+        """Test completed sales add to the bucket of their month."""
+        now = timezone.now()
+        last_month = stats.month_of(now) - timedelta(days=1)
+        save(FakeSale(pk=1, customer_name=customer.name, total='10.00', created_at=now))
+        save(FakeSale(pk=2, customer_name=customer.name, total='30.00', created_at=now))
+        save(FakeSale(pk=3, customer_name=customer.name, total='5.00', created_at=now - timedelta(days=now.day + 1)))
+
+        assert buckets(customer) == {
+            stats.month_of(now): (Decimal('40.00'), 2),
+            last_month.replace(day=1): (Decimal('5.00'), 1),
+        }
+        assert CustomerMonthlySpend.objects.get(month=stats.month_of(now)).average_ticket == Decimal('20.00')
+
+    def test_refund_and_delete_revert(self, customer):
+        """Test refunds and deletions leave the bucket as before."""
+        first = FakeSale(pk=1, customer_name=customer.name, total='10.00')
+        second = FakeSale(pk=2, customer_name=customer.name, total='30.00')
+        save(first)
+        save(second)
+
+        first.status = FakeSale.STATUS_REFUNDED
+        save(first)
+        assert buckets(customer) == {stats.month_of(second.created_at): (Decimal('30.00'), 1)}
+
+        signals.sale_post_delete(sender=FakeSale, instance=second)
+        assert buckets(customer) == {}
+
+    def test_total_change_adjusts(self, customer):
+        """Test editing a completed sale moves the difference."""
+        sale = FakeSale(customer_name=customer.name, total='8.00')
+        save(sale)
+
+        sale.total = Decimal('10.00')
+        save(sale)
+
+        assert buckets(customer) == {stats.month_of(sale.created_at): (Decimal('10.00'), 1)}
+
+    def test_rebuild_matches_incremental(self, customer):
+        """Test update_stats() rebuilds the same buckets."""
+        now = timezone.now()
+        save(FakeSale(pk=1, customer_name=customer.name, total='10.00', created_at=now))
+        save(FakeSale(pk=2, customer_name=customer.name, total='7.50', created_at=now - timedelta(days=70)))
+        incremental = buckets(customer)
+        CustomerMonthlySpend.objects.all().delete()
+
+        customer.update_stats()
+
+        assert buckets(customer) == incremental
+
+    def test_get_monthly_spend_fills_gaps(self, customer):
+        """Test empty months are returned as zeros, oldest first."""
+        now = timezone.now()
+        save(FakeSale(customer_name=customer.name, total='10.00', created_at=now))
+
+        months = stats.get_monthly_spend(customer.pk, months=3)
+
+        assert [visits for _month, _total, visits in months] == [0, 0, 1]
+        assert months[-1][0] == stats.month_of(now)
+        assert months[0][0] < months[1][0] < months[2][0]
+
+    def test_spending_endpoint(self, customer, django_assert_num_queries):
+        """Test the endpoint reads only the customer and its buckets."""
+        from django.test import Client
+
+        for pk in range(1, 21):
+            save(FakeSale(pk=pk, customer_name=customer.name, total='5.00'))
+        client = Client()
+
+        with django_assert_num_queries(2):
+            response = client.get(f'/modules/customers/{customer.pk}/spending/', {'months': 6})
+
+        data = response.json()
+        assert len(data['months']) == 6
+        assert data['months'][-1]['total'] == 100.0
+        assert data['months'][-1]['visits'] == 20
+        assert data['months'][-1]['average_ticket'] == 5.0
+
+
+@pytest.fixture
+def sales_totals():
+    """
+    Link one completed sale per customer name with the given totals.
+    """
+    def link(totals):
+        sale_id = CustomerSale.objects.count()
+        for name, (total, visits, last) in totals.items():
+            customer = Customer.objects.get(name=name)
+            for visit in range(visits):
+                sale_id += 1
+                CustomerSale.objects.create(
+                    customer=customer,
+                    sale_id=sale_id,
+                    total=total / visits,
+                    sold_at=last or timezone.now(),
+                    completed=True
+                )
+    return link
+
+
+@pytest.mark.django_db
+class TestRebuildStats:
+    """Tests for stats.rebuild_stats."""
+
+    def test_rebuild_sets_stats(self, sales_totals):
+        """Test stats are recomputed from the sales aggregate."""
+        now = timezone.now()
+        buyer = Customer.objects.create(name="Buyer")
+        stale = Customer.objects.create(name="Stale", total_spent=Decimal('99.00'), visit_count=9)
+        sales_totals({'Buyer': (Decimal('45.00'), 3, now)})
+
+        processed, updated = stats.rebuild_stats()
+
+        buyer.refresh_from_db()
+        stale.refresh_from_db()
+        assert (processed, updated) == (2, 2)
+        assert buyer.total_spent == Decimal('45.00')
+        assert buyer.visit_count == 3
+        assert buyer.last_purchase_at == now
+        assert stale.total_spent == Decimal('0.00')
+        assert stale.visit_count == 0
+
+    def test_rebuild_skips_unchanged(self, sales_totals):
+        """Test customers whose stats are correct are not written."""
+        Customer.objects.create(name="Up To Date")
+
+        processed, updated = stats.rebuild_stats()
+
+        assert (processed, updated) == (1, 0)
+
+    def test_rebuild_filtered_and_resumed(self, sales_totals):
+        """Test rebuilding a filtered set starting after a given id."""
+        first = Customer.objects.create(name="First")
+        second = Customer.objects.create(name="Second")
+        Customer.objects.create(name="Inactive", is_active=False)
+        sales_totals({
+            'First': (Decimal('1.00'), 1, None),
+            'Second': (Decimal('2.00'), 1, None),
+            'Inactive': (Decimal('3.00'), 1, None),
+        })
+
+        processed, _ = stats.rebuild_stats(
+            Customer.objects.filter(is_active=True), start_after=first.pk
+        )
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert processed == 1
+        assert first.visit_count == 0
+        assert second.visit_count == 1
+
+    def test_rebuild_reports_progress(self, sales_totals):
+        """Test progress is reported once per batch."""
+        Customer.objects.bulk_create(Customer(name=f"C{i}") for i in range(5))
+        calls = []
+
+        stats.rebuild_stats(batch_size=2, progress=lambda *args: calls.append(args))
+
+        assert [processed for processed, _, _ in calls] == [2, 4, 5]
+        assert calls[-1][2] == Customer.objects.order_by('pk').last().pk
+
+    def test_rebuild_repairs_monthly_spend(self, sales_totals):
+        """Test the month buckets are rebuilt along with the stats."""
+        buyer = Customer.objects.create(name="Buyer")
+        sales_totals({'Buyer': (Decimal('45.00'), 3, timezone.now())})
+        CustomerMonthlySpend.objects.create(customer=buyer, month=stats.month_of(timezone.now()), total=1, visits=9)
+
+        stats.rebuild_stats()
+
+        assert list(buckets(buyer).values()) == [(Decimal('45.00'), 3)]
+
+    @pytest.mark.parametrize('count', [10, 200])
+    def test_rebuild_queries_per_batch_constant(self, sales_totals, count):
+        """Test queries scale with batches, not with customers."""
+        Customer.objects.bulk_create(Customer(name=f"C{i}") for i in range(count))
+        sales_totals({f"C{i}": (Decimal('5.00'), 1, None) for i in range(count)})
+        batches = -(-count // 100)
+
+        # Per batch: SELECT customers, sales aggregate, bulk UPDATE, month
+        # buckets (DELETE, aggregate, INSERT); plus the final empty SELECT.
+        assert len(captured_queries(lambda: stats.rebuild_stats(batch_size=100))) == batches * 6 + 1
+
+    def test_command_rebuilds_from_links(self, sales_totals):
+        """Test the management command works from the sale links alone."""
+        from django.core.management import call_command
+
+        buyer = Customer.objects.create(name="Buyer")
+        sales_totals({'Buyer': (Decimal('12.00'), 2, None)})
+
+        call_command('rebuild_customer_stats', stdout=StringIO())
+
+        buyer.refresh_from_db()
+        assert (buyer.total_spent, buyer.visit_count) == (Decimal('12.00'), 2)
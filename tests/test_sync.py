@@ -0,0 +1,184 @@
+"""
+Tests for the delta sync feed.
+"""
+
+import gzip
+import json
+from datetime import timedelta
+
+import pytest
+from django.test import Client
+from django.utils import timezone
+
+from customers import sync
+from customers.bulk import apply_bulk_action
+from customers.dedup import merge_customers
+from customers.models import Customer
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+@pytest.fixture(autouse=True)
+def no_overlap(settings):
+    """Issue caught-up tokens at the last row, so tests see exact deltas."""
+    settings.CUSTOMERS_SYNC_OVERLAP = 0
+
+
+def get(client, **params):
+    response = client.get('/modules/customers/api/sync/', params)
+    return response.status_code, json.loads(response.content)
+
+
+def drain(token=None, limit=sync.DEFAULT_LIMIT):
+    """Follow pages until caught up; return (customers, deleted, token)."""
+    customers, deleted = [], []
+    while True:
+        page = sync.changes_since(token, limit)
+        customers += page['customers']
+        deleted += page['deleted']
+        token = page['sync_token']
+        if not page['has_more']:
+            return customers, deleted, token
+
+
+@pytest.mark.django_db
+class TestChangesSince:
+    """Tests for sync.changes_since."""
+
+    def test_initial_sync(self):
+        """Test a sync without token returns every customer."""
+        Customer.objects.create(name='Ana', phone='600111222')
+        Customer.objects.create(name='Luis')
+
+        customers, deleted, token = drain()
+
+        assert [c['name'] for c in customers] == ['Ana', 'Luis']
+        assert customers[0]['phone'] == '600111222'
+        assert deleted == []
+        assert token
+
+    def test_nothing_changed(self):
+        """Test a caught-up token returns no changes."""
+        Customer.objects.create(name='Ana')
+        _, _, token = drain()
+
+        assert drain(token)[:2] == ([], [])
+
+    def test_edit_is_delta(self):
+        """Test only customers edited since the token are returned."""
+        ana = Customer.objects.create(name='Ana')
+        Customer.objects.create(name='Luis')
+        _, _, token = drain()
+
+        ana.name = 'Ana Maria'
+        ana.save()
+
+        customers, deleted, _ = drain(token)
+        assert [c['name'] for c in customers] == ['Ana Maria']
+        assert deleted == []
+
+    def test_deactivation_tombstone(self):
+        """Test deactivated customers come back as tombstones."""
+        ana = Customer.objects.create(name='Ana')
+        _, _, token = drain()
+
+        apply_bulk_action(Customer.objects.filter(pk=ana.pk), 'deactivate')
+
+        customers, deleted, _ = drain(token)
+        assert customers == []
+        assert deleted == [{'id': ana.pk, 'merged_into': None}]
+
+    def test_merge_tombstone(self):
+        """Test merged duplicates point to the customer they were merged into."""
+        primary = Customer.objects.create(name='Ana Garcia', phone='600111222')
+        duplicate = Customer.objects.create(name='Ana Garcia', phone='600 111 222')
+        _, _, token = drain()
+
+        merge_customers(primary, [duplicate.pk])
+
+        customers, deleted, _ = drain(token)
+        assert [c['id'] for c in customers] == [primary.pk]
+        assert deleted == [{'id': duplicate.pk, 'merged_into': primary.pk}]
+
+    def test_keyset_pages(self):
+        """Test small pages cover every customer exactly once."""
+        created = [Customer.objects.create(name=f'Cliente {i}').pk for i in range(7)]
+
+        first = sync.changes_since(None, limit=3)
+        customers, _, _ = drain(None, limit=3)
+
+        assert first['has_more'] is True
+        assert len(first['customers']) == 3
+        assert [c['id'] for c in customers] == created
+
+    def test_same_timestamp(self):
+        """Test customers sharing an updated_at are split across pages by id."""
+        ids = [Customer.objects.create(name=f'Cliente {i}').pk for i in range(4)]
+        Customer.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+
+        customers, _, _ = drain(None, limit=1)
+
+        assert [c['id'] for c in customers] == ids
+
+    def test_overlap(self, settings):
+        """Test a caught-up token is moved back by the overlap window."""
+        settings.CUSTOMERS_SYNC_OVERLAP = 60
+        Customer.objects.create(name='Ana')
+        _, _, token = drain()
+
+        # Changed within the last minute: sent again
+        assert [c['name'] for c in drain(token)[0]] == ['Ana']
+
+        later = timezone.now() + timedelta(minutes=5)
+        token = sync.changes_since(token, now=later)['sync_token']
+        assert sync.changes_since(token, now=later)['customers'] == []
+
+    def test_invalid_token(self):
+        """Test malformed tokens are rejected."""
+        for token in ['@@', sync.encode_cursor(['not a date', 1]), sync.encode_cursor([1, 2, 3])]:
+            with pytest.raises(sync.InvalidSyncToken):
+                sync.changes_since(token)
+
+
+@pytest.mark.django_db
+class TestSyncView:
+    """Tests for the sync API endpoint."""
+
+    def test_sync(self, client):
+        """Test a full sync followed by a delta."""
+        ana = Customer.objects.create(name='Ana')
+        Customer.objects.create(name='Luis')
+
+        status, page = get(client, limit=1)
+        assert status == 200
+        assert page['has_more'] is True
+        status, page = get(client, token=page['sync_token'])
+        assert [c['name'] for c in page['customers']] == ['Luis']
+        assert page['has_more'] is False
+
+        ana.name = 'Ana Maria'
+        ana.save()
+        status, page = get(client, token=page['sync_token'])
+        assert [c['name'] for c in page['customers']] == ['Ana Maria']
+
+    def test_invalid_token(self, client):
+        """Test an invalid token is a 400."""
+        status, page = get(client, token='@@')
+
+        assert status == 400
+        assert page['success'] is False
+
+    def test_gzip(self, client):
+        """Test the feed is gzip-encoded for clients that accept it."""
+        for i in range(20):
+            Customer.objects.create(name=f'Cliente {i}', email=f'cliente{i}@example.com')
+
+        response = client.get('/modules/customers/api/sync/', HTTP_ACCEPT_ENCODING='gzip')
+
+        assert response['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response['Vary']
+        assert len(json.loads(gzip.decompress(response.content))['customers']) == 20
@@ -0,0 +1,164 @@
+"""
+Tests for the in-memory typeahead index.
+"""
+
+import pytest
+from django.test import Client
+
+from customers import bulk, typeahead
+from customers.models import Customer
+
+
+@pytest.fixture
+def client():
+    """Create test client."""
+    return Client()
+
+
+@pytest.fixture(autouse=True)
+def index(monkeypatch, settings):
+    """Give every test a fresh index that does not catch up on its own."""
+    settings.CUSTOMERS_TYPEAHEAD_REFRESH = 3600
+    fresh = typeahead.PrefixIndex()
+    monkeypatch.setattr(typeahead, '_index', fresh)
+    return fresh
+
+
+def names(results):
+    return [name for _id, name, _phone in results]
+
+
+@pytest.mark.django_db
+class TestTypeahead:
+    """Tests for typeahead.typeahead."""
+
+    def test_matches_name_phone_and_email(self):
+        """Test names, words inside names, phones and emails match by prefix."""
+        Customer.objects.create(name="José Pérez García", phone="+34 600 111 222", email="jose@example.com")
+        Customer.objects.create(name="Ana López")
+
+        assert names(typeahead.typeahead('jose')) == ["José Pérez García"]
+        assert names(typeahead.typeahead('garc')) == ["José Pérez García"]
+        assert names(typeahead.typeahead('perez g')) == ["José Pérez García"]
+        assert names(typeahead.typeahead('600 11')) == ["José Pérez García"]
+        assert names(typeahead.typeahead('+34600')) == ["José Pérez García"]
+        assert names(typeahead.typeahead('jose@')) == ["José Pérez García"]
+        assert typeahead.typeahead('zzz') == []
+
+    def test_limit_and_distinct(self):
+        """Test each customer is returned once, up to the limit."""
+        for i in range(5):
+            Customer.objects.create(name=f"Maria Maria {i}")
+
+        results = typeahead.typeahead('maria', limit=3)
+
+        assert len(results) == 3
+        assert len({customer_id for customer_id, _name, _phone in results}) == 3
+
+    def test_inactive_and_merged_excluded(self):
+        """Test inactive and merged customers are not suggested."""
+        kept = Customer.objects.create(name="Ana")
+        Customer.objects.create(name="Ana Inactiva", is_active=False)
+        Customer.objects.create(name="Ana Fusionada", merged_into=kept)
+
+        assert names(typeahead.typeahead('ana')) == ["Ana"]
+
+    def test_signals_keep_index_current(self, index, django_capture_on_commit_callbacks):
+        """Test committed saves and deletes in this process update a built index."""
+        customer = Customer.objects.create(name="Ana")
+        typeahead.typeahead('ana')
+        assert index.is_built
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Customer.objects.create(name="Anabel")
+            customer.name = "Beatriz"
+            customer.save()
+        assert names(typeahead.typeahead('ana')) == ["Anabel"]
+        assert names(typeahead.typeahead('bea')) == ["Beatriz"]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            customer.delete()
+        assert typeahead.typeahead('bea') == []
+
+    def test_uncommitted_save_not_indexed(self, index, django_capture_on_commit_callbacks):
+        """Test a save is only applied once its transaction commits."""
+        customer = Customer.objects.create(name="Ana")
+        typeahead.typeahead('ana')
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            customer.name = "Beatriz"
+            customer.save()
+
+        assert names(typeahead.typeahead('ana')) == ["Ana"]
+        assert typeahead.typeahead('bea') == []
+        assert callbacks
+
+    def test_compaction_matches_rebuild(self, index, monkeypatch):
+        """Test saves folded into the main arrays give the same index as a rebuild."""
+        monkeypatch.setattr(typeahead, 'COMPACT_THRESHOLD', 3)
+        customers = [Customer.objects.create(name=f"Ana {i}", phone=f"60000000{i}") for i in range(8)]
+        typeahead.typeahead('ana')
+
+        for i, customer in enumerate(customers[:5]):
+            customer.name = f"Beatriz {i}"
+            customer.is_active = i != 2
+            customer.save()
+            index.apply({field: getattr(customer, field) for field in typeahead._FIELDS})
+        index.discard(customers[6].pk)
+        Customer.objects.filter(pk=customers[6].pk).delete()
+        assert index.stale
+
+        rebuilt = typeahead.PrefixIndex()
+        rebuilt.build()
+        index._compact()
+        assert (index.keys, list(index.ids)) == (rebuilt.keys, list(rebuilt.ids))
+        assert names(typeahead.typeahead('bea')) == ["Beatriz 0", "Beatriz 1", "Beatriz 3", "Beatriz 4"]
+        assert names(typeahead.typeahead('ana')) == ["Ana 5", "Ana 7"]
+
+    def test_catch_up_writes_without_signals(self, settings):
+        """Test bulk updates are picked up after the refresh interval."""
+        Customer.objects.create(name="Ana")
+        typeahead.typeahead('ana')
+
+        bulk.apply_bulk_action(Customer.objects.all(), 'deactivate')
+        assert names(typeahead.typeahead('ana')) == ["Ana"]
+
+        settings.CUSTOMERS_TYPEAHEAD_REFRESH = 0
+        assert typeahead.typeahead('ana') == []
+
+    def test_memory_bound_falls_back_to_database(self, index, settings):
+        """Test large tables are not loaded and lookups use the database."""
+        settings.CUSTOMERS_TYPEAHEAD_MAX_CUSTOMERS = 1
+        Customer.objects.create(name="Ana")
+        Customer.objects.create(name="Anabel", phone="600111222")
+
+        assert names(typeahead.typeahead('ana')) == ["Ana", "Anabel"]
+        assert names(typeahead.typeahead('600111')) == ["Anabel"]
+        assert not index.is_built
+        assert index.customers == {}
+
+    def test_database_fallback_matches_national_number(self, index, settings):
+        """Test the fallback finds a stored international number typed without its country code."""
+        settings.CUSTOMERS_TYPEAHEAD_MAX_CUSTOMERS = 0
+        Customer.objects.create(name="Ana", phone="+34 612 345 678")
+        Customer.objects.create(name="Luis", phone="+34 699 111 222")
+
+        assert names(typeahead.typeahead('612345')) == ["Ana"]
+        assert names(typeahead.typeahead('612 345 678')) == ["Ana"]
+        assert names(typeahead.typeahead('34612')) == ["Ana"]
+        assert not index.is_built
+
+
+@pytest.mark.django_db
+class TestTypeaheadView:
+    """Tests for the typeahead endpoint."""
+
+    def test_no_queries_once_built(self, client, django_assert_num_queries):
+        """Test keystrokes are answered from memory."""
+        customer = Customer.objects.create(name="Ana", phone="600111222")
+        client.get('/modules/customers/api/typeahead/', {'q': 'a'})
+
+        with django_assert_num_queries(0):
+            response = client.get('/modules/customers/api/typeahead/', {'q': 'an'})
+
+        assert response.json() == {'results': [[customer.pk, "Ana", "600111222"]]}
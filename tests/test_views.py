@@ -7,6 +7,7 @@ import json
 from decimal import Decimal
 from django.test import Client
 from django.urls import reverse
+from django.utils import timezone
 
 from customers.models import Customer
 
@@ -18,15 +19,16 @@ def client():
 
 
 @pytest.fixture
-def sample_customer():
-    """Create a sample customer."""
-    return Customer.objects.create(
-        name="Test Customer",
-        email="test@example.com",
-        phone="+34600123456",
-        address="Test Address",
-        tax_id="12345678Z"
-    )
+def sample_customer(django_capture_on_commit_callbacks):
+    """Create (and commit) a sample customer."""
+    with django_capture_on_commit_callbacks(execute=True):
+        return Customer.objects.create(
+            name="Test Customer",
+            email="test@example.com",
+            phone="+34600123456",
+            address="Test Address",
+            tax_id="12345678Z"
+        )
 
 
 @pytest.mark.django_db
@@ -56,6 +58,47 @@ class TestCustomerListView:
         assert response.status_code == 200
         assert response.context['total_customers'] == 1
 
+    def test_customer_list_dashboard_cards(self, client, sample_customer):
+        """Test all dashboard counters are in the context."""
+        Customer.objects.create(name="Inactive", is_active=False, total_spent=Decimal('20.00'))
+        Customer.objects.create(name="Buyer", total_spent=Decimal('30.50'), visit_count=2)
+
+        response = client.get('/modules/customers/')
+
+        assert response.context['total_customers'] == 2
+        assert response.context['inactive_customers'] == 1
+        assert response.context['new_this_month'] == 3
+        assert response.context['with_purchases'] == 1
+        assert response.context['total_revenue'] == Decimal('50.50')
+
+    def test_customer_list_counters_single_query(
+        self, client, sample_customer, django_assert_num_queries, django_capture_on_commit_callbacks
+    ):
+        """Test counters cost one query, then none until customers change."""
+        with django_assert_num_queries(1):
+            client.get('/modules/customers/')
+        with django_assert_num_queries(0):
+            client.get('/modules/customers/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Customer.objects.create(name="Another")
+
+        with django_assert_num_queries(1):
+            response = client.get('/modules/customers/')
+        assert response.context['total_customers'] == 2
+
+    def test_customer_list_counters_invalidated_on_delete(
+        self, client, sample_customer, django_capture_on_commit_callbacks
+    ):
+        """Test deleting a customer refreshes the counters."""
+        client.get('/modules/customers/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            sample_customer.delete()
+
+        response = client.get('/modules/customers/')
+        assert response.context['total_customers'] == 0
+
 
 @pytest.mark.django_db
 class TestCustomerListAjaxView:
@@ -109,6 +152,178 @@ class TestCustomerListAjaxView:
         assert len(data['customers']) == 2
 
 
+@pytest.mark.django_db
+class TestCustomerListAjaxSerialization:
+    """Tests for the lean serialization of the list API."""
+
+    def test_row_format(self, client):
+        """Test each row has the documented fields and formats."""
+        customer = Customer.objects.create(
+            name="Formatted",
+            phone="+34600000000",
+            total_spent=Decimal('10.00'),
+            visit_count=4,
+            last_purchase_at=timezone.now()
+        )
+
+        row = json.loads(client.get('/modules/customers/api/list/').content)['customers'][0]
+
+        assert row == {
+            'id': customer.id,
+            'name': "Formatted",
+            'phone': "+34600000000",
+            'email': "",
+            'tax_id': "",
+            'total_spent': 10.0,
+            'visit_count': 4,
+            'average_purchase': 2.5,
+            'last_purchase': customer.last_purchase_at.strftime('%Y-%m-%d %H:%M'),
+            'is_active': True,
+            'created_at': customer.created_at.strftime('%Y-%m-%d'),
+        }
+
+    def test_average_purchase_without_visits(self, client, sample_customer):
+        """Test the average purchase is zero for customers without visits."""
+        row = json.loads(client.get('/modules/customers/api/list/').content)['customers'][0]
+
+        assert row['average_purchase'] == 0
+        assert row['last_purchase'] is None
+
+    def test_text_columns_not_selected(self, client, sample_customer):
+        """Test the large address/notes columns are never fetched."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/modules/customers/api/list/?search=Test')
+
+        assert queries.captured_queries
+        for query in queries.captured_queries:
+            assert '"notes"' not in query['sql']
+            assert '"address"' not in query['sql']
+
+
+@pytest.mark.django_db
+class TestCustomerListAjaxPagination:
+    """Tests for cursor pagination of the customer list API."""
+
+    def test_single_page_has_no_cursor(self, client, sample_customer):
+        """Test a short list returns no next cursor."""
+        response = client.get('/modules/customers/api/list/')
+
+        data = json.loads(response.content)
+        assert data['next_cursor'] is None
+
+    def test_pages_cover_all_customers(self, client):
+        """Test following cursors returns every customer exactly once."""
+        Customer.objects.bulk_create(Customer(name=f"Customer {i}") for i in range(250))
+        # Force ties on created_at so the id tie-breaker is exercised
+        first_ids = Customer.objects.order_by('id').values_list('id', flat=True)[:120]
+        Customer.objects.filter(id__in=list(first_ids)).update(created_at=timezone.now())
+
+        seen = []
+        cursor = ''
+        for _ in range(10):
+            response = client.get('/modules/customers/api/list/', {'cursor': cursor})
+            data = json.loads(response.content)
+            seen.extend(customer['id'] for customer in data['customers'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+
+        assert len(seen) == 250
+        assert len(set(seen)) == 250
+
+    def test_limit_param(self, client):
+        """Test the page size can be reduced but not raised above the cap."""
+        Customer.objects.bulk_create(Customer(name=f"Customer {i}") for i in range(150))
+
+        data = json.loads(client.get('/modules/customers/api/list/?limit=20').content)
+        assert len(data['customers']) == 20
+        assert data['next_cursor']
+
+        data = json.loads(client.get('/modules/customers/api/list/?limit=1000').content)
+        assert len(data['customers']) == 100
+
+    def test_invalid_cursor(self, client):
+        """Test a malformed cursor is rejected."""
+        response = client.get('/modules/customers/api/list/?cursor=not-a-cursor')
+
+        assert response.status_code == 400
+        assert json.loads(response.content)['success'] is False
+
+    def test_later_pages_same_query_count(self, client, django_assert_num_queries):
+        """Test page N costs the same number of queries as page 1."""
+        Customer.objects.bulk_create(Customer(name=f"Customer {i}") for i in range(250))
+
+        with django_assert_num_queries(1):
+            data = json.loads(client.get('/modules/customers/api/list/').content)
+        for _ in range(2):
+            with django_assert_num_queries(1):
+                data = json.loads(client.get(
+                    '/modules/customers/api/list/', {'cursor': data['next_cursor']}
+                ).content)
+
+        assert len(data['customers']) == 50
+
+
+@pytest.mark.django_db
+class TestCustomerListAjaxCaching:
+    """Tests for response caching and conditional GET of the list API."""
+
+    def test_repeated_request_served_from_cache(self, client, sample_customer, django_assert_num_queries):
+        """Test an unchanged list is served without touching the database."""
+        first = client.get('/modules/customers/api/list/?search=Test')
+
+        with django_assert_num_queries(0):
+            second = client.get('/modules/customers/api/list/?search=Test')
+
+        assert second.content == first.content
+
+    def test_cache_invalidated_on_write(self, client, sample_customer, django_capture_on_commit_callbacks):
+        """Test a new customer shows up as soon as it is committed."""
+        client.get('/modules/customers/api/list/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Customer.objects.create(name="Newcomer")
+
+        data = json.loads(client.get('/modules/customers/api/list/').content)
+        assert [customer['name'] for customer in data['customers']] == ["Newcomer", "Test Customer"]
+
+    def test_etag_not_modified(self, client, sample_customer, django_assert_num_queries):
+        """Test a matching If-None-Match gets a 304 without database access."""
+        response = client.get('/modules/customers/api/list/')
+        etag = response['ETag']
+
+        with django_assert_num_queries(0):
+            response = client.get('/modules/customers/api/list/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 304
+
+    def test_etag_changes_with_params_and_writes(self, client, sample_customer, django_capture_on_commit_callbacks):
+        """Test the ETag depends on the query and on customer writes."""
+        etag = client.get('/modules/customers/api/list/')['ETag']
+
+        assert client.get('/modules/customers/api/list/?status=all')['ETag'] != etag
+
+        sample_customer.name = "Renamed"
+        with django_capture_on_commit_callbacks(execute=True):
+            sample_customer.save()
+
+        response = client.get('/modules/customers/api/list/', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+    def test_last_modified(self, client, sample_customer):
+        """Test Last-Modified reflects the last write and supports If-Modified-Since."""
+        response = client.get('/modules/customers/api/list/')
+        last_modified = response['Last-Modified']
+
+        response = client.get('/modules/customers/api/list/', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        assert response.status_code == 304
+        assert 'no-cache' in response['Cache-Control']
+
+
 @pytest.mark.django_db
 class TestCustomerCreateView:
     """Tests for customer create view."""
@@ -205,6 +420,32 @@ class TestCustomerEditView:
         assert sample_customer.name == 'Updated Name'
         assert sample_customer.email == 'updated@example.com'
 
+    def test_edit_customer_stale_version(self, client, sample_customer):
+        """Test an edit based on an outdated version is rejected with 409."""
+        sample_customer.notes = 'Saved from another terminal'
+        sample_customer.save_changes()
+
+        response = client.post(f'/modules/customers/{sample_customer.id}/edit/', {
+            'name': 'Stale Name',
+            'version': '1',
+        })
+
+        assert response.status_code == 409
+        assert json.loads(response.content)['success'] is False
+        sample_customer.refresh_from_db()
+        assert sample_customer.name == 'Test Customer'
+
+    def test_edit_customer_current_version(self, client, sample_customer):
+        """Test an edit based on the current version is saved."""
+        response = client.post(f'/modules/customers/{sample_customer.id}/edit/', {
+            'name': 'New Name',
+            'version': str(sample_customer.version),
+        })
+
+        data = json.loads(response.content)
+        assert data['success'] is True
+        assert data['version'] == sample_customer.version + 1
+
     def test_edit_customer_no_name(self, client, sample_customer):
         """Test POST edit customer without name."""
         response = client.post(f'/modules/customers/{sample_customer.id}/edit/', {
@@ -254,6 +495,125 @@ class TestCustomerExportView:
         """Test export CSV contains customer data."""
         response = client.get('/modules/customers/export/')
 
-        content = response.content.decode('utf-8')
+        content = b''.join(response.streaming_content).decode('utf-8')
         assert 'Test Customer' in content
         assert 'test@example.com' in content
+
+    def test_export_csv_is_streaming(self, client, sample_customer):
+        """Test export is sent as a streaming response."""
+        response = client.get('/modules/customers/export/')
+
+        assert response.streaming is True
+
+    def test_export_csv_excludes_inactive(self, client, sample_customer):
+        """Test export only contains active customers, ordered by name."""
+        Customer.objects.create(name="Inactive Customer", is_active=False)
+        Customer.objects.create(name="Alpha Customer")
+
+        response = client.get('/modules/customers/export/')
+
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        assert lines[0].startswith('Name,Email')
+        assert [line.split(',')[0] for line in lines[1:]] == ['Alpha Customer', 'Test Customer']
+
+    def test_export_csv_query_count_bounded(self, client, django_assert_max_num_queries):
+        """Test export runs a bounded number of queries on a large table."""
+        Customer.objects.bulk_create(
+            Customer(name=f"Customer {i:05d}") for i in range(3000)
+        )
+
+        with django_assert_max_num_queries(1):
+            response = client.get('/modules/customers/export/')
+            lines = sum(1 for _ in response.streaming_content)
+
+        assert lines == 3001
+
+    def test_export_csv_memory_bounded(self, client, monkeypatch):
+        """Test peak memory while streaming stays flat as the table grows."""
+        import tracemalloc
+        from customers import exporters
+
+        monkeypatch.setattr(exporters, 'EXPORT_CHUNK_SIZE', 100)
+
+        def stream_peak():
+            response = client.get('/modules/customers/export/')
+            tracemalloc.start()
+            try:
+                size = sum(len(line) for line in response.streaming_content)
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        def seed(start, stop):
+            Customer.objects.bulk_create(
+                Customer(name=f"Customer {i:05d}", email=f"customer{i}@example.com")
+                for i in range(start, stop)
+            )
+
+        seed(0, 1000)
+        small_size, small_peak = stream_peak()
+        seed(1000, 10000)
+        large_size, large_peak = stream_peak()
+
+        assert large_size > small_size * 9
+        assert large_peak < small_peak * 2
+        assert large_peak < large_size / 2
+
+
+@pytest.mark.django_db
+class TestFragmentCaching:
+    """Tests for the cached list and detail template fragments."""
+
+    def test_detail_served_from_fragments(self, client, sample_customer, django_assert_num_queries):
+        """Test a repeated detail render only loads the customer."""
+        client.get(f'/modules/customers/{sample_customer.pk}/')
+
+        with django_assert_num_queries(1):
+            response = client.get(f'/modules/customers/{sample_customer.pk}/')
+
+        assert b'Test Customer' in response.content
+
+    def test_detail_invalidated_on_save(self, client, sample_customer):
+        """Test editing a customer re-renders its fragments."""
+        client.get(f'/modules/customers/{sample_customer.pk}/')
+
+        client.post(f'/modules/customers/{sample_customer.pk}/edit/', {'name': 'Renamed Customer', 'is_active': 'on'})
+        response = client.get(f'/modules/customers/{sample_customer.pk}/')
+
+        assert b'Renamed Customer' in response.content
+
+    def test_detail_invalidated_on_sale(self, client, sample_customer, django_capture_on_commit_callbacks):
+        """Test a new sale re-renders the purchases fragment."""
+        from types import SimpleNamespace
+        from customers.stats import sync_sale
+
+        client.get(f'/modules/customers/{sample_customer.pk}/')
+
+        sale = SimpleNamespace(pk=1, customer_id=sample_customer.pk, total=Decimal('42.50'), created_at=timezone.now())
+        with django_capture_on_commit_callbacks(execute=True):
+            sync_sale(sale, completed=True)
+        response = client.get(f'/modules/customers/{sample_customer.pk}/')
+
+        assert b'42.50' in response.content
+
+    def test_detail_invalidated_on_tag(self, client, sample_customer):
+        """Test tagging in bulk re-renders the header."""
+        from customers.bulk import apply_bulk_action
+
+        client.get(f'/modules/customers/{sample_customer.pk}/')
+
+        apply_bulk_action(Customer.objects.filter(pk=sample_customer.pk), 'tag', tag_name='VIP')
+        response = client.get(f'/modules/customers/{sample_customer.pk}/')
+
+        assert b'VIP' in response.content
+
+    def test_list_counters_follow_writes(self, client, django_capture_on_commit_callbacks):
+        """Test the counters fragment is re-rendered when counts change."""
+        client.get('/modules/customers/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Customer.objects.create(name='Nuevo')
+        response = client.get('/modules/customers/')
+
+        assert response.context['total_customers'] == 1
+        assert b'>1</p>' in response.content
@@ -0,0 +1,411 @@
+"""
+In-memory prefix index for the checkout customer typeahead.
+
+Each process keeps two parallel sorted arrays, ``keys`` (interned
+strings) and ``ids`` (a machine-integer array), of the search keys of
+active customers:
+
+- every word-boundary suffix of the normalized name, so "lopez g" finds
+  "Maria Lopez Garcia"
+- the normalized phone, and its last 9 digits so numbers typed without
+  the country code match
+- the lowercased email
+
+A lookup is a binary search for the first key starting with the term and
+a short forward scan until ``limit`` distinct customers are found, so it
+costs O(log n + limit) with no SQL.
+
+The index is built on first use and kept current by the ``Customer``
+save/delete signals of this process, applied once the write commits so
+rolled-back saves never show up. Writes that skip signals (bulk
+actions, imports, other processes) are caught up every
+``CUSTOMERS_TYPEAHEAD_REFRESH`` seconds from ``updated_at``, and the
+index is rebuilt from scratch every ``CUSTOMERS_TYPEAHEAD_MAX_AGE``
+seconds. Above ``CUSTOMERS_TYPEAHEAD_MAX_CUSTOMERS`` active customers no
+index is kept and lookups fall back to indexed prefix queries.
+
+Saves do not insert into the main arrays, which would shift their tail
+under the lock for every key (about 5 ms per save at the default maximum
+of 100,000 customers). Their keys go to small sorted ``recent`` arrays
+merged in at lookup time (about 0.03 ms per save), and the main arrays
+are compacted in one slice-copying pass once ``COMPACT_THRESHOLD``
+customers have changed (about 0.13 s at 100,000 customers, during which
+lookups wait). Figures from ``bench_typeahead``.
+"""
+
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from heapq import merge
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Right
+from django.utils import timezone
+
+from .normalization import looks_like_phone, normalize_name, normalize_phone, prefix_lookup
+
+# Largest number of active customers kept in memory per process (~65 MiB)
+DEFAULT_MAX_CUSTOMERS = 100_000
+
+# Seconds between catch-ups of writes made without signals
+DEFAULT_REFRESH = 10
+
+# Seconds before the index is rebuilt from scratch
+DEFAULT_MAX_AGE = 3600
+
+# Matches returned by default and at most
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+# Trailing phone digits also indexed (national number without country code)
+PHONE_SUFFIX_DIGITS = 9
+
+# Rows read per query while building
+BUILD_CHUNK_SIZE = 5000
+
+# Catch-up window overlap, for clock skew and transactions committing late
+CATCH_UP_OVERLAP = timedelta(seconds=5)
+
+# Customers changed since the last compaction above which the main
+# arrays are rebuilt with their new keys
+COMPACT_THRESHOLD = 1000
+
+_FIELDS = ('id', 'name', 'phone', 'name_normalized', 'phone_normalized', 'email', 'is_active', 'merged_into_id')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def customer_keys(name_normalized, phone_normalized, email):
+    """
+    Search keys of one customer, as a tuple of interned strings (surname
+    suffixes repeat across many customers and are stored once).
+    """
+    keys = set()
+    words = name_normalized.split()
+    for i in range(len(words)):
+        keys.add(' '.join(words[i:]))
+    if phone_normalized:
+        keys.add(phone_normalized)
+        keys.add(phone_normalized[-PHONE_SUFFIX_DIGITS:])
+    if email:
+        keys.add(email.lower())
+    return tuple(sys.intern(key) for key in keys)
+
+
+def term_key(term):
+    """
+    Normalize a typed term the way keys are normalized.
+    """
+    term = term.strip()
+    if looks_like_phone(term):
+        return normalize_phone(term)
+    if '@' in term:
+        return term.lower()
+    return normalize_name(term)
+
+
+def _scan(keys, ids, key):
+    """
+    ``(key, id)`` pairs of sorted ``keys``/``ids`` starting with ``key``.
+    """
+    i = bisect_left(keys, key)
+    while i < len(keys) and keys[i].startswith(key):
+        yield keys[i], ids[i]
+        i += 1
+
+
+def _position(keys, ids, key, customer_id):
+    """
+    Index of ``(key, customer_id)`` in sorted ``keys``/``ids``, or where it
+    would be inserted.
+    """
+    start = bisect_left(keys, key)
+    # Ids are sorted within a run of equal keys (common surnames are long runs)
+    return bisect_left(ids, customer_id, start, bisect_right(keys, key, start))
+
+
+class PrefixIndex:
+    """
+    Sorted ``keys``/``ids`` arrays plus ``customers``: id -> (name, phone, keys).
+
+    Customers saved since the last compaction are kept in the small
+    ``recent_keys``/``recent_ids`` arrays, and their entries in the main
+    arrays (listed in ``stale``: id -> keys) are skipped by lookups until
+    the next compaction removes them.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.ids = array('q')
+        self.customers = {}
+        self.recent_keys = []
+        self.recent_ids = array('q')
+        self.stale = {}
+        self.built_at = None
+        self.synced_at = None
+        # time.monotonic() of the last build or catch-up
+        self.checked_at = None
+        # Guards the arrays; held only for in-memory work
+        self.lock = threading.RLock()
+        # Held by the one thread refreshing from the database
+        self.refreshing = threading.Lock()
+
+    @property
+    def is_built(self):
+        return self.built_at is not None
+
+    def build(self):
+        """
+        Load every active customer. Returns False, leaving the index
+        empty, if there are more than the configured maximum.
+        """
+        from .models import Customer
+
+        limit = _setting('CUSTOMERS_TYPEAHEAD_MAX_CUSTOMERS', DEFAULT_MAX_CUSTOMERS)
+        started = timezone.now()
+        active = Customer.objects.filter(is_active=True, merged_into__isnull=True)
+        if active.count() > limit:
+            with self.lock:
+                self._reset()
+            return False
+
+        pairs = []
+        customers = {}
+        rows = active.order_by().values_list('id', 'name', 'phone', 'name_normalized', 'phone_normalized', 'email')
+        for customer_id, name, phone, name_normalized, phone_normalized, email in rows.iterator(
+            chunk_size=BUILD_CHUNK_SIZE
+        ):
+            keys = customer_keys(name_normalized, phone_normalized, email)
+            customers[customer_id] = (name, phone, keys)
+            pairs.extend((key, customer_id) for key in keys)
+        pairs.sort()
+
+        with self.lock:
+            self._reset()
+            self.keys = [key for key, _id in pairs]
+            self.ids = array('q', (customer_id for _key, customer_id in pairs))
+            self.customers = customers
+            self.built_at = self.synced_at = started
+            self.checked_at = time.monotonic()
+        return True
+
+    def _reset(self):
+        self.keys, self.ids, self.customers = [], array('q'), {}
+        self.recent_keys, self.recent_ids, self.stale = [], array('q'), {}
+        self.built_at = self.synced_at = None
+
+    def _remove(self, customer_id):
+        entry = self.customers.pop(customer_id, None)
+        if entry is None:
+            return
+        if customer_id not in self.stale:
+            # Its keys are in the main arrays: hide them until compaction
+            self.stale[customer_id] = entry[2]
+            return
+        for key in entry[2]:
+            i = _position(self.recent_keys, self.recent_ids, key, customer_id)
+            if i < len(self.recent_keys) and self.recent_keys[i] == key:
+                del self.recent_keys[i]
+                del self.recent_ids[i]
+
+    def _add(self, customer_id, name, phone, keys):
+        self.customers[customer_id] = (name, phone, keys)
+        # New customers have no main entries to hide
+        self.stale.setdefault(customer_id, ())
+        for key in keys:
+            i = _position(self.recent_keys, self.recent_ids, key, customer_id)
+            self.recent_keys.insert(i, key)
+            self.recent_ids.insert(i, customer_id)
+
+    def _compact(self):
+        """
+        Rebuild the main arrays without the stale entries and with the
+        recent ones, copying runs of untouched entries as whole slices.
+        """
+        keys, ids = self.keys, self.ids
+        # (position, 0, key, id) inserts before keys[position]; (position, 1) drops it
+        edits = [
+            (_position(keys, ids, key, customer_id), 0, key, customer_id)
+            for key, customer_id in zip(self.recent_keys, self.recent_ids)
+        ]
+        for customer_id, stale_keys in self.stale.items():
+            for key in stale_keys:
+                i = _position(keys, ids, key, customer_id)
+                if i < len(keys) and keys[i] == key and ids[i] == customer_id:
+                    edits.append((i, 1, '', 0))
+        edits.sort()
+
+        new_keys, new_ids = [], array('q')
+        start = 0
+        for position, drop, key, customer_id in edits:
+            new_keys += keys[start:position]
+            new_ids += ids[start:position]
+            if drop:
+                start = position + 1
+            else:
+                start = position
+                new_keys.append(key)
+                new_ids.append(customer_id)
+        new_keys += keys[start:]
+        new_ids += ids[start:]
+
+        self.keys, self.ids = new_keys, new_ids
+        self.recent_keys, self.recent_ids, self.stale = [], array('q'), {}
+
+    def apply(self, row):
+        """
+        Bring one customer (a dict of ``_FIELDS``) up to date.
+        """
+        with self.lock:
+            if not self.is_built:
+                return
+            self._remove(row['id'])
+            if row['is_active'] and not row['merged_into_id']:
+                keys = customer_keys(row['name_normalized'], row['phone_normalized'], row['email'])
+                self._add(row['id'], row['name'], row['phone'], keys)
+            if len(self.stale) > COMPACT_THRESHOLD:
+                self._compact()
+
+    def discard(self, customer_id):
+        with self.lock:
+            self._remove(customer_id)
+
+    def catch_up(self):
+        """
+        Apply customers written since the last sync, or rebuild when the
+        index is too old.
+        """
+        from .models import Customer
+
+        now = timezone.now()
+        max_age = timedelta(seconds=_setting('CUSTOMERS_TYPEAHEAD_MAX_AGE', DEFAULT_MAX_AGE))
+        if self.built_at is None or now - self.built_at > max_age:
+            return self.build()
+
+        changed = Customer.objects.filter(updated_at__gte=self.synced_at - CATCH_UP_OVERLAP).values(*_FIELDS)
+        for row in changed.iterator(chunk_size=BUILD_CHUNK_SIZE):
+            self.apply(row)
+        with self.lock:
+            self.synced_at = now
+            self.checked_at = time.monotonic()
+        return True
+
+    def _is_fresh(self, refresh):
+        return self.checked_at is not None and time.monotonic() - self.checked_at < refresh
+
+    def ensure_current(self):
+        """
+        Build on first use and catch up at most every refresh interval.
+        Returns whether the index can answer lookups.
+        """
+        refresh = _setting('CUSTOMERS_TYPEAHEAD_REFRESH', DEFAULT_REFRESH)
+        if self._is_fresh(refresh):
+            return self.is_built
+        if self.is_built:
+            # Serve the current data while another thread catches up
+            if not self.refreshing.acquire(blocking=False):
+                return True
+        else:
+            self.refreshing.acquire()
+        try:
+            # Another thread may have refreshed while we waited
+            if self._is_fresh(refresh):
+                return self.is_built
+            if not self.catch_up():
+                # Too many customers: retry only after the refresh interval
+                self.checked_at = time.monotonic()
+                return False
+            return True
+        finally:
+            self.refreshing.release()
+
+    def lookup(self, key, limit):
+        """
+        ``(id, name, phone)`` of up to ``limit`` customers with a key
+        starting with ``key``, in key order.
+        """
+        results = []
+        seen = set()
+        with self.lock:
+            stale = self.stale
+            current = (pair for pair in _scan(self.keys, self.ids, key) if pair[1] not in stale)
+            for _key, customer_id in merge(current, _scan(self.recent_keys, self.recent_ids, key)):
+                if len(results) >= limit:
+                    break
+                if customer_id not in seen:
+                    seen.add(customer_id)
+                    name, phone, _keys = self.customers[customer_id]
+                    results.append((customer_id, name, phone))
+        return results
+
+
+_index = PrefixIndex()
+
+
+def get_index():
+    return _index
+
+
+def _database_lookup(key, limit):
+    """
+    Fallback for tables too large to index in memory: indexed prefix
+    lookups on the normalized columns, and on the phone's last 9 digits
+    (``customer_phone_suffix_idx``) like the in-memory keys.
+    """
+    from .models import Customer
+
+    if not key:
+        return []
+    query = prefix_lookup('name_normalized', key)
+    if key.isdigit():
+        query |= prefix_lookup('phone_normalized', key)
+        if len(key) <= PHONE_SUFFIX_DIGITS:
+            query |= prefix_lookup('phone_suffix', key)
+    if '@' in key:
+        query |= Q(email__istartswith=key)
+    rows = (
+        Customer.objects.annotate(phone_suffix=Right('phone_normalized', PHONE_SUFFIX_DIGITS))
+        .filter(query, is_active=True, merged_into__isnull=True)
+        .order_by('name_normalized', 'id')
+        .values_list('id', 'name', 'phone')[:limit]
+    )
+    return list(rows)
+
+
+def typeahead(term, limit=DEFAULT_LIMIT):
+    """
+    Up to ``limit`` active customers matching what was typed, as
+    ``(id, name, phone)`` tuples.
+    """
+    key = term_key(term)
+    if not key:
+        return []
+    limit = min(max(limit, 1), MAX_LIMIT)
+    if _index.ensure_current():
+        return _index.lookup(key, limit)
+    return _database_lookup(key, limit)
+
+
+def customer_saved(instance, using=None):
+    """
+    Reflect a saved customer in the index once committed (post_save).
+    """
+    if instance.pk is None:
+        return
+    row = {field: getattr(instance, field) for field in _FIELDS}
+    transaction.on_commit(lambda: _index.apply(row), using=using)
+
+
+def customer_deleted(instance, using=None):
+    """
+    Drop a deleted customer from the index once committed (post_delete).
+    """
+    customer_id = instance.pk
+    transaction.on_commit(lambda: _index.discard(customer_id), using=using)
@@ -1,22 +1,51 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+from .instrumentation import instrument_urlpatterns
 
 app_name = 'customers'
 
+# Read-heavy views served by async variants under ASGI (CUSTOMERS_ASYNC_VIEWS)
+read_views = async_views if getattr(settings, 'CUSTOMERS_ASYNC_VIEWS', False) else views
+
 urlpatterns = [
     # List and create
-    path('', views.customer_list, name='list'),
-    path('api/list/', views.customer_list_ajax, name='list_ajax'),
+    path('', read_views.customer_list, name='list'),
+    path('api/list/', read_views.customer_list_ajax, name='list_ajax'),
+    path('api/typeahead/', views.customer_typeahead, name='typeahead'),
+    path('api/sync/', views.customer_sync, name='sync'),
     path('create/', views.customer_create, name='create'),
+    path('bulk/', views.customers_bulk, name='bulk'),
 
     # Detail, update, delete
-    path('<int:customer_id>/', views.customer_detail, name='detail'),
+    path('<int:customer_id>/', read_views.customer_detail, name='detail'),
     path('<int:customer_id>/edit/', views.customer_edit, name='edit'),
     path('<int:customer_id>/delete/', views.customer_delete, name='delete'),
 
     # Stats update
     path('<int:customer_id>/update-stats/', views.customer_update_stats, name='update_stats'),
+    path('<int:customer_id>/spending/', views.customer_spending, name='spending'),
+
+    # Duplicates
+    path('<int:customer_id>/duplicates/', views.customer_duplicates, name='duplicates'),
+    path('<int:customer_id>/merge/', views.customer_merge, name='merge'),
 
-    # Export
+    # Import / Export
+    path('import/', views.customers_import, name='import'),
     path('export/', views.customers_export, name='export'),
+
+    # Background jobs
+    path('jobs/', views.job_list, name='jobs'),
+    path('jobs/export/', views.job_create, {'kind': 'export'}, name='job_export'),
+    path('jobs/import/', views.job_create, {'kind': 'import'}, name='job_import'),
+    path('jobs/rebuild-stats/', views.job_create, {'kind': 'rebuild_stats'}, name='job_rebuild_stats'),
+    path('jobs/rebuild-segments/', views.job_create, {'kind': 'rebuild_metrics'}, name='job_rebuild_metrics'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
+
+    # Instrumentation (CUSTOMERS_INSTRUMENTATION)
+    path('instrumentation/', views.instrumentation_stats, name='instrumentation'),
 ]
+
+# Per-request query/latency measurements, recorded only when enabled
+instrument_urlpatterns(urlpatterns)
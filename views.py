@@ -1,11 +1,47 @@
+import hashlib
+import os
+
+from django.core.cache import cache
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse, HttpResponse
-from django.views.decorators.http import require_http_methods
-from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_http_methods, condition
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import gettext as _
 
 from apps.core.htmx import htmx_view
-from .models import Customer
+from .bulk import apply_bulk_action
+from .cache import versioned_key, last_modified
+from .dedup import find_duplicates_of, merge_customers
+from .exporters import export_rows, export_queryset
+from .importers import read_rows, import_customers
+from .instrumentation import (
+    serializing, is_enabled as instrumentation_enabled, summary as instrumentation_summary,
+)
+from .jobs import enqueue, job_storage
+from .models import ConcurrentEditError, Customer, CustomerJob, CustomerMetrics
+from .pagination import paginate, InvalidCursor, DEFAULT_ORDER
+from .search import get_search_backend
+from .serializers import list_values, serialize_rows, dumps
+from .stats import get_dashboard_stats, get_monthly_spend
+from .sync import changes_since, InvalidSyncToken, DEFAULT_LIMIT as SYNC_LIMIT
+from .typeahead import typeahead, DEFAULT_LIMIT as TYPEAHEAD_LIMIT
+
+# Maximum customers returned per page by customer_list_ajax
+LIST_PAGE_SIZE = 100
+
+# Seconds a customer_list_ajax response is cached (writes invalidate it sooner)
+LIST_CACHE_TIMEOUT = 300
+
+# Seconds a cached list/detail template fragment is kept (changes invalidate it sooner)
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# Months returned by customer_spending by default and at most
+SPENDING_MONTHS = 12
+SPENDING_MAX_MONTHS = 36
 
 
 @require_http_methods(["GET"])
@@ -15,63 +51,159 @@ def customer_list(request):
     Vista principal de listado de clientes.
     Soporta HTMX para navegación SPA.
     """
-    # Stats for dashboard cards
-    total_customers = Customer.objects.filter(is_active=True).count()
-    inactive_customers = Customer.objects.filter(is_active=False).count()
-
+    # Stats for dashboard cards (one cached query)
     return {
-        'total_customers': total_customers,
-        'inactive_customers': inactive_customers,
+        **get_dashboard_stats(),
+        'segment_choices': CustomerMetrics.SEGMENT_CHOICES,
+        'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT,
         'page_title': _('Clientes'),
     }
 
 
-@require_http_methods(["GET"])
-def customer_list_ajax(request):
+def _list_params(request):
     """
-    API: Lista de clientes para AJAX.
+    Normalized (search, status, segment, churn_risk, cursor, limit) of a
+    customer_list_ajax request.
     """
     search = request.GET.get('search', '').strip()
     status_filter = request.GET.get('status', 'active')  # active, inactive, all
+    segment = request.GET.get('segment', '')
+    if segment not in dict(CustomerMetrics.SEGMENT_CHOICES):
+        segment = ''
+    churn_risk = request.GET.get('churn_risk') == '1'
+    cursor = request.GET.get('cursor', '').strip()
+    try:
+        limit = min(max(int(request.GET.get('limit', LIST_PAGE_SIZE)), 1), LIST_PAGE_SIZE)
+    except ValueError:
+        limit = LIST_PAGE_SIZE
+    return search, status_filter, segment, churn_risk, cursor, limit
 
-    customers = Customer.objects.all()
 
-    # Filter by status
+def _filter_status(customers, status_filter):
+    """
+    Filtrar por estado: active, inactive o all.
+    """
     if status_filter == 'active':
-        customers = customers.filter(is_active=True)
-    elif status_filter == 'inactive':
-        customers = customers.filter(is_active=False)
+        return customers.filter(is_active=True)
+    if status_filter == 'inactive':
+        return customers.filter(is_active=False)
+    return customers
+
+
+def _filter_metrics(customers, segment, churn_risk):
+    """
+    Filtrar por segmento RFM y riesgo de abandono (columnas indexadas de
+    CustomerMetrics). Segmentos desconocidos se ignoran.
+    """
+    if segment in dict(CustomerMetrics.SEGMENT_CHOICES):
+        customers = customers.filter(metrics__segment=segment)
+    if churn_risk:
+        customers = customers.filter(metrics__churn_risk=True)
+    return customers
+
+
+def _list_digest(request):
+    params = '|'.join(map(str, _list_params(request)))
+    return hashlib.md5(params.encode()).hexdigest()
+
+
+def _list_cache_key(request):
+    return versioned_key('list', _list_digest(request))
+
+
+def _etag_for(cache_key):
+    return hashlib.md5(cache_key.encode()).hexdigest()
+
+
+def _list_etag(request):
+    return _etag_for(_list_cache_key(request))
+
+
+def _list_last_modified(request):
+    return last_modified()
+
+
+@require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_list_etag, last_modified_func=_list_last_modified)
+def customer_list_ajax(request):
+    """
+    API: Lista de clientes para AJAX.
+    Paginada por cursor: pasar el `next_cursor` devuelto para la siguiente página.
+    Con búsqueda, los resultados se ordenan por relevancia.
+    Las respuestas se cachean hasta el siguiente cambio de clientes y
+    soportan peticiones condicionales (ETag / Last-Modified -> 304).
+    """
+    cache_key = _list_cache_key(request)
+    content = cache.get(cache_key)
+    if content is not None:
+        return HttpResponse(content, content_type='application/json')
+
+    search, status_filter, segment, churn_risk, cursor, limit = _list_params(request)
+
+    customers = _filter_status(Customer.objects.all(), status_filter)
+    customers = _filter_metrics(customers, segment, churn_risk)
 
     # Search
+    order = DEFAULT_ORDER
     if search:
-        customers = customers.filter(
-            Q(name__icontains=search) |
-            Q(phone__icontains=search) |
-            Q(email__icontains=search) |
-            Q(tax_id__icontains=search)
-        )
+        customers, order = get_search_backend().search(customers, search)
 
-    # Order
-    customers = customers.order_by('-created_at')
-
-    # Prepare data
-    customers_data = []
-    for customer in customers[:100]:  # Limit to 100
-        customers_data.append({
-            'id': customer.id,
-            'name': customer.name,
-            'phone': customer.phone,
-            'email': customer.email,
-            'tax_id': customer.tax_id,
-            'total_spent': float(customer.total_spent),
-            'visit_count': customer.visit_count,
-            'average_purchase': float(customer.average_purchase),
-            'last_purchase': customer.last_purchase_at.strftime('%Y-%m-%d %H:%M') if customer.last_purchase_at else None,
-            'is_active': customer.is_active,
-            'created_at': customer.created_at.strftime('%Y-%m-%d'),
-        })
+    # Order and paginate
+    customers = list_values(customers, extra=[key.lstrip('-') for key in order])
+    try:
+        page, next_cursor = paginate(customers, cursor, limit, order)
+    except InvalidCursor:
+        return JsonResponse({'success': False, 'error': _('Cursor no válido')}, status=400)
 
-    return JsonResponse({'success': True, 'customers': customers_data})
+    with serializing():
+        content = dumps({'success': True, 'customers': serialize_rows(page), 'next_cursor': next_cursor})
+    cache.set(cache_key, content, LIST_CACHE_TIMEOUT)
+    return HttpResponse(content, content_type='application/json')
+
+
+@require_http_methods(["GET"])
+def customer_typeahead(request):
+    """
+    API: Autocompletado de clientes para el TPV.
+    Devuelve hasta `limit` clientes activos cuyo nombre, teléfono o email
+    empieza por `q`, como tuplas [id, nombre, teléfono], desde un índice
+    en memoria (sin consultas SQL por pulsación).
+    """
+    try:
+        limit = int(request.GET.get('limit', TYPEAHEAD_LIMIT))
+    except ValueError:
+        limit = TYPEAHEAD_LIMIT
+
+    results = typeahead(request.GET.get('q', ''), limit)
+    with serializing():
+        content = dumps({'results': results})
+    return HttpResponse(content, content_type='application/json')
+
+
+@require_http_methods(["GET"])
+@cache_control(private=True, no_cache=True)
+@gzip_page
+def customer_sync(request):
+    """
+    API: Sincronización incremental para terminales sin conexión.
+    Devuelve los clientes modificados desde `token` (todos si no se pasa),
+    paginados por `updated_at`; los desactivados o fusionados llegan en
+    `deleted`. Repetir con el `sync_token` devuelto mientras `has_more`.
+    """
+    try:
+        limit = int(request.GET.get('limit', SYNC_LIMIT))
+    except ValueError:
+        limit = SYNC_LIMIT
+
+    try:
+        changes = changes_since(request.GET.get('token', '').strip(), limit)
+    except InvalidSyncToken:
+        return JsonResponse({'success': False, 'error': _('Token de sincronización no válido')}, status=400)
+
+    with serializing():
+        content = dumps({'success': True, **changes})
+    return HttpResponse(content, content_type='application/json')
 
 
 @require_http_methods(["GET", "POST"])
@@ -127,14 +259,15 @@ def customer_detail(request, customer_id):
     Vista de detalle de un cliente.
     Soporta HTMX para navegación SPA.
     """
-    customer = get_object_or_404(Customer, id=customer_id)
+    customer = get_object_or_404(Customer.objects.select_related('metrics'), id=customer_id)
 
-    # Get recent purchases
-    recent_purchases = customer.get_recent_purchases(limit=10)
+    # Recent purchases, only looked up if the cached fragment is stale
+    recent_purchases = SimpleLazyObject(lambda: customer.get_recent_purchases(limit=10))
 
     return {
         'customer': customer,
         'recent_purchases': recent_purchases,
+        'fragment_cache_timeout': FRAGMENT_CACHE_TIMEOUT,
         'page_title': f'{_("Cliente")}: {customer.name}',
     }
 
@@ -145,10 +278,16 @@ def customer_edit(request, customer_id):
     """
     Vista para editar un cliente.
     Soporta HTMX para navegación SPA.
+    Los clientes fusionados con otro no se pueden editar.
     """
-    customer = get_object_or_404(Customer, id=customer_id)
+    customer = get_object_or_404(Customer, id=customer_id, merged_into__isnull=True)
 
     if request.method == 'POST':
+        try:
+            expected_version = int(request.POST['version'])
+        except (KeyError, ValueError):
+            expected_version = None
+
         try:
             # Update fields
             customer.name = request.POST.get('name', '').strip()
@@ -163,13 +302,21 @@ def customer_edit(request, customer_id):
             if not customer.name:
                 return JsonResponse({'success': False, 'error': _('El nombre es obligatorio')})
 
-            customer.save()
+            # Only changed columns, and only if nobody saved in between
+            customer.save_changes(expected_version)
 
             return JsonResponse({
                 'success': True,
-                'message': _('Cliente actualizado correctamente')
+                'message': _('Cliente actualizado correctamente'),
+                'version': customer.version,
             })
 
+        except ConcurrentEditError:
+            return JsonResponse({
+                'success': False,
+                'error': _('Otro usuario ha modificado este cliente. Recargue la página e inténtelo de nuevo.'),
+            }, status=409)
+
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
 
@@ -184,10 +331,11 @@ def customer_delete(request, customer_id):
     """
     API: Eliminar un cliente (soft delete).
     """
+    customer = get_object_or_404(Customer, id=customer_id)
+
     try:
-        customer = get_object_or_404(Customer, id=customer_id)
         customer.is_active = False
-        customer.save()
+        customer.save_changes()
 
         return JsonResponse({
             'success': True,
@@ -203,8 +351,9 @@ def customer_update_stats(request, customer_id):
     """
     API: Actualizar estadísticas del cliente.
     """
+    customer = get_object_or_404(Customer, id=customer_id)
+
     try:
-        customer = get_object_or_404(Customer, id=customer_id)
         customer.update_stats()
 
         return JsonResponse({
@@ -218,30 +367,278 @@ def customer_update_stats(request, customer_id):
         return JsonResponse({'success': False, 'error': str(e)})
 
 
+def _id_list(request, name):
+    """
+    Ids enviados como campo repetido y/o separados por comas.
+    """
+    return [
+        int(value)
+        for raw in request.POST.getlist(name)
+        for value in raw.split(',') if value.strip()
+    ]
+
+
+@require_http_methods(["POST"])
+def customers_bulk(request):
+    """
+    API: Acción masiva (`action`: deactivate, reactivate, tag, untag).
+    Se aplica a los clientes de `ids` o, con `select_all=on`, a todos los
+    que cumplen el filtro del listado (`search`, `status`, `segment`,
+    `churn_risk`).
+    """
+    action = request.POST.get('action', '')
+    try:
+        ids = _id_list(request, 'ids')
+    except ValueError:
+        return JsonResponse({'success': False, 'error': _('Identificadores no válidos')})
+
+    if ids:
+        customers = Customer.objects.filter(pk__in=ids)
+    elif request.POST.get('select_all') == 'on':
+        customers = _filter_status(Customer.objects.all(), request.POST.get('status', 'active'))
+        customers = _filter_metrics(
+            customers, request.POST.get('segment', ''), request.POST.get('churn_risk') == '1'
+        )
+        search = request.POST.get('search', '').strip()
+        if search:
+            customers = get_search_backend().filter(customers, search)
+    else:
+        return JsonResponse({'success': False, 'error': _('Seleccione al menos un cliente')})
+
+    try:
+        selected, affected = apply_bulk_action(customers, action, tag_name=request.POST.get('tag', ''))
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    return JsonResponse({
+        'success': True,
+        'message': _('%(affected)d de %(selected)d clientes actualizados') % {
+            'affected': affected,
+            'selected': selected,
+        },
+        'selected': selected,
+        'affected': affected,
+    })
+
+
+@require_http_methods(["GET"])
+def customer_spending(request, customer_id):
+    """
+    API: Gasto mensual del cliente en los últimos `months` meses (por
+    defecto 12), del más antiguo al más reciente, incluidos los meses sin
+    compras. Lee un resumen por mes, no las ventas.
+    """
+    if not Customer.objects.filter(id=customer_id).exists():
+        raise Http404
+    try:
+        months = min(max(int(request.GET.get('months', SPENDING_MONTHS)), 1), SPENDING_MAX_MONTHS)
+    except ValueError:
+        months = SPENDING_MONTHS
+
+    return JsonResponse({
+        'success': True,
+        'months': [
+            {
+                'month': month.strftime('%Y-%m'),
+                'total': float(total),
+                'visits': visits,
+                'average_ticket': float(total / visits) if visits else 0.0,
+            }
+            for month, total, visits in get_monthly_spend(customer_id, months)
+        ],
+    })
+
+
+@require_http_methods(["GET"])
+def customer_duplicates(request, customer_id):
+    """
+    API: Posibles duplicados de un cliente (mismo email, teléfono, NIF o nombre).
+    """
+    customer = get_object_or_404(Customer, id=customer_id)
+
+    return JsonResponse({
+        'success': True,
+        'duplicates': [
+            {
+                'id': other.id,
+                'name': other.name,
+                'email': other.email,
+                'phone': other.phone,
+                'tax_id': other.tax_id,
+                'total_spent': float(other.total_spent),
+                'visit_count': other.visit_count,
+                'score': score,
+                'reasons': reasons,
+            }
+            for other, score, reasons in find_duplicates_of(customer)
+        ],
+    })
+
+
+@require_http_methods(["POST"])
+def customer_merge(request, customer_id):
+    """
+    API: Fusionar clientes duplicados (`duplicate_ids`) en este cliente.
+    Las ventas y estadísticas pasan al cliente principal y los duplicados
+    se desactivan.
+    """
+    customer = get_object_or_404(Customer, id=customer_id)
+    try:
+        duplicate_ids = _id_list(request, 'duplicate_ids')
+    except ValueError:
+        return JsonResponse({'success': False, 'error': _('Identificadores no válidos')})
+    if not duplicate_ids:
+        return JsonResponse({'success': False, 'error': _('Seleccione los clientes a fusionar')})
+
+    try:
+        customer = merge_customers(customer, duplicate_ids)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    return JsonResponse({
+        'success': True,
+        'message': _('Clientes fusionados correctamente'),
+        'total_spent': float(customer.total_spent),
+        'visit_count': customer.visit_count,
+    })
+
+
 @require_http_methods(["GET"])
 def customers_export(request):
     """
     Exportar clientes a CSV.
+    La respuesta se genera en streaming para mantener la memoria constante.
     """
-    import csv
-    from django.utils import timezone
-
-    response = HttpResponse(content_type='text/csv')
+    response = StreamingHttpResponse(export_rows(export_queryset()), content_type='text/csv')
     response['Content-Disposition'] = f'attachment; filename="customers_{timezone.now().strftime("%Y%m%d")}.csv"'
 
-    writer = csv.writer(response)
-    writer.writerow(['Name', 'Email', 'Phone', 'Tax ID', 'Total Spent', 'Visit Count', 'Created At'])
-
-    customers = Customer.objects.filter(is_active=True).order_by('name')
-    for customer in customers:
-        writer.writerow([
-            customer.name,
-            customer.email,
-            customer.phone,
-            customer.tax_id,
-            customer.total_spent,
-            customer.visit_count,
-            customer.created_at.strftime('%Y-%m-%d'),
-        ])
-
     return response
+
+
+@require_http_methods(["POST"])
+def customers_import(request):
+    """
+    API: Importar clientes desde un archivo CSV o XLSX (campo `file`).
+    Los clientes existentes (mismo email, teléfono o NIF) se actualizan.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'success': False, 'error': _('Seleccione un archivo')})
+
+    try:
+        rows = read_rows(upload, upload.name)
+        result = import_customers(rows, update_existing=request.POST.get('update_existing', 'on') == 'on')
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)})
+
+    return JsonResponse({
+        'success': True,
+        'message': _('Importación completada'),
+        **result.as_dict(),
+    })
+
+
+# Recent jobs shown in the list page panel
+JOB_LIST_LIMIT = 10
+
+
+def _job_payload(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'kind_label': job.get_kind_display(),
+        'status': job.status,
+        'status_label': job.get_status_display(),
+        'progress': job.progress,
+        'message': job.message,
+        'result': job.result,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'download_url': reverse('customers:job_download', args=[job.id]) if job.result_file else None,
+    }
+
+
+@require_http_methods(["POST"])
+def job_create(request, kind):
+    """
+    API: Encolar una tarea en segundo plano (exportación, importación o
+    recálculo de estadísticas). El progreso se consulta en job_status.
+    """
+    params = {}
+    input_file = ''
+
+    if kind == CustomerJob.KIND_IMPORT:
+        upload = request.FILES.get('file')
+        if upload is None:
+            return JsonResponse({'success': False, 'error': _('Seleccione un archivo')})
+        input_file = job_storage().save(f'imports/{upload.name}', upload)
+        params = {
+            'filename': upload.name,
+            'update_existing': request.POST.get('update_existing', 'on') == 'on',
+        }
+    elif kind in (CustomerJob.KIND_REBUILD_STATS, CustomerJob.KIND_REBUILD_METRICS):
+        params = {'active_only': request.POST.get('active_only') == 'on'}
+
+    job = enqueue(kind, params=params, input_file=input_file)
+
+    return JsonResponse({
+        'success': True,
+        'message': _('Tarea en cola'),
+        'job': _job_payload(job),
+    })
+
+
+@require_http_methods(["GET"])
+def job_list(request):
+    """
+    API: Tareas recientes (`?active=1` solo pendientes o en curso).
+    """
+    jobs = CustomerJob.objects.all()
+    if request.GET.get('active'):
+        jobs = jobs.filter(status__in=[CustomerJob.STATUS_PENDING, CustomerJob.STATUS_RUNNING])
+
+    return JsonResponse({
+        'success': True,
+        'jobs': [_job_payload(job) for job in jobs[:JOB_LIST_LIMIT]],
+    })
+
+
+@require_http_methods(["GET"])
+def job_status(request, job_id):
+    """
+    API: Estado y progreso de una tarea.
+    """
+    job = get_object_or_404(CustomerJob, id=job_id)
+    return JsonResponse({'success': True, 'job': _job_payload(job)})
+
+
+@require_http_methods(["GET"])
+def job_download(request, job_id):
+    """
+    Descargar el archivo generado por una tarea completada.
+    """
+    job = get_object_or_404(CustomerJob, id=job_id, status=CustomerJob.STATUS_COMPLETED)
+    storage = job_storage()
+    if not job.result_file or not storage.exists(job.result_file):
+        raise Http404(_('Archivo no disponible'))
+
+    return FileResponse(
+        storage.open(job.result_file, 'rb'),
+        as_attachment=True,
+        filename=os.path.basename(job.result_file),
+    )
+
+
+@require_http_methods(["GET"])
+def instrumentation_stats(request):
+    """
+    API: Percentiles de duración, consultas SQL, tiempo de BD, tiempo de
+    serialización y tamaño de respuesta por endpoint, de las últimas
+    peticiones de este proceso (requiere CUSTOMERS_INSTRUMENTATION).
+    """
+    return JsonResponse({
+        'success': True,
+        'enabled': instrumentation_enabled(),
+        'endpoints': instrumentation_summary(),
+    })